@@ -2,6 +2,10 @@
 
 from math_hammer import AStat, DStat, Model, Unit, Dice
 from math_hammer import StandardModifiers
+from asset_registry import AssetRegistry
+
+assets = AssetRegistry(__file__)
+__getattr__ = assets.module_getattr
 
 SustainedHits_1 = StandardModifiers["SustainedHits_1"]
 DevestatingWounds = StandardModifiers["DevestatingWounds"]
@@ -11,43 +15,43 @@ LethalHits = StandardModifiers["LethalHits"]
 # ==================================================================================== #
 #       Elf assests
 # ==================================================================================== #
-dire_avenger_model = Model(
+assets.add('dire_avenger_model', lambda: Model(
     weapons=AStat(Range=18,A=3, BS_WS=3, S=4, AP=-1, D=1, description="Dire Avenger") * LethalHits,
     defence=DStat(T=3, Sv=4, W=3, Inv=4),
     pts=190/5, name="Dire Avenger"
-)
+))
 
-dire_avenger_squad = Unit([
-    dire_avenger_model,
-    dire_avenger_model,
-    dire_avenger_model,
-    dire_avenger_model,
-    dire_avenger_model,
-    dire_avenger_model,
-    dire_avenger_model,
-    dire_avenger_model,
-    dire_avenger_model,
-    dire_avenger_model,
-    ])
+assets.add('dire_avenger_squad', lambda: Unit([
+    assets['dire_avenger_model'],
+    assets['dire_avenger_model'],
+    assets['dire_avenger_model'],
+    assets['dire_avenger_model'],
+    assets['dire_avenger_model'],
+    assets['dire_avenger_model'],
+    assets['dire_avenger_model'],
+    assets['dire_avenger_model'],
+    assets['dire_avenger_model'],
+    assets['dire_avenger_model'],
+    ]))
 
-wraithguard_model_cannon = Model(
+assets.add('wraithguard_model_cannon', lambda: Model(
     weapons=AStat(Range=12,A=1, BS_WS=4, S=14, AP=-4, D=Dice(), description="Wraithcannon") * DevestatingWounds,
     defence=DStat(T=7, Sv=2, W=3),
     pts=190/5, name="Wraithguard with Cannon"
-)
-wraithguard_model_dscythe = Model(
+))
+assets.add('wraithguard_model_dscythe', lambda: Model(
     weapons=AStat(Range=12,A=Dice(), BS_WS=4, S=10, AP=-4, D=1, description="D-scythe") * DevestatingWounds,
     defence=DStat(T=7, Sv=2, W=3),
     pts=190/5, name="Wraithguard with Scythe"
-)
-wraithguard_cannon = Unit([wraithguard_model_cannon for _ in range(0,10)])
-wraithguard_scythe = Unit([wraithguard_model_dscythe for _ in range(0,10)])
+))
+assets.add('wraithguard_cannon', lambda: Unit([assets['wraithguard_model_cannon'] for _ in range(0,10)]))
+assets.add('wraithguard_scythe', lambda: Unit([assets['wraithguard_model_dscythe'] for _ in range(0,10)]))
 
-waveserpent = Model(
+assets.add('waveserpent', lambda: Model(
     weapons=[
         AStat(Range=12,A=1, BS_WS=3, S=12, AP=-3, D=Dice(bias=2), description="Twin Bright Lance") * TwinLinked,
         AStat(Range=12,A=3, BS_WS=3, S=6, AP=-1, D=2, description="Shuriken Cannon") * SustainedHits_1,
     ],
     defence=DStat(T=9, Sv=3, W=13, Inv=5),
     pts=120, name="Wave Serpent"
-)
\ No newline at end of file
+))
\ No newline at end of file
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+import time
+import numpy as np
+
+from math_hammer import AttackSequenceState, enumerate_matchups, dice_rng
+from batch_engine import UnsupportedModifier, batch_damage_state, fnp_damage_tally
+
+'''
+Casualty allocation, across a whole unit.
+
+The other engines cap each damage die at the wounds of one model, so damage never spills from model to model,
+and the models-removed numbers are folded out of the damage afterwards.  Here every damage die (after feel no pain)
+of a trial is kept, in the order it was rolled, and allocated to the defending unit a model at a time: a model
+takes damage until it is removed, whatever is left on that die is wasted, and the next die goes to the next model.
+Wounds carry across every weapon of every attacker in the trial, until the whole unit is removed.
+
+Models are allocated damage in the order they are listed in the unit.  Everything else (toughness, save, feel no
+pain) still comes from the unit's best defender, see Unit._get_best_defender.
+
+Trials are independent, so we allocate the k-th die of every trial at once, for k = 0, 1, ...  The loop is as long
+as the most dice any one trial rolled, not the number of trials.
+'''
+
+def unit_wounds(defender):
+    ''' the wounds characteristic of each model damage is allocated to, in order '''
+    if hasattr(defender, 'models'): # Unit
+        return np.asarray([model.defence.wounds for model in defender.models], dtype=np.int64)
+    if hasattr(defender, 'defence'): # Model
+        return np.asarray([defender.defence.wounds], dtype=np.int64)
+    return np.asarray([defender.wounds], dtype=np.int64) # DStat
+
+def loop_damage_dice(defender: 'DStat', attacker: 'AStat', count, rng=None, profile=None):
+    ''' the per-trial equivalent of batch_damage_state + fnp_damage_tally, for pairings the batch engine can't handle '''
+    trial = []
+    damage = []
+    state = AttackSequenceState()
+    rng = dice_rng(rng)
+    for ii in range(0, count):
+        defender.attack(attacker, state, rng, profile)
+        # resolve_fnp_pool splits each die into used and wasted, put it back together
+        tally = [used + wasted for used, wasted in zip(state.scratch['actual_damage_used'], state.scratch['damage_wasted'])]
+        trial += [ii] * len(tally)
+        damage += tally
+    return np.asarray(trial, dtype=np.int64), np.asarray(damage, dtype=np.int64)
+
+def damage_dice(defender: 'DStat', attacker: 'AStat', count, rng, profile=None):
+    '''
+        Every damage die of 'count' trials of defender - attacker, after feel no pain.
+        Returns (trial, damage) arrays, in the order the dice were rolled.  'profile' is a StageProfile to count into.
+    '''
+    try:
+        trial, damage = fnp_damage_tally(batch_damage_state(defender, attacker, count, rng, profile), rng, profile)
+    except UnsupportedModifier as e:
+        trial, damage = loop_damage_dice(defender, attacker, count, rng, profile)
+    return trial, np.maximum(damage, 0).astype(np.int64)
+
+def allocate_damage(trial, damage, wounds, count):
+    '''
+        Allocate the damage dice of 'count' trials to a unit with 'wounds' per model (see unit_wounds).
+        Returns the per-trial damage used, damage wasted and models removed.
+    '''
+    # the position of each die within its trial, keeping the order they were rolled in
+    order = np.argsort(trial, kind='stable')
+    trial = trial[order]
+    damage = damage[order]
+    rank = np.arange(len(trial)) - np.searchsorted(trial, trial, side='left')
+    # then group by position, so each pass below sees each trial at most once
+    order = np.argsort(rank, kind='stable')
+    trial = trial[order]
+    damage = damage[order]
+    bounds = np.searchsorted(rank[order], np.arange(0, (np.max(rank) + 2) if len(rank) > 0 else 1))
+
+    # the model taking damage, and its wounds remaining.  Past the last model every wound is 0, so it's all wasted.
+    wounds = np.concatenate([wounds, [0]])
+    model = np.zeros((count,), dtype=np.int64)
+    remaining = np.full((count,), wounds[0], dtype=np.int64)
+    used = np.zeros((count,), dtype=np.int64)
+    wasted = np.zeros((count,), dtype=np.int64)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        t = trial[start:end]
+        d = damage[start:end]
+        applied = np.minimum(d, remaining[t])
+        used[t] += applied
+        wasted[t] += d - applied
+        remaining[t] -= applied
+        removed = t[(remaining[t] == 0) & (model[t] < len(wounds) - 1)]
+        model[removed] += 1
+        remaining[removed] = wounds[model[removed]]
+    return used, wasted, model
+
+def allocation_loop(attacker, defender, count, rng=None, profile=None):
+    '''
+        batch_loop, with damage allocated across the defending unit.  Returns a (count,3) array of damage used,
+        damage wasted and models removed.  'profile' is a StageProfile to count into, allocation is a stage of its own.
+    '''
+    rng = np.random.default_rng(rng)
+    trials = []
+    damages = []
+    attackers = attacker if type(attacker) is list else [attacker]
+    for att in attackers:
+        for dstat, astat in enumerate_matchups(att, defender):
+            trial, damage = damage_dice(dstat, astat, count, rng, profile)
+            trials.append(trial)
+            damages.append(damage)
+    trial = np.concatenate([np.zeros((0,), dtype=np.int64)] + trials)
+    damage = np.concatenate([np.zeros((0,), dtype=np.int64)] + damages)
+    start = time.perf_counter()
+    used, wasted, removed = allocate_damage(trial, damage, unit_wounds(defender), count)
+    if profile is not None:
+        stage = profile.stage('allocate')
+        stage['seconds'] += time.perf_counter() - start
+        stage['dice'] += len(damage)
+        stage['max_pool'] = max(stage['max_pool'], len(damage))
+    return np.stack([used, wasted, removed], axis=1).astype(float)
+
+# =================================================================================== #
+#       TESTS ONLY
+# =================================================================================== #
+def reference_allocate_damage(trial, damage, wounds, count):
+    ''' allocate_damage, one die at a time '''
+    result = np.zeros((count, 3), dtype=np.int64)
+    for ii in range(0, count):
+        remaining = list(wounds)
+        for d in damage[trial == ii]:
+            applied = min(d, remaining[0]) if len(remaining) > 0 else 0
+            result[ii] += [applied, d - applied, 0]
+            if len(remaining) > 0:
+                remaining[0] -= applied
+                if remaining[0] == 0:
+                    remaining.pop(0)
+                    result[ii, 2] += 1
+    return result
+
+def run_test():
+    import math_hammer as mh
+    rng = np.random.default_rng(1234)
+
+    # a W3 model takes a 2, then a 2: one wound spills, the rest of the die is wasted
+    used, wasted, removed = allocate_damage(np.asarray([0, 0]), np.asarray([2, 2]), np.asarray([3, 3]), 1)
+    print(f"spill within a die is wasted: {(used[0], wasted[0], removed[0]) == (3, 1, 1)}")
+
+    count = 2000
+    for wounds in [[1] * 10, [2, 2, 2], [3, 1, 1, 6], [12]]:
+        trial = rng.integers(0, count, size=8000)
+        damage = rng.integers(0, 7, size=8000)
+        fast = np.stack(allocate_damage(trial, damage, np.asarray(wounds), count), axis=1)
+        print(f"same as the reference: {np.array_equal(fast, reference_allocate_damage(trial, damage, wounds, count))}  (wounds {wounds})")
+
+    # D1 against W1 models: every unsaved wound removes a model, until the unit runs out
+    gun = mh.AStat(A=20, BS_WS=3, S=4, AP=0, D=1, Range=24)
+    guardsman = mh.Model(weapons=gun, defence=mh.DStat(T=3, Sv=5, W=1), pts=6, position=2)
+    squad = mh.Unit([guardsman] * 10)
+    samples = mh.sample_loop(attacker=mh.Model(gun, mh.DStat(T=4, Sv=3, W=2), position=0), defender=squad, count=10000, engine='allocate', rng=1234)
+    print(f"W1 models: models removed is damage used {np.array_equal(samples[:,0], samples[:,2])}, at most 10 {np.max(samples[:,2]) <= 10}")
+    # damage used, before the cap, agrees with the batch engine
+    single = mh.sample_loop(attacker=mh.Model(gun, mh.DStat(T=4, Sv=3, W=2), position=0), defender=mh.Unit([guardsman] * 40), count=10000, engine='allocate', rng=1234)
+    batch = mh.mean_loop(attacker=mh.Model(gun, mh.DStat(T=4, Sv=3, W=2), position=0), defender=guardsman, count=10000, engine='batch', rng=1234)
+    print(f"actual, expected: {np.mean(single[:,0]):0.4f}, {batch[0] + batch[1]:0.4f}  (unit of 40, damage used)")
+
+if __name__ == "__main__":
+    import allocation_engine
+    allocation_engine.run_test()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from math_hammer import perform_full_analysis, update_position, StandardModifiers, ENGINES
+import asset_registry
+
+'''
+A local HTTP service for running analyses, so the faction assets and the result cache stay warm between queries,
+rather than paying for python, numpy and the factions on every run.  Standard library only.
+
+A job is a matchup for perform_full_analysis, posted as JSON.  Only 'attacker' and 'defender' are required, they're
+asset names as find_asset takes them (see asset_registry.py), the rest default as in JOB_DEFAULTS:
+
+    POST   /jobs        {"attacker": "sword_brethern", "defender": "guardsmen", "engine": "batch", "seed": 7}
+    GET    /jobs        every job's status
+    GET    /jobs/<id>   status, progress, and the AnalysisResult summary once it's done
+    DELETE /jobs/<id>   cancel it, a running job stops after its current chunk of trials
+    GET    /assets      the asset names, modifiers and engines a job can use
+
+Jobs run on a bounded pool of worker threads, and are refused (503) once 'max_pending' are queued or running.
+Finished jobs are kept for 'job_ttl' seconds, and only the latest 'max_finished' of them, after that they're 404s.
+Each job can also spread its trials over processes with 'workers', as app-math-hammer.py's --jobs does.
+Run service-math-hammer.py to serve it.
+'''
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 64
+# finished (done, failed or cancelled) jobs are forgotten after this many seconds, or once there are more than this many
+DEFAULT_JOB_TTL = 3600
+DEFAULT_MAX_FINISHED = 256
+FINISHED = ['done', 'failed', 'cancelled']
+# the attacker stands at 0, the defender 'distance' inches away
+JOB_DEFAULTS = {
+    'count': 1000,
+    'pvalue': 5/6.0,
+    'engine': 'loop',
+    'seed': None,
+    'width': None,
+    'budget': None,
+    'distance': 2,
+    'attacker_modifiers': [],
+    'defender_modifiers': [],
+    'workers': 1,
+}
+
+class JobCancelled(Exception):
+    pass
+
+class ServiceBusy(Exception):
+    pass
+
+def parse_job(spec):
+    ''' 'spec' with the defaults filled in, raises ValueError if it's not a job we can run '''
+    if not isinstance(spec, dict):
+        raise ValueError("a job is a JSON object")
+    unknown = set(spec) - set(JOB_DEFAULTS) - {'attacker', 'defender', 'desc'}
+    if unknown:
+        raise ValueError(f"unknown job fields {sorted(unknown)}")
+    for side in ['attacker', 'defender']:
+        if not isinstance(spec.get(side), str):
+            raise ValueError(f"a job needs an '{side}' asset name")
+    job = dict(JOB_DEFAULTS, **spec)
+    job.setdefault('desc', f"{job['attacker']} vs {job['defender']}")
+    if job['engine'] not in ENGINES:
+        raise ValueError(f"unknown engine '{job['engine']}', expected one of {ENGINES}")
+    if not isinstance(job['count'], int) or job['count'] < 1:
+        raise ValueError("'count' is a positive number of trials")
+    if not isinstance(job['workers'], int) or job['workers'] < 1:
+        raise ValueError("'workers' is a positive number of processes")
+    if not isinstance(job['pvalue'], (int, float)) or not 0 < job['pvalue'] < 1:
+        raise ValueError("'pvalue' is on range (0,1)")
+    for field in ['distance', 'width', 'budget']:
+        if job[field] is not None and (not isinstance(job[field], (int, float)) or job[field] < 0):
+            raise ValueError(f"'{field}' is a non-negative number")
+    if job['distance'] is None:
+        raise ValueError("'distance' is a non-negative number")
+    if job['seed'] is not None and not isinstance(job['seed'], int):
+        raise ValueError("'seed' is an integer")
+    for side in ['attacker_modifiers', 'defender_modifiers']:
+        if not isinstance(job[side], list):
+            raise ValueError(f"'{side}' is a list of modifier names")
+        for name in job[side]:
+            if name not in StandardModifiers:
+                raise ValueError(f"unknown modifier '{name}', expected one of {list(StandardModifiers)}")
+    return job
+
+def build_matchup(job):
+    ''' (attacker, defender) for a parsed job: the assets, with their modifiers, standing 'distance' apart '''
+    attacker = asset_registry.find_asset(job['attacker'])
+    for name in job['attacker_modifiers']:
+        attacker = attacker * StandardModifiers[name]
+    defender = asset_registry.find_asset(job['defender'])
+    for name in job['defender_modifiers']:
+        defender = defender * StandardModifiers[name]
+    return update_position(attacker, 0), update_position(defender, job['distance'])
+
+class Job():
+    def __init__(self, spec):
+        self.id = uuid.uuid4().hex[:12]
+        self.spec = spec
+        self.status = 'queued'
+        self.trials = 0
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def progress(self, accumulator):
+        ''' perform_full_analysis' progress hook, it's also where a cancelled job stops '''
+        self.trials = accumulator.trials
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def describe(self, with_result=True):
+        ''' the job, json-able.  'progress' is None for adaptive jobs, there's no telling how many trials they'll need. '''
+        adaptive = self.spec['width'] is not None or self.spec['budget'] is not None
+        done = self.status == 'done'
+        result = {
+            'id': self.id,
+            'status': self.status,
+            'spec': self.spec,
+            'trials': self.trials,
+            'progress': 1.0 if done else (None if adaptive else min(self.trials / self.spec['count'], 1.0)),
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'elapsed': None if self.started is None else (self.finished or time.time()) - self.started,
+            'error': self.error,
+        }
+        if with_result:
+            result['result'] = self.result
+        return result
+
+class AnalysisService():
+    def __init__(self, workers=DEFAULT_WORKERS, cache=None, max_pending=DEFAULT_MAX_PENDING, job_ttl=DEFAULT_JOB_TTL, max_finished=DEFAULT_MAX_FINISHED):
+        '''
+            'workers' is the number of jobs run at once, 'cache' is a ResultCache (see result_cache.py) shared by them.
+            Finished jobs are dropped 'job_ttl' seconds after they finish, or sooner if there are over 'max_finished'.
+        '''
+        self.cache = cache
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.max_finished = max_finished
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis')
+        self.jobs = {}
+        self.lock = threading.Lock()
+        # the asset registries build on first use, and aren't meant to be built from two threads at once
+        self.assets_lock = threading.Lock()
+
+    def preload(self):
+        ''' build every asset now, rather than on the first job that asks for it '''
+        import importlib
+        with self.assets_lock:
+            for faction in asset_registry.FACTIONS:
+                registry = importlib.import_module(faction).assets
+                for name in registry.keys():
+                    registry[name]
+
+    def assets(self):
+        import importlib
+        factions = {faction: sorted(importlib.import_module(faction).assets.keys()) for faction in asset_registry.FACTIONS}
+        return {'factions': factions, 'modifiers': list(StandardModifiers), 'engines': ENGINES}
+
+    def pending(self):
+        return sum(1 for job in self.jobs.values() if job.status in ['queued', 'running'])
+
+    def expired(self, job, now=None):
+        return job.status in FINISHED and job.finished is not None and (now or time.time()) - job.finished > self.job_ttl
+
+    def prune(self):
+        ''' forget the expired finished jobs, and the oldest finished jobs over max_finished '''
+        with self.lock:
+            now = time.time()
+            finished = sorted((job for job in self.jobs.values() if job.status in FINISHED and job.finished is not None), key=lambda job: job.finished)
+            excess = len(finished) - self.max_finished
+            for ii, job in enumerate(finished):
+                if ii < excess or self.expired(job, now):
+                    del self.jobs[job.id]
+
+    def submit(self, spec):
+        ''' queue the job 'spec', raises ValueError if it's not a job we can run, ServiceBusy if we're full up '''
+        spec = parse_job(spec)
+        try:
+            with self.assets_lock:
+                build_matchup(spec)
+        except KeyError as e:
+            raise ValueError(e.args[0])
+        self.prune()
+        job = Job(spec)
+        with self.lock:
+            if self.pending() >= self.max_pending:
+                raise ServiceBusy(f"{self.max_pending} jobs are already queued or running")
+            self.jobs[job.id] = job
+            job.future = self.pool.submit(self.run, job)
+        return job
+
+    def job(self, job_id):
+        ''' the job, None if there's no such job or it's expired '''
+        job = self.jobs.get(job_id)
+        return None if job is None or self.expired(job) else job
+
+    def listing(self):
+        ''' every job we still have, oldest first '''
+        self.prune()
+        return sorted(self.jobs.values(), key=lambda job: job.submitted)
+
+    def cancel(self, job_id):
+        ''' the cancelled job, None if there's no such job.  Finished jobs are left as they are. '''
+        job = self.job(job_id)
+        if job is None:
+            return None
+        with self.lock:
+            job.cancelled.set()
+            if job.status == 'queued' and job.future.cancel():
+                job.status = 'cancelled'
+                job.finished = time.time()
+        return job
+
+    def run(self, job):
+        with self.lock:
+            if job.cancelled.is_set():
+                job.status = 'cancelled'
+                job.finished = time.time()
+                return
+            job.status = 'running'
+            job.started = time.time()
+        spec = job.spec
+        try:
+            with self.assets_lock:
+                attacker, defender = build_matchup(spec)
+            result = perform_full_analysis(attacker=attacker, defender=defender, count=spec['count'], pvalue=spec['pvalue'], description=spec['desc'], engine=spec['engine'], rng=spec['seed'], workers=spec['workers'], width=spec['width'], budget=spec['budget'], cache=self.cache, progress=job.progress)
+            job.result = result.summary()
+            job.trials = result.trials if result.trials is not None else job.trials
+            job.status = 'done'
+        except JobCancelled as e:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = 'failed'
+        job.finished = time.time()
+
+    def shutdown(self):
+        ''' cancel everything, and wait for the running jobs to stop '''
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+        self.pool.shutdown(wait=True)
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    ''' the HTTP side of an AnalysisService, the server's 'service' '''
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self):
+        ''' the path split into its parts, ['jobs', '<id>'] for /jobs/<id> '''
+        return [part for part in self.path.split('?')[0].split('/') if part]
+
+    def do_GET(self):
+        service = self.server.service
+        route = self.route()
+        if route == ['assets']:
+            return self.reply(200, service.assets())
+        if route == ['jobs']:
+            return self.reply(200, [job.describe(with_result=False) for job in service.listing()])
+        if len(route) == 2 and route[0] == 'jobs' and service.job(route[1]) is not None:
+            return self.reply(200, service.job(route[1]).describe())
+        self.reply(404, {'error': f"nothing at {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        if self.route() != ['jobs']:
+            return self.reply(404, {'error': f"nothing at {self.path}"})
+        try:
+            spec = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+            job = service.submit(spec)
+        except ValueError as e:
+            return self.reply(400, {'error': str(e)})
+        except ServiceBusy as e:
+            return self.reply(503, {'error': str(e)})
+        self.reply(202, job.describe())
+
+    def do_DELETE(self):
+        service = self.server.service
+        route = self.route()
+        job = service.cancel(route[1]) if len(route) == 2 and route[0] == 'jobs' else None
+        if job is None:
+            return self.reply(404, {'error': f"nothing at {self.path}"})
+        self.reply(200, job.describe())
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, verbose=False):
+    ''' an HTTP server for 'service', call its serve_forever.  Port 0 picks a free port, see server_address. '''
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+# ==============================================================================================================
+# ==============================================================================================================
+def run_tests():
+    import tempfile
+    import urllib.request
+    import urllib.error
+    import numpy as np
+    from result_cache import ResultCache
+
+    def call(method, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode()
+        request = urllib.request.Request(base + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def wait(job_id, timeout=60):
+        start = time.time()
+        while time.time() - start < timeout:
+            _, job = call('GET', f"/jobs/{job_id}")
+            if job['status'] in ['done', 'failed', 'cancelled']:
+                return job
+            time.sleep(0.02)
+        return job
+
+    with tempfile.TemporaryDirectory() as directory:
+        service = AnalysisService(workers=1, cache=ResultCache(directory=directory), max_pending=3)
+        server = make_server(service, port=0)
+        base = f"http://{server.server_address[0]}:{server.server_address[1]}"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            status, assets = call('GET', '/assets')
+            print(f"lists the assets: {status == 200 and 'guardsmen' in assets['factions']['imperial_guard']}")
+
+            spec = {'attacker': 'sword_brethern', 'defender': 'guardsmen', 'engine': 'batch', 'count': 5000, 'seed': 7, 'attacker_modifiers': ['LethalHits']}
+            status, job = call('POST', '/jobs', spec)
+            print(f"job accepted: {status == 202 and job['status'] in ['queued', 'running']}")
+            job = wait(job['id'])
+            job_spec = parse_job(spec)
+            attacker, defender = build_matchup(job_spec)
+            direct = perform_full_analysis(attacker=attacker, defender=defender, count=5000, pvalue=job_spec['pvalue'], description=job_spec['desc'], engine='batch', rng=7).summary()
+            print(f"job done, same summary as perform_full_analysis: {job['status'] == 'done' and job['progress'] == 1.0 and job['result'] == direct}")
+            status, again = call('POST', '/jobs', spec)
+            again = wait(again['id'])
+            print(f"repeat job read from the warm cache: {again['result'] == job['result'] and again['elapsed'] < job['elapsed']}")
+
+            status, error = call('POST', '/jobs', {'attacker': 'no_such_unit', 'defender': 'guardsmen'})
+            print(f"unknown asset is a 400: {status == 400 and 'no_such_unit' in error['error']}")
+            status, error = call('POST', '/jobs', {'attacker': 'sword_brethern', 'defender': 'guardsmen', 'engine': 'warp'})
+            print(f"unknown engine is a 400: {status == 400}")
+            print(f"unknown job is a 404: {call('GET', '/jobs/nope')[0] == 404 and call('DELETE', '/jobs/nope')[0] == 404}")
+
+            # one worker: the first long job runs, the others wait behind it
+            long_job = {'attacker': 'sword_brethern', 'defender': 'guardsmen', 'engine': 'loop', 'count': 10000000}
+            _, running = call('POST', '/jobs', long_job)
+            _, queued = call('POST', '/jobs', long_job)
+            _, third = call('POST', '/jobs', long_job)
+            status, _ = call('POST', '/jobs', long_job)
+            print(f"refused once max_pending are waiting: {status == 503}")
+            while call('GET', f"/jobs/{running['id']}")[1]['trials'] == 0:
+                time.sleep(0.02)
+            _, progress = call('GET', f"/jobs/{running['id']}")
+            print(f"running job reports progress: {progress['status'] == 'running' and 0 < progress['progress'] < 1}")
+            _, cancelled = call('DELETE', f"/jobs/{queued['id']}")
+            print(f"queued job cancelled straight away: {cancelled['status'] == 'cancelled' and cancelled['started'] is None}")
+            call('DELETE', f"/jobs/{running['id']}")
+            stopped = wait(running['id'])
+            print(f"running job stops at its next chunk: {stopped['status'] == 'cancelled' and stopped['trials'] < long_job['count']}")
+            call('DELETE', f"/jobs/{third['id']}")
+            third = wait(third['id'])
+            _, jobs = call('GET', '/jobs')
+            print(f"every job listed, none still going: {len(jobs) == 5 and all(j['status'] in ['done', 'cancelled'] for j in jobs)}")
+
+            # finished jobs don't pile up
+            service.max_finished = 2
+            _, newest = call('POST', '/jobs', spec)
+            wait(newest['id'])
+            _, jobs = call('GET', '/jobs')
+            oldest = f"/jobs/{job['id']}"
+            print(f"oldest finished jobs dropped past max_finished: {len(jobs) == 2 and call('GET', oldest)[0] == 404}")
+            service.job_ttl = 0
+            time.sleep(0.01)
+            newest = f"/jobs/{newest['id']}"
+            print(f"expired job is a 404: {call('GET', newest)[0] == 404 and call('DELETE', newest)[0] == 404}")
+            call('POST', '/jobs', spec)
+            print(f"expired jobs pruned on submit: {len(service.jobs) == 1}")
+        finally:
+            server.shutdown()
+            service.shutdown()
+
+if __name__ == "__main__":
+    run_tests()
+else:
+    pass
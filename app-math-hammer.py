@@ -1,17 +1,19 @@
 #!/usr/bin/env python
 
-import dill as pickle
-import matplotlib.pyplot as plt
+import sys
 import argparse
-import copy
 
-from math_hammer import perform_full_analysis, update_position
+from math_hammer import perform_full_analysis, range_sweep, analysis_matrix, update_position, format_stage_report, ENGINES
+from result_cache import ResultCache
+import asset_registry
 
 import black_templars
 import aeldari
 import imperial_guard
 
 DEFAULT_COUNT = 1000
+# the same dice every run unless asked otherwise, so a re-run is read back from the result cache
+DEFAULT_SEED = 1
 
 if __name__ == "__main__":
     # ==================================================================================== #
@@ -20,48 +22,48 @@ if __name__ == "__main__":
     # ==================================================================================== #
     # ==================================================================================== #
     melee_boyz = {
-        'chaplain_gregor_ironmaw': black_templars.chaplain_gregor_ironmaw * black_templars.TemplarVow,
-        'the_emperors_champion_strike': black_templars.the_emperors_champion_strike * black_templars.TemplarVow,
-        'the_emperors_champion_sweep': black_templars.the_emperors_champion_sweep * black_templars.TemplarVow,
-
-        'punching_redemptor_dread': copy.deepcopy(black_templars.punching_redemptor_dread),
-        'punching_redemptor_dread_wrath': copy.deepcopy(black_templars.punching_redemptor_dread_wrath),
-        'brutalis_talon_sweep': copy.deepcopy(black_templars.brutalis_talon_sweep),
-        'brutalis_talon_sweep_wrath': copy.deepcopy(black_templars.brutalis_talon_sweep_wrath),
-        'brutalis_talon_strike': copy.deepcopy(black_templars.brutalis_talon_strike),
-        'brutalis_talon_strike_wrath': copy.deepcopy(black_templars.brutalis_talon_strike_wrath),
-
-        'sword_brethern': copy.deepcopy(black_templars.sword_brethern),
-        'sword_brethern_wrath': copy.deepcopy(black_templars.sword_brethern_wrath),
-        'sword_brethern_ld_by_gregor (0CP)': copy.deepcopy(black_templars.sword_brethern_ld_by_gregor),
-        'sword_brethern_ld_by_gregor_wrath (1CP)': copy.deepcopy(black_templars.sword_brethern_ld_by_gregor_wrath),
-        'sword_brethern_ld_by_champ (0CP)': copy.deepcopy(black_templars.sword_brethern_ld_by_champ),
-        'sword_brethern_ld_by_champ_wrath (1CP)': copy.deepcopy(black_templars.sword_brethern_ld_by_champ_wrath),
-        'sword_brethern_ld_by_champ_stack (1CP)': copy.deepcopy(black_templars.sword_brethern_ld_by_champ_stack),
-        'sword_brethern_ld_by_champ_wrath_stack (2CP)': copy.deepcopy(black_templars.sword_brethern_ld_by_champ_wrath_stack),
-
-        'pri_crusaders': copy.deepcopy(black_templars.pri_crusaders),
-        'pri_crusaders_ld_by_gregor': copy.deepcopy(black_templars.pri_crusaders_ld_by_gregor),
-        'pri_crusaders_ld_by_gregor_wrath': copy.deepcopy(black_templars.pri_crusaders_ld_by_gregor_wrath),
-        'pri_crusaders_ld_by_champ': copy.deepcopy(black_templars.pri_crusaders_ld_by_champ),
-        'pri_crusaders_ld_by_champ_wrath': copy.deepcopy(black_templars.pri_crusaders_ld_by_champ_wrath),
-        'pri_crusaders_ld_by_champ_stack': copy.deepcopy(black_templars.pri_crusaders_ld_by_champ_stack),
-        'pri_crusaders_ld_by_champ_wrath_stack': copy.deepcopy(black_templars.pri_crusaders_ld_by_champ_wrath_stack),
-
-        'assault_intercessors': copy.deepcopy(black_templars.assault_intercessors),
-        'assault_intercessors_ld_by_gregor': copy.deepcopy(black_templars.assault_intercessors_ld_by_gregor),
-        'assault_intercessors_ld_by_gregor_wrath': copy.deepcopy(black_templars.assault_intercessors_ld_by_gregor_wrath),
-        'assault_intercessors_ld_by_champ': copy.deepcopy(black_templars.assault_intercessors_ld_by_champ),
-        'assault_intercessors_ld_by_champ_wrath': copy.deepcopy(black_templars.assault_intercessors_ld_by_champ_wrath),
-
-        'assault_termies_0_5': copy.deepcopy(black_templars.assault_termies_0_5),
-        'assault_termies_0_5_wrath': copy.deepcopy(black_templars.assault_termies_0_5_wrath),
-        'assault_termies_5_0': copy.deepcopy(black_templars.assault_termies_5_0),
-        'assault_termies_5_0_wrath': copy.deepcopy(black_templars.assault_termies_5_0_wrath),
-        'assault_termies_3_2': copy.deepcopy(black_templars.assault_termies_3_2),
-        'assault_termies_3_2_wrath': copy.deepcopy(black_templars.assault_termies_3_2_wrath),
-        'assault_termies_2_3': copy.deepcopy(black_templars.assault_termies_2_3),
-        'assault_termies_2_3_wrath': copy.deepcopy(black_templars.assault_termies_2_3_wrath),
+        'chaplain_gregor_ironmaw': lambda: black_templars.chaplain_gregor_ironmaw * black_templars.TemplarVow,
+        'the_emperors_champion_strike': lambda: black_templars.the_emperors_champion_strike * black_templars.TemplarVow,
+        'the_emperors_champion_sweep': lambda: black_templars.the_emperors_champion_sweep * black_templars.TemplarVow,
+
+        'punching_redemptor_dread': lambda: black_templars.punching_redemptor_dread,
+        'punching_redemptor_dread_wrath': lambda: black_templars.punching_redemptor_dread_wrath,
+        'brutalis_talon_sweep': lambda: black_templars.brutalis_talon_sweep,
+        'brutalis_talon_sweep_wrath': lambda: black_templars.brutalis_talon_sweep_wrath,
+        'brutalis_talon_strike': lambda: black_templars.brutalis_talon_strike,
+        'brutalis_talon_strike_wrath': lambda: black_templars.brutalis_talon_strike_wrath,
+
+        'sword_brethern': lambda: black_templars.sword_brethern,
+        'sword_brethern_wrath': lambda: black_templars.sword_brethern_wrath,
+        'sword_brethern_ld_by_gregor (0CP)': lambda: black_templars.sword_brethern_ld_by_gregor,
+        'sword_brethern_ld_by_gregor_wrath (1CP)': lambda: black_templars.sword_brethern_ld_by_gregor_wrath,
+        'sword_brethern_ld_by_champ (0CP)': lambda: black_templars.sword_brethern_ld_by_champ,
+        'sword_brethern_ld_by_champ_wrath (1CP)': lambda: black_templars.sword_brethern_ld_by_champ_wrath,
+        'sword_brethern_ld_by_champ_stack (1CP)': lambda: black_templars.sword_brethern_ld_by_champ_stack,
+        'sword_brethern_ld_by_champ_wrath_stack (2CP)': lambda: black_templars.sword_brethern_ld_by_champ_wrath_stack,
+
+        'pri_crusaders': lambda: black_templars.pri_crusaders,
+        'pri_crusaders_ld_by_gregor': lambda: black_templars.pri_crusaders_ld_by_gregor,
+        'pri_crusaders_ld_by_gregor_wrath': lambda: black_templars.pri_crusaders_ld_by_gregor_wrath,
+        'pri_crusaders_ld_by_champ': lambda: black_templars.pri_crusaders_ld_by_champ,
+        'pri_crusaders_ld_by_champ_wrath': lambda: black_templars.pri_crusaders_ld_by_champ_wrath,
+        'pri_crusaders_ld_by_champ_stack': lambda: black_templars.pri_crusaders_ld_by_champ_stack,
+        'pri_crusaders_ld_by_champ_wrath_stack': lambda: black_templars.pri_crusaders_ld_by_champ_wrath_stack,
+
+        'assault_intercessors': lambda: black_templars.assault_intercessors,
+        'assault_intercessors_ld_by_gregor': lambda: black_templars.assault_intercessors_ld_by_gregor,
+        'assault_intercessors_ld_by_gregor_wrath': lambda: black_templars.assault_intercessors_ld_by_gregor_wrath,
+        'assault_intercessors_ld_by_champ': lambda: black_templars.assault_intercessors_ld_by_champ,
+        'assault_intercessors_ld_by_champ_wrath': lambda: black_templars.assault_intercessors_ld_by_champ_wrath,
+
+        'assault_termies_0_5': lambda: black_templars.assault_termies_0_5,
+        'assault_termies_0_5_wrath': lambda: black_templars.assault_termies_0_5_wrath,
+        'assault_termies_5_0': lambda: black_templars.assault_termies_5_0,
+        'assault_termies_5_0_wrath': lambda: black_templars.assault_termies_5_0_wrath,
+        'assault_termies_3_2': lambda: black_templars.assault_termies_3_2,
+        'assault_termies_3_2_wrath': lambda: black_templars.assault_termies_3_2_wrath,
+        'assault_termies_2_3': lambda: black_templars.assault_termies_2_3,
+        'assault_termies_2_3_wrath': lambda: black_templars.assault_termies_2_3_wrath,
     }
 
     # ==================================================================================== #
@@ -70,19 +72,19 @@ if __name__ == "__main__":
     # ==================================================================================== #
     # ==================================================================================== #
     ranged_boyz = {
-        'eradicators': copy.deepcopy(black_templars.eradicators),
-        'eradicators_at_vehicle': copy.deepcopy(black_templars.eradicators_at_vehicle),
-        'full_squad_eradicators': copy.deepcopy(black_templars.full_squad_eradicators),
-        'full_squad_eradicators_at_vehicle': copy.deepcopy(black_templars.full_squad_eradicators_at_vehicle),
-        'redemptor_dread': copy.deepcopy(black_templars.redemptor_dread),
-        'ven_brother_grammituis': copy.deepcopy(black_templars.ven_brother_grammituis),
-        'full_eradicators_firedis_stack': copy.deepcopy(black_templars.full_eradicators_firedis_stack),
-        'full_eradicators_firedis_stack_at_vehicle': copy.deepcopy(black_templars.full_eradicators_firedis_stack_at_vehicle),
-        'leman_russ': copy.deepcopy(imperial_guard.leman_russ_tank),
-        'wraithguard_cannon': copy.deepcopy(aeldari.wraithguard_cannon),
-        'wraithguard_scythe': copy.deepcopy(aeldari.wraithguard_scythe),
-        'chimera': copy.deepcopy(imperial_guard.chimera),
-        'guardsmen': copy.deepcopy(imperial_guard.guardsmen),
+        'eradicators': lambda: black_templars.eradicators,
+        'eradicators_at_vehicle': lambda: black_templars.eradicators_at_vehicle,
+        'full_squad_eradicators': lambda: black_templars.full_squad_eradicators,
+        'full_squad_eradicators_at_vehicle': lambda: black_templars.full_squad_eradicators_at_vehicle,
+        'redemptor_dread': lambda: black_templars.redemptor_dread,
+        'ven_brother_grammituis': lambda: black_templars.ven_brother_grammituis,
+        'full_eradicators_firedis_stack': lambda: black_templars.full_eradicators_firedis_stack,
+        'full_eradicators_firedis_stack_at_vehicle': lambda: black_templars.full_eradicators_firedis_stack_at_vehicle,
+        'leman_russ': lambda: imperial_guard.leman_russ_tank,
+        'wraithguard_cannon': lambda: aeldari.wraithguard_cannon,
+        'wraithguard_scythe': lambda: aeldari.wraithguard_scythe,
+        'chimera': lambda: imperial_guard.chimera,
+        'guardsmen': lambda: imperial_guard.guardsmen,
     }
 
     # ==================================================================================== #
@@ -90,49 +92,129 @@ if __name__ == "__main__":
     # ==================================================================================== #
 
     DEFENDER_OPTIONS = {
-        'chimera': copy.deepcopy(imperial_guard.chimera),
-        'leman_russ': copy.deepcopy(imperial_guard.leman_russ_tank),
-        'wraithguard_cannon': copy.deepcopy(aeldari.wraithguard_cannon),
-        'wraithguard_scythe': copy.deepcopy(aeldari.wraithguard_scythe),
-        'waveserpent': copy.deepcopy(aeldari.waveserpent),
-        'guardsmen': copy.deepcopy(imperial_guard.guardsmen),
-        'eradicators': copy.deepcopy(black_templars.eradicators),
-        'redemptor_dread': copy.deepcopy(black_templars.redemptor_dread),
-        'ven_brother_grammituis': copy.deepcopy(black_templars.ven_brother_grammituis),
-        'space_marine': copy.deepcopy(black_templars.assault_intercessors),
+        'chimera': lambda: imperial_guard.chimera,
+        'leman_russ': lambda: imperial_guard.leman_russ_tank,
+        'wraithguard_cannon': lambda: aeldari.wraithguard_cannon,
+        'wraithguard_scythe': lambda: aeldari.wraithguard_scythe,
+        'waveserpent': lambda: aeldari.waveserpent,
+        'guardsmen': lambda: imperial_guard.guardsmen,
+        'eradicators': lambda: black_templars.eradicators,
+        'redemptor_dread': lambda: black_templars.redemptor_dread,
+        'ven_brother_grammituis': lambda: black_templars.ven_brother_grammituis,
+        'space_marine': lambda: black_templars.assault_intercessors,
     }
+    # each option is a function that builds it, so only the attackers and defender asked for get built
     ATTACKER_OPTIONS = {
         'ranged': ranged_boyz,
         'melee': melee_boyz,
-        'eldar': {"dire_avenger": copy.deepcopy(aeldari.dire_avenger_squad)},
+        'eldar': {"dire_avenger": lambda: aeldari.dire_avenger_squad},
     }
     
     par = argparse.ArgumentParser(description='Warhammer 40k 10th Ed. Math Hammer')
-    par.add_argument('ATTACKER', type=str, choices=ATTACKER_OPTIONS.keys(), help='Attacker group to run in simulation.')
-    par.add_argument('DEFENDER', type=str, choices=DEFENDER_OPTIONS.keys(), help='Defender to run in simulation.')
-    par.add_argument('--count', type=str, help=f'Number of sequences to run.  Default is {DEFAULT_COUNT}.', default=DEFAULT_COUNT)
+    par.add_argument('ATTACKER', type=str, choices=list(ATTACKER_OPTIONS.keys()) + ['all'], help='Attacker group to run in simulation, "all" for every group.')
+    par.add_argument('DEFENDER', type=str, choices=list(DEFENDER_OPTIONS.keys()) + ['all'], help='Defender to run in simulation, "all" for a table of every attacker against every defender.')
+    par.add_argument('--count', type=int, help=f'Number of sequences to run, or to run at a time with --width/--budget.  Default is {DEFAULT_COUNT}.', default=DEFAULT_COUNT)
+    par.add_argument('--width', type=float, help='Keep running sequences until the 95%% confidence interval on the "Very Likely" and expected damage is at most this wide.', default=None)
+    par.add_argument('--budget', type=float, help='Keep running sequences for up to this many seconds, split evenly across the attackers.', default=None)
     par.add_argument('--verylikely', type=float, help='Threshold, on range [0,1], that is considered "Very Likely". Default is 5/6.', default=5/6.0)
+    par.add_argument('--engine', type=str, choices=ENGINES, help='Simulation engine. "batch" resolves all sequences at once with numpy, "allocate" also spills damage from model to model across the target unit. Default is loop.', default='loop')
+    par.add_argument('--jobs', type=int, help='Number of processes to run the sequences in.  Default is 1.', default=1)
+    par.add_argument('--no-cache', action='store_true', help='Re-run every analysis, and rebuild the faction assets, rather than reading back results and assets cached by an earlier run.  The "all" table is always run afresh, only its assets are cached.')
+    par.add_argument('--sweep', type=int, help='Report the damage at every distance from 0 to this many inches, rather than at 2 inches.', default=None)
+    par.add_argument('--csv', type=str, help='With "all", also write the table to this CSV file.', default=None)
+    par.add_argument('--profile-stages', action='store_true', help='Time and count each stage of the attack sequence, and print where the time went.')
+    par.add_argument('--no-plot', action='store_true', help='Print the reports only, without loading matplotlib or showing a plot.')
+    par.add_argument('--seed', type=int, help=f'Seed for the dice rolls, the same seed gives the same report, and is read back from the cache the second time.  Default is {DEFAULT_SEED}.', default=None)
+    par.add_argument('--fresh-dice', action='store_true', help='Roll fresh dice every run, rather than from a seed.  Only exact engine runs are cached then.')
 
     args = par.parse_args()
-
-    the_list = ATTACKER_OPTIONS[args.ATTACKER]
-    the_target = DEFENDER_OPTIONS[args.DEFENDER]
-
-    h = plt.figure(1)
+    if args.fresh_dice and args.seed is not None:
+        par.error("--seed can't be used with --fresh-dice")
+    if args.fresh_dice:
+        seed = None
+    else:
+        seed = DEFAULT_SEED if args.seed is None else args.seed
+    if args.ATTACKER == 'all' or args.DEFENDER == 'all':
+        # the table shares each weapon's trials between cells, which a per-cell stopping rule or profile can't
+        unsupported = [flag for flag, given in [('--width', args.width is not None), ('--budget', args.budget is not None), ('--sweep', args.sweep is not None), ('--profile-stages', args.profile_stages)] if given]
+        if len(unsupported) > 0:
+            par.error(f"{', '.join(unsupported)} can't be used with \"all\"")
+
+    # matplotlib is slow to import, only load it when there's going to be a plot
+    if not args.no_plot:
+        import matplotlib.pyplot as plt
+
+    if not args.no_cache:
+        asset_registry.enable_snapshots()
+
+    if args.ATTACKER == 'all' or args.DEFENDER == 'all':
+        groups = ATTACKER_OPTIONS.keys() if args.ATTACKER == 'all' else [args.ATTACKER]
+        attackers = {f"{group}/{k}": update_position(ATTACKER_OPTIONS[group][k](), 0) for group in groups for k in ATTACKER_OPTIONS[group]}
+        targets = DEFENDER_OPTIONS.keys() if args.DEFENDER == 'all' else [args.DEFENDER]
+        defenders = {k: update_position(DEFENDER_OPTIONS[k](), 2) for k in targets}
+        print(f"Working on {len(attackers)} attackers x {len(defenders)} defenders...")
+        matrix = analysis_matrix(attackers=attackers, defenders=defenders, count=args.count, pvalue=args.verylikely, engine=args.engine, rng=seed, workers=args.jobs)
+        header = ['attacker', 'defender', 'very_likely_damage', 'expected_damage', 'very_likely_models_removed', 'points_per_damage']
+        rows = [[a, d, result.very_likely_damage_output, result.expected_damage_output, result.very_likely_models_removed, result.points_per_damage] for (a, d), result in matrix.items()]
+        width = max(len(a) for a in attackers)
+        dwidth = max(len(d) for d in defenders)
+        print(f"{'attacker':{width}s}  {'defender':{dwidth}s}  {int(args.verylikely*100): 3d}%dmg  expected  {int(args.verylikely*100): 3d}%removed  PPD")
+        for a, d, very_likely, expected, removed, ppd in rows:
+            print(f"{a:{width}s}  {d:{dwidth}s}  {int(very_likely): 7d}  {int(expected): 8d}  {int(removed): 11d}  {ppd:0.2f}")
+        if args.csv is not None:
+            import csv
+            with open(args.csv, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+        sys.exit(0)
+
+    the_list = {k: build() for k, build in ATTACKER_OPTIONS[args.ATTACKER].items()}
+    the_target = DEFENDER_OPTIONS[args.DEFENDER]()
+
+    if not args.no_plot:
+        h = plt.figure(1)
 
     print("Working...")
 
 
+    budget = None if args.budget is None else args.budget / len(the_list)
+    cache = None if args.no_cache else ResultCache()
+    adaptive = args.width is not None or budget is not None
+
+    if args.sweep is not None:
+        print(f"{int(args.verylikely*100)}% chance N damage done, by distance:")
+        for k in the_list:
+            attacker = update_position(the_list[k], 0)
+            sweep = range_sweep(attacker=attacker, defender=the_target, distances=range(0, args.sweep + 1), count=args.count, pvalue=args.verylikely, engine=args.engine, rng=seed, workers=args.jobs)
+            # one line per band of distances that have the same weapons in range
+            start = 0
+            for ii in range(1, len(sweep) + 1):
+                if ii == len(sweep) or sweep[ii][1] is not sweep[start][1]:
+                    print(f"{int(sweep[start][1].very_likely_damage_output): 3d} : {k} @ {sweep[start][0]}-{sweep[ii-1][0]}in")
+                    start = ii
+            if not args.no_plot:
+                plt.plot([distance for distance, _ in sweep], [result.very_likely_damage_output for _, result in sweep])
+        if not args.no_plot:
+            plt.legend(the_list.keys())
+            plt.xlabel("distance (in)")
+            plt.title(f"versus {the_target}")
+            plt.show()
+        sys.exit(0)
+
     models_removed = {}
     damage_done = {}
+    precision = {}
     for k in the_list:
         attacker = the_list[k]
         attacker = update_position(attacker, 0)
         the_target = update_position(the_target, 2)
-        result = perform_full_analysis(attacker=attacker, defender=the_target, count=args.count, pvalue=args.verylikely, description=k)
+        result = perform_full_analysis(attacker=attacker, defender=the_target, count=args.count, pvalue=args.verylikely, description=k, engine=args.engine, rng=seed, workers=args.jobs, width=args.width, budget=budget, cache=cache, profile_stages=args.profile_stages)
         models_removed[k] = result.very_likely_models_removed
         damage_done[k] = result.very_likely_damage_output
-        plt.plot(result.damage_cdf)
+        precision[k] = result
+        if not args.no_plot:
+            plt.plot(result.damage_cdf)
 
 
     def print_report(modl_dict, header):
@@ -142,7 +224,17 @@ if __name__ == "__main__":
 
     print_report(models_removed, f"{int(args.verylikely*100)}% chance M models removed:")
     print_report(damage_done, f"{int(args.verylikely*100)}% chance N damage done:")
-
-    plt.legend(the_list.keys())
-    plt.title(f"versus {the_target}")
-    plt.show()
\ No newline at end of file
+    if adaptive:
+        print("Trials run (standard error on the very likely, expected damage):")
+        for k in precision:
+            print(f"{precision[k].trials: 8d} ({precision[k].very_likely_damage_error:0.2f}, {precision[k].expected_damage_error:0.2f}) : {k}")
+    if args.profile_stages:
+        print("Time and counts per stage of the attack sequence:")
+        for k in precision:
+            if precision[k].stage_report is not None:
+                print(f"  {k}: {format_stage_report(precision[k].stage_report)}")
+
+    if not args.no_plot:
+        plt.legend(the_list.keys())
+        plt.title(f"versus {the_target}")
+        plt.show()
\ No newline at end of file
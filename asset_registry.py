@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import hashlib
+
+'''
+Named faction assets, built on first use.
+
+A faction module makes an AssetRegistry and adds a factory for each of its models and units, rather than building
+them all when it's imported:
+
+    assets = AssetRegistry(__file__)
+    assets.add('sword_brethern', lambda: Unit([...]) * TemplarVow)
+    assets.add('sword_brethern_wrath', lambda: assets['sword_brethern'] * CrusadersWrath)
+    __getattr__ = assets.module_getattr
+
+An asset is built the first time it's asked for, and the same object is handed out from then on, so don't modify
+it in place (update_position, and the * and + operators, all return copies).  'module_getattr' keeps
+faction.asset_name working as it did when the assets were module globals.
+
+With snapshots on (see enable_snapshots) a built asset is also dill pickled to disk, keyed by a hash of the faction
+source file and of math_hammer.py, so later runs read it back instead of building it.  Editing either file changes
+the key, and the faction's snapshots under the old key are removed the first time one is written under the new one.
+'''
+
+# the faction modules find_asset looks through, each has an 'assets' registry
+FACTIONS = ['black_templars', 'aeldari', 'imperial_guard']
+# snapshots are off until enable_snapshots is called
+SNAPSHOT_DIR = None
+MATH_HAMMER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'math_hammer.py')
+
+def enable_snapshots(directory=None):
+    ''' snapshot built assets under 'directory', default is an 'assets' folder in the result cache directory '''
+    global SNAPSHOT_DIR
+    if directory is None:
+        from result_cache import DEFAULT_CACHE_DIR
+        directory = os.path.join(os.environ.get('MATH_HAMMER_CACHE', DEFAULT_CACHE_DIR), 'assets')
+    SNAPSHOT_DIR = directory
+
+def disable_snapshots():
+    global SNAPSHOT_DIR
+    SNAPSHOT_DIR = None
+
+def source_hash(*paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def find_asset(name):
+    '''
+        The asset called 'name' in one of the FACTIONS, built.  'faction.name' picks the faction, a bare name has to be
+        in exactly one of them.  Raises KeyError if there's no such asset.
+    '''
+    import importlib
+    faction, _, asset = name.rpartition('.')
+    registries = [importlib.import_module(f).assets for f in ([faction] if faction else FACTIONS) if f in FACTIONS]
+    found = [registry for registry in registries if asset in registry]
+    if len(found) == 0:
+        raise KeyError(f"no asset '{name}'")
+    if len(found) > 1:
+        raise KeyError(f"'{name}' is in {', '.join(registry.faction for registry in found)}, say which, e.g. '{found[0].faction}.{asset}'")
+    return found[0][asset]
+
+class AssetRegistry():
+    def __init__(self, source):
+        '''
+            'source' is the faction module's file, its contents key the snapshots
+        '''
+        self.source = os.path.abspath(source)
+        self.faction = os.path.splitext(os.path.basename(self.source))[0]
+        self.factories = {}
+        self.built = {}
+        self.key = None
+        # the snapshot directory stale snapshots have been removed from, see remove_stale_snapshots
+        self.pruned = None
+
+    def add(self, name, factory):
+        ''' register 'factory', a function of no arguments, as the way to build 'name' '''
+        self.factories[name] = factory
+
+    def keys(self):
+        return self.factories.keys()
+
+    def __contains__(self, name):
+        return name in self.factories
+
+    def __getitem__(self, name):
+        if name not in self.built:
+            if name not in self.factories:
+                raise KeyError(f"{self.faction} has no asset '{name}'")
+            asset = self.load_snapshot(name)
+            if asset is None:
+                asset = self.factories[name]()
+                self.store_snapshot(name, asset)
+            self.built[name] = asset
+        return self.built[name]
+
+    def module_getattr(self, name):
+        ''' a module level __getattr__ for the faction module '''
+        if name in self.factories:
+            return self[name]
+        raise AttributeError(f"module '{self.faction}' has no attribute '{name}'")
+
+    def snapshot_folder(self):
+        ''' the name of the folder under SNAPSHOT_DIR the current sources' snapshots go in '''
+        if self.key is None:
+            self.key = source_hash(self.source, MATH_HAMMER_SOURCE)[:16]
+        return f"{self.faction}-{self.key}"
+
+    def snapshot_path(self, name):
+        return os.path.join(SNAPSHOT_DIR, self.snapshot_folder(), name + '.pkl')
+
+    def load_snapshot(self, name):
+        ''' the snapshot of 'name', None if snapshots are off or there isn't one '''
+        if SNAPSHOT_DIR is None:
+            return None
+        import dill
+        try:
+            with open(self.snapshot_path(name), 'rb') as f:
+                return dill.load(f)
+        except Exception as e:
+            return None
+
+    def store_snapshot(self, name, asset):
+        if SNAPSHOT_DIR is None:
+            return
+        import dill
+        path = self.snapshot_path(name)
+        if self.pruned != SNAPSHOT_DIR:
+            self.remove_stale_snapshots()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # threads building assets share a pid, each store gets a scratch file of its own
+        handle, scratch = tempfile.mkstemp(dir=os.path.dirname(path), prefix=name, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            dill.dump(asset, f)
+        os.replace(scratch, path)
+
+    def remove_stale_snapshots(self):
+        ''' remove this faction's snapshots under any key but the current one '''
+        current = self.snapshot_folder()
+        try:
+            entries = os.listdir(SNAPSHOT_DIR)
+        except FileNotFoundError as e:
+            entries = []
+        for entry in entries:
+            stale = entry.startswith(f"{self.faction}-") and len(entry) == len(current) and entry != current
+            if stale:
+                shutil.rmtree(os.path.join(SNAPSHOT_DIR, entry), ignore_errors=True)
+        self.pruned = SNAPSHOT_DIR
+
+# ==============================================================================================================
+# ==============================================================================================================
+def run_tests():
+    import time
+    import tempfile
+    import numpy as np
+    import black_templars
+    import imperial_guard
+    from math_hammer import perform_full_analysis, update_position
+
+    registry = black_templars.assets
+    print(f"nothing built on import: {len(registry.built) == 0}")
+    unit = black_templars.sword_brethern_ld_by_champ_wrath_stack
+    print(f"built on first access, with what it depends on: {sorted(registry.built)}")
+    print(f"same object on the next access: {unit is registry['sword_brethern_ld_by_champ_wrath_stack']}")
+    print(f"found by name, with or without the faction: {find_asset('guardsmen') is find_asset('imperial_guard.guardsmen') is imperial_guard.guardsmen}")
+    try:
+        find_asset('aeldari.guardsmen')
+        print("unknown asset raises KeyError: False")
+    except KeyError as e:
+        print("unknown asset raises KeyError: True")
+
+    with tempfile.TemporaryDirectory() as directory:
+        enable_snapshots(directory)
+        try:
+            registry.built.clear()
+            start = time.perf_counter()
+            cold = registry['sword_brethern_ld_by_champ_wrath_stack']
+            built = time.perf_counter() - start
+            registry.built.clear()
+            start = time.perf_counter()
+            warm = registry['sword_brethern_ld_by_champ_wrath_stack']
+            loaded = time.perf_counter() - start
+            print(f"read back from the snapshot, not built: {sorted(registry.built) == ['sword_brethern_ld_by_champ_wrath_stack']} ({built*1e3:0.1f}ms built, {loaded*1e3:0.1f}ms read)")
+            target = update_position(imperial_guard.guardsmen, 2)
+            before = perform_full_analysis(attacker=update_position(cold, 0), defender=target, count=1000, pvalue=5/6.0, description="built", engine='batch', rng=7)
+            after = perform_full_analysis(attacker=update_position(warm, 0), defender=target, count=1000, pvalue=5/6.0, description="snapshot", engine='batch', rng=7)
+            print(f"snapshot gives the same analysis: {np.array_equal(before.damage_cdf, after.damage_cdf)}")
+
+            # what an edit to black_templars.py leaves behind, and another faction's snapshots that have to stay
+            stale = os.path.join(directory, 'black_templars-' + '0' * 16)
+            other = os.path.join(directory, imperial_guard.assets.snapshot_folder())
+            for folder in [stale, other]:
+                os.makedirs(folder, exist_ok=True)
+            registry.pruned = None
+            registry.built.clear()
+            os.remove(registry.snapshot_path('sword_brethern'))
+            registry['sword_brethern']
+            print(f"stale snapshots removed on the next write: {not os.path.exists(stale) and os.path.exists(other) and os.path.exists(registry.snapshot_path('sword_brethern'))}")
+            print(f"no scratch files left: {[f for f in os.listdir(os.path.dirname(registry.snapshot_path('sword_brethern'))) if f.endswith('.tmp')] == []}")
+        finally:
+            disable_snapshots()
+            registry.built.clear()
+
+if __name__ == "__main__":
+    # the factions import asset_registry, test through that module rather than __main__, or the snapshot switch
+    # flipped here isn't the one they see
+    import asset_registry
+    asset_registry.run_tests()
+else:
+    pass
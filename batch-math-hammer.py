@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+
+from scenario_runner import load_scenarios, run_batch
+from result_cache import ResultCache
+import asset_registry
+
+if __name__ == "__main__":
+    par = argparse.ArgumentParser(description='Warhammer 40k 10th Ed. Math Hammer, a batch of matchups.  See scenario_runner.py for the scenario file.')
+    par.add_argument('SCENARIOS', type=str, help='JSON file of the matchups to run.')
+    par.add_argument('OUTPUT', type=str, help='JSON lines file to append a line to as each matchup finishes.  Matchups already in it are skipped, so an interrupted batch can be run again to finish it.')
+    par.add_argument('--jobs', type=int, help='Number of processes to run matchups in.  Default is 1.', default=1)
+    par.add_argument('--retry-failed', action='store_true', help='Run the matchups that failed last time again, rather than skipping them.')
+    par.add_argument('--no-cache', action='store_true', help='Re-run every analysis, and rebuild the faction assets, rather than reading back results and assets cached by an earlier run.')
+
+    args = par.parse_args()
+
+    if not args.no_cache:
+        asset_registry.enable_snapshots()
+    try:
+        scenarios = load_scenarios(args.SCENARIOS)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        exit(1)
+    failed = 0
+    for ii, record in enumerate(run_batch(scenarios, args.OUTPUT, jobs=args.jobs, cache=None if args.no_cache else ResultCache(), retry_failed=args.retry_failed)):
+        failed += record['status'] == 'failed'
+        status = record['error'] if record['status'] == 'failed' else f"{record['elapsed']:0.2f}s"
+        print(f"{ii+1: 5d} : {record['job']['desc']} ({status})", file=sys.stderr)
+    exit(1 if failed > 0 else 0)
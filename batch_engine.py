@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+
+import time
+import numpy as np
+
+from math_hammer import Dice, CharState, AttackSequenceState, dice_rng, enumerate_matchups, compile_modifiers, apply_characteristic_op
+
+'''
+Vectorized attack sequence.
+
+DStat.__sub__ walks one trial at a time, one die at a time.  Here we walk the same state machine
+(preamble, attacks, hit, strength, toughness, wound, armourpen, sv, invuln, save, damage, fnp)
+but every pool holds the dice of ALL trials at once, as flat arrays tagged with the trial they belong to.
+Variable-length pools (D6 attacks, sustained hits, rerolls) are just longer or shorter arrays.
+
+The modifiers are run from their declarative ModifierOp descriptions, see compile_modifiers.
+Any weapon/armour pairing carrying a modifier without one is resolved with the original
+per-trial loop instead, so the results are always available, just not always fast.
+'''
+
+class UnsupportedModifier(Exception):
+    ''' raised when a stat line can't be expressed in the vectorized state machine '''
+    pass
+
+def compile_plan(defender, attacker):
+    ''' compile_modifiers, raising UnsupportedModifier if the plan can only be run by the functors '''
+    plan = compile_modifiers(defender, attacker)
+    if not plan.is_supported():
+        raise UnsupportedModifier("; ".join(plan.unsupported))
+    return plan
+
+# =========================================================================== #
+class DicePool():
+    '''
+        Every die waiting in one of the AttackSequenceState pools, for every trial.
+        A die is described by the arrays at the same index:
+            trial - which trial it belongs to
+            count - how many times it has already been rolled
+            sides, bias, fixed, is_fixed - same meaning as the Dice fields
+    '''
+    def __init__(self, trial=None, count=None, sides=None, bias=None, fixed=None, is_fixed=None):
+        empty = np.zeros((0,), dtype=np.int64)
+        self.trial = empty if trial is None else trial
+        N = len(self.trial)
+        self.count = np.zeros((N,), dtype=np.int64) if count is None else count
+        self.sides = np.full((N,), 6, dtype=np.int64) if sides is None else sides
+        self.bias = np.zeros((N,), dtype=np.int64) if bias is None else bias
+        self.fixed = np.zeros((N,), dtype=np.int64) if fixed is None else fixed
+        self.is_fixed = np.zeros((N,), dtype=bool) if is_fixed is None else is_fixed
+
+    def __len__(self):
+        return len(self.trial)
+
+    def take(self, mask):
+        return DicePool(self.trial[mask], self.count[mask], self.sides[mask], self.bias[mask], self.fixed[mask], self.is_fixed[mask])
+
+    def extend(self, other):
+        self.trial = np.concatenate([self.trial, other.trial])
+        self.count = np.concatenate([self.count, other.count])
+        self.sides = np.concatenate([self.sides, other.sides])
+        self.bias = np.concatenate([self.bias, other.bias])
+        self.fixed = np.concatenate([self.fixed, other.fixed])
+        self.is_fixed = np.concatenate([self.is_fixed, other.is_fixed])
+
+    def roll(self, rng):
+        self.count = self.count + 1
+        if np.any(self.count > 2):
+            raise ValueError(f"Roll count reached {np.max(self.count)}, which is illegal")
+        value = self.fixed.copy()
+        free = ~self.is_fixed
+        value[free] = rng.integers(1, self.sides[free] + 1) + self.bias[free]
+        return value
+
+def fresh_dice(trial, count=None):
+    ''' plain D6s, as added by Dice() '''
+    return DicePool(trial=np.asarray(trial, dtype=np.int64), count=count)
+
+def dice_like(item, trial):
+    ''' one copy of the Dice 'item' for every entry of trial '''
+    try:
+        if item.sides > 0:
+            pass
+    except Exception as e:
+        raise UnsupportedModifier(f"cannot vectorize dice with sides {item.sides}")
+    N = len(trial)
+    return DicePool(trial=trial,
+                    count=np.full((N,), item.roll_count, dtype=np.int64),
+                    sides=np.full((N,), item.sides, dtype=np.int64),
+                    bias=np.full((N,), item.bias, dtype=np.int64),
+                    fixed=np.full((N,), 0 if item.fixed_value is None else item.fixed_value, dtype=np.int64),
+                    is_fixed=np.full((N,), item.fixed_value is not None, dtype=bool))
+
+def characteristic_dice(value, trial):
+    '''
+        The dice the framework builds from a characteristic (attacks or damage), which is one of
+            int (here an array with a value per trial, as modifiers may have changed it)
+            Dice
+            [Dice,]
+    '''
+    char_state = test_for_characteristic(value)
+    if char_state is CharState.Int:
+        return DicePool(trial=trial, fixed=value[trial], is_fixed=np.ones((len(trial),), dtype=bool))
+    if char_state is CharState.Dice:
+        return dice_like(value, trial)
+    result = DicePool()
+    for item in value:
+        result.extend(dice_like(item, trial))
+    return result
+
+def test_for_characteristic(value):
+    if isinstance(value, np.ndarray):
+        return CharState.Int
+    if isinstance(value, Dice):
+        return CharState.Dice
+    try:
+        for item in value:
+            pass
+        return CharState.DiceList
+    except Exception as e:
+        raise UnsupportedModifier(f"cannot vectorize characteristic {value}")
+
+# =========================================================================== #
+def clamp_the_roll_modifier(unmodified, modified):
+    return unmodified + np.clip(modified - unmodified, -1, 1)
+
+def resolve_pool_sequence(sequence, pool, ops, state, rng, profile=None):
+    '''
+        Roll every die in 'pool' for 'sequence', run the modifier ops over them, then the standard postamble.
+        Rerolled dice go around again until the pool is empty, exactly as the per-trial loop would.
+        Dice leaving the sequence are appended to state.pool.
+        'profile' is a StageProfile to count into, its pool sizes are every trial's dice at once.
+    '''
+    if profile is not None:
+        stage = profile.stage(sequence)
+        start = time.perf_counter()
+        stage['max_pool'] = max(stage['max_pool'], len(pool))
+    N = state.N
+    char = state.char
+    threshold = state.threshold.get(sequence)
+    applications = []
+    while len(pool) > 0:
+        unmodified = pool.roll(rng)
+        if profile is not None:
+            stage['dice'] += len(pool)
+            stage['rerolls'] += int(np.count_nonzero(pool.count > 1))
+            stage['modifiers'] += len(ops) + 1 # and the postamble
+        value = unmodified.copy()
+        trial = pool.trial
+        active = np.ones((len(pool),), dtype=bool)
+        rerolled = np.zeros((len(pool),), dtype=bool)
+        for op in ops:
+            if op.kind == 'characteristic':
+                # nothing reads the characteristics while the attacks sequence runs, so count now, apply later
+                applications.append((op, np.bincount(trial[active], minlength=N)))
+            elif op.kind == 'roll':
+                value = np.where(active, apply_characteristic_op(op, value, 1), value)
+            elif op.kind == 'reroll':
+                if op.predicate == 'ones':
+                    hit = value == 1
+                elif op.predicate == 'less_than':
+                    hit = value < op.threshold
+                elif op.predicate == 'fails':
+                    hit = value < threshold[trial]
+                else:
+                    hit = value >= threshold[trial]
+                hit = active & hit & (pool.count < 2)
+                rerolled |= hit
+                active &= ~hit
+            elif op.kind == 'add_dice':
+                added = active & (value >= char[op.critical][trial]) if op.critical is not None else active
+                if op.dice == 'd6':
+                    state.pool[op.pool].extend(fresh_dice(np.repeat(trial[added], op.amount)))
+                elif op.dice == 'damage':
+                    state.pool[op.pool].extend(characteristic_dice(char['damage'], trial[added]))
+                else: # the die that was just rolled
+                    state.pool[op.pool].extend(fresh_dice(trial[added], pool.count[added]))
+                if op.breaks:
+                    active &= ~added
+            else:
+                raise UnsupportedModifier(f"unknown op {op}")
+
+        postamble(sequence, pool, unmodified, value, active, state)
+        pool = pool.take(rerolled)
+
+    for op, times in applications:
+        char[op.characteristic] = apply_characteristic_op(op, char[op.characteristic], times)
+    if profile is not None:
+        stage['seconds'] += time.perf_counter() - start
+
+def postamble(sequence, pool, unmodified, value, active, state):
+    ''' vectorized create_standard_attack_modifier_sequence, for the dice that made it through the modifiers '''
+    N = state.N
+    char = state.char
+    trial = pool.trial[active]
+    unmodified = unmodified[active]
+    value = value[active]
+    if sequence == 'attacks':
+        state.attacks += np.bincount(trial, weights=value, minlength=N).astype(np.int64)
+    elif sequence in ['hit', 'wound']:
+        CR = char['critical' + sequence][trial]
+        clamped_roll = clamp_the_roll_modifier(unmodified, value)
+        success = (unmodified != 1) & ((unmodified >= CR) | (clamped_roll >= state.threshold[sequence][trial]))
+        state.pool[sequence].extend(fresh_dice(trial[success]))
+    elif sequence == 'save':
+        failed = (unmodified == 1) | (value < state.threshold['save'][trial])
+        state.pool['save'].extend(characteristic_dice(char['damage'], trial[failed]))
+    elif sequence == 'damage':
+        state.fnp_trial.append(trial)
+        state.fnp_dice.append(np.maximum(value, 0))
+
+class BatchState():
+    ''' AttackSequenceState, for N trials at once '''
+    def __init__(self, N):
+        self.N = N
+        self.pool = {'hit': DicePool(), 'wound': DicePool(), 'save': DicePool()}
+        self.char = {}
+        self.threshold = {}
+        self.attacks = np.zeros((N,), dtype=np.int64)
+        self.fnp_trial = []
+        self.fnp_dice = []
+
+def resolve_fnp(state, rng, profile=None):
+    ''' vectorized resolve_fnp_pool, summed per trial '''
+    N = state.N
+    trial, damage_tally = fnp_damage_tally(state, rng, profile)
+    target_wounds = state.char['wounds'][trial]
+    used = np.bincount(trial, weights=np.minimum(target_wounds, damage_tally), minlength=N)
+    wasted = np.bincount(trial, weights=np.maximum(0, damage_tally - target_wounds), minlength=N)
+    return np.maximum(0, used), np.maximum(0, wasted)
+
+def fnp_damage_tally(state, rng, profile=None):
+    ''' the damage of every damage die, after feel no pain, and the trial it belongs to.  In the order they were rolled. '''
+    start = time.perf_counter()
+    trial = np.concatenate(state.fnp_trial) if len(state.fnp_trial) > 0 else np.zeros((0,), dtype=np.int64)
+    damage = np.concatenate(state.fnp_dice) if len(state.fnp_dice) > 0 else np.zeros((0,), dtype=np.int64)
+    rolls = rng.integers(1, 7, size=int(np.sum(damage)))
+    thresh = state.char['fnp']
+    if thresh is not None:
+        owner = np.repeat(np.arange(len(damage)), damage)
+        fails = (rolls < thresh[trial][owner]) | (rolls == 1)
+        damage_tally = np.bincount(owner, weights=fails, minlength=len(damage)).astype(np.int64)
+    else:
+        damage_tally = damage
+    if profile is not None:
+        stage = profile.stage('fnp')
+        stage['seconds'] += time.perf_counter() - start
+        stage['dice'] += len(rolls)
+        stage['max_pool'] = max(stage['max_pool'], len(damage))
+        stage['modifiers'] += 1
+    return trial, damage_tally
+
+def batch_attack_sequence(defender: 'DStat', attacker: 'AStat', count, rng, profile=None):
+    '''
+        Vectorized DStat.__sub__: returns the (used, wasted) damage of 'count' independent trials.
+        Raises UnsupportedModifier if either stat carries a modifier the state machine can't reproduce.
+        'profile' is a StageProfile to count into.
+    '''
+    return resolve_fnp(batch_damage_state(defender, attacker, count, rng, profile), rng, profile)
+
+def batch_damage_state(defender: 'DStat', attacker: 'AStat', count, rng, profile=None):
+    '''
+        batch_attack_sequence, up to (not including) the feel no pain roll.  Returns the BatchState.
+    '''
+    start = time.perf_counter()
+    N = count
+    state = BatchState(N)
+    plan = compile_plan(defender, attacker)
+    ops = plan.ops
+
+    # the preamble already ran in the plan, the int characteristics just need a value per trial
+    for name, value in plan.char.items():
+        state.char[name] = np.full((N,), value, dtype=np.int64) if type(value) is int else value
+    if profile is not None:
+        profile.sequences += N
+        profile.stage('preamble')['seconds'] += time.perf_counter() - start
+
+    all_trials = np.arange(N, dtype=np.int64)
+    resolve_pool_sequence('attacks', characteristic_dice(state.char['attacks'], all_trials), ops['attacks'], state, rng, profile)
+    state.threshold['hit'] = state.char['skill']
+    resolve_pool_sequence('hit', fresh_dice(np.repeat(all_trials, state.attacks)), ops['hit'], state, rng, profile)
+
+    for seq in ['strength', 'toughness', 'armourpen', 'sv', 'invuln']:
+        for op in ops[seq]:
+            state.char[op.characteristic] = apply_characteristic_op(op, state.char[op.characteristic], 1)
+        # the wound threshold needs both strength and toughness, the save threshold needs all three of these
+        if seq == 'toughness':
+            state.threshold['wound'] = determine_wound_roll_vec(state.char['strength'], state.char['toughness'])
+            hit_pool, state.pool['hit'] = state.pool['hit'], DicePool()
+            resolve_pool_sequence('wound', hit_pool, ops['wound'], state, rng, profile)
+    state.threshold['save'] = determine_save_vec(state.char['sv'], state.char['invuln'], state.char['armourpen'])
+    wound_pool, state.pool['wound'] = state.pool['wound'], DicePool()
+    resolve_pool_sequence('save', wound_pool, ops['save'], state, rng, profile)
+    save_pool, state.pool['save'] = state.pool['save'], DicePool()
+    resolve_pool_sequence('damage', save_pool, ops['damage'], state, rng, profile)
+    return state
+
+def determine_wound_roll_vec(strength, toughness):
+    result = np.full(np.shape(strength), 5, dtype=np.int64)
+    result[strength * 2 < toughness] = 6
+    result[strength > toughness] = 3
+    result[strength >= toughness * 2] = 2
+    result[strength == toughness] = 4
+    return result
+
+def determine_save_vec(save, invuln, armourpen):
+    result = np.maximum(save - armourpen, 0)
+    if invuln is not None:
+        result = np.where(result > invuln, invuln, result)
+    return result
+
+# =========================================================================== #
+def loop_attack_sequence(defender: 'DStat', attacker: 'AStat', count, rng=None, profile=None):
+    ''' the per-trial DStat.__sub__, for pairings the vectorized state machine can't handle '''
+    used = np.zeros((count,))
+    wasted = np.zeros((count,))
+    state = AttackSequenceState()
+    rng = dice_rng(rng)
+    for ii in range(0, count):
+        used[ii], wasted[ii] = defender.attack(attacker, state, rng, profile)
+    return used, wasted
+
+def batch_loop(attacker, defender, count, rng=None, profile=None):
+    '''
+        Same output as the inner loop of stats_loop/mean_loop: a (count,2) array of damage used, damage wasted.
+        'profile' is a StageProfile to count into.
+    '''
+    rng = np.random.default_rng(rng)
+    N = count
+    acc = np.zeros((N,2)) # used, wasted
+    attackers = attacker if type(attacker) is list else [attacker]
+    for att in attackers:
+        for dstat, astat in enumerate_matchups(att, defender):
+            try:
+                used, wasted = batch_attack_sequence(dstat, astat, N, rng, profile)
+            except UnsupportedModifier as e:
+                # fall back to the per-trial loop for this pairing only
+                used, wasted = loop_attack_sequence(dstat, astat, N, rng, profile)
+            acc[:,0] += used
+            acc[:,1] += wasted
+    return acc
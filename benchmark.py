@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tracemalloc
+import numpy as np
+
+'''
+Benchmarks for the engine hot paths.
+
+Each scenario is run with a fixed seed, a few times, and the fastest run is kept, that's the one least disturbed by
+whatever else the machine was doing.  Peak memory is measured on a separate run with tracemalloc on, as tracing
+slows everything down.  Results are saved as JSON, and 'compare' flags anything that got slower, or bigger, than
+a baseline by more than a threshold.
+
+    python benchmark.py run --output benchmarks/baseline.json
+    python benchmark.py compare benchmarks/baseline.json
+'''
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.20
+SEED = 1234
+# a timed run repeats the scenario until it takes at least this long, too short and the timer noise takes over
+MIN_SECONDS = 0.2
+# the metrics compare looks at, bigger is worse for all of them
+METRICS = ['seconds', 'peak_bytes']
+
+def test_model_gun():
+    ''' the single die matchup run_test starts with '''
+    from math_hammer import Model, AStat, DStat
+    armour = DStat(T=5, Sv=4, W=6)
+    gun = AStat(A=1, BS_WS=4, S=4, AP=0, D=1, Range=24)
+    return Model(gun, armour, position=0), Model(gun, armour, position=2)
+
+def chimera_vs_guardsmen():
+    import imperial_guard
+    from math_hammer import update_position
+    return update_position(imperial_guard.chimera, 0), update_position(imperial_guard.guardsmen, 2)
+
+def sword_brethren_vs_guardsmen():
+    ''' a stack of modifiers.  The assets give melee weapons a range, so 2in apart, as in app-math-hammer.py '''
+    import black_templars, imperial_guard
+    from math_hammer import update_position
+    return update_position(black_templars.sword_brethern_ld_by_champ_wrath_stack, 0), update_position(imperial_guard.guardsmen, 2)
+
+def leman_russ_vs_space_marines():
+    import black_templars, imperial_guard
+    from math_hammer import update_position
+    return update_position(imperial_guard.leman_russ_tank, 0), update_position(black_templars.assault_intercessors, 2)
+
+# name: (matchup, {engine: trials})
+MATCHUPS = {
+    'test_model_gun': (test_model_gun, {'loop': 20000, 'batch': 200000, 'exact': 1000}),
+    'chimera_vs_guardsmen': (chimera_vs_guardsmen, {'loop': 2000, 'batch': 50000, 'exact': 1000, 'allocate': 50000}),
+    'sword_brethren_vs_guardsmen': (sword_brethren_vs_guardsmen, {'loop': 500, 'batch': 10000, 'allocate': 10000}),
+    'leman_russ_vs_space_marines': (leman_russ_vs_space_marines, {'loop': 2000, 'batch': 50000, 'exact': 1000}),
+}
+
+def matchup_scenario(matchup, engine, trials):
+    def run():
+        from math_hammer import mean_loop
+        attacker, defender = matchup()
+        mean_loop(attacker=attacker, defender=defender, count=trials, engine=engine, rng=SEED)
+    return run
+
+def postprocessing_scenario(trials):
+    ''' stats_comp and the models removed fold, on a sampled damage sequence '''
+    def run():
+        from math_hammer import stats_comp, fold_to_models_removed_stats
+        class Target():
+            wounds = 3
+        sample = np.random.default_rng(SEED).integers(0, 8, size=trials).astype(float)
+        stats_comp(sample)
+        fold_to_models_removed_stats(sample, Target())
+    return run
+
+def scenarios():
+    ''' name: (function to time, trials it runs) '''
+    result = {}
+    for name, (matchup, engines) in MATCHUPS.items():
+        for engine, trials in engines.items():
+            result[f"{name}/{engine}"] = (matchup_scenario(matchup, engine, trials), trials)
+    result['postprocessing'] = (postprocessing_scenario(1000000), 1000000)
+    return result
+
+def time_imports(modules, then=''):
+    ''' seconds to import 'modules', and run the statement 'then', in a fresh interpreter '''
+    code = f"import time; start = time.perf_counter(); import {', '.join(modules)}; {then or 'pass'}; print(time.perf_counter() - start)"
+    here = os.path.dirname(os.path.abspath(__file__))
+    return float(subprocess.check_output([sys.executable, '-c', code], cwd=here).decode().strip())
+
+# builds every model and unit in the faction libraries, from scratch (it's a fresh interpreter, and no snapshots)
+BUILD_FACTIONS = "[faction.assets[name] for faction in [black_templars, imperial_guard, aeldari] for name in faction.assets.keys()]"
+
+def time_command(argv):
+    ''' seconds for a fresh interpreter to run 'argv', a script and its arguments, to completion '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + argv, cwd=here, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+# name: app-math-hammer.py arguments, timed end to end from a cold start
+STARTUP = {
+    'startup_help': ['--help'],
+    'startup_headless': ['eldar', 'guardsmen', '--no-plot', '--engine', 'exact', '--seed', str(SEED)],
+}
+
+def measure(run, repeat):
+    ''' (fastest of 'repeat' runs in seconds, peak bytes allocated by one more run) '''
+    once = timed(run, 1) # also a warm up, imports and the like shouldn't count
+    loops = max(1, int(np.ceil(MIN_SECONDS / max(once, 1e-9))))
+    seconds = min(timed(run, loops) for _ in range(0, repeat)) / loops
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+def timed(run, loops):
+    start = time.perf_counter()
+    for _ in range(0, loops):
+        run()
+    return time.perf_counter() - start
+
+def run_benchmarks(repeat=DEFAULT_REPEAT, only=None):
+    results = {}
+    for name, (run, trials) in scenarios().items():
+        if only is not None and not any(name.startswith(prefix) for prefix in only):
+            continue
+        seconds, peak = measure(run, repeat)
+        results[name] = {'seconds': seconds, 'us_per_trial': 1e6 * seconds / trials, 'peak_bytes': peak}
+        print(f"{name:40s} {seconds:9.4f}s {1e6 * seconds / trials:10.2f}us/trial {peak / 2**20:9.2f}MiB peak", flush=True)
+    if only is None or 'import' in only:
+        seconds = min(time_imports(['black_templars', 'imperial_guard', 'aeldari']) for _ in range(0, repeat))
+        results['import_factions'] = {'seconds': seconds}
+        print(f"{'import_factions':40s} {seconds:9.4f}s", flush=True)
+    if only is None or 'build' in only:
+        seconds = min(time_imports(['black_templars', 'imperial_guard', 'aeldari'], then=BUILD_FACTIONS) for _ in range(0, repeat))
+        results['build_factions'] = {'seconds': seconds}
+        print(f"{'build_factions':40s} {seconds:9.4f}s", flush=True)
+    for name, argv in STARTUP.items():
+        if only is not None and not any(name.startswith(prefix) for prefix in only):
+            continue
+        seconds = min(time_command(['app-math-hammer.py'] + argv) for _ in range(0, repeat))
+        results[name] = {'seconds': seconds}
+        print(f"{name:40s} {seconds:9.4f}s", flush=True)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'repeat': repeat,
+            'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        },
+        'results': results,
+    }
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    '''
+        Returns the list of (scenario, metric, baseline, current) that are worse than the baseline by more than
+        'threshold' (a fraction).  Scenarios missing from either side are skipped.
+    '''
+    regressions = []
+    for name, before in baseline['results'].items():
+        after = current['results'].get(name)
+        if after is None:
+            continue
+        for metric in METRICS:
+            if metric not in before or metric not in after:
+                continue
+            ratio = after[metric] / before[metric] if before[metric] > 0 else 1.0
+            flag = "REGRESSION" if ratio > 1 + threshold else ""
+            print(f"{name:40s} {metric:12s} {before[metric]:12.5g} -> {after[metric]:12.5g} {ratio:6.2f}x {flag}")
+            if flag:
+                regressions.append((name, metric, before[metric], after[metric]))
+    return regressions
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def save(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+if __name__ == "__main__":
+    par = argparse.ArgumentParser(description='Benchmarks for the math hammer engines')
+    sub = par.add_subparsers(dest='command', required=True)
+    run_par = sub.add_parser('run', help='Run the benchmarks and save the results.')
+    run_par.add_argument('--output', type=str, help=f'Where to save the results.  Default is {DEFAULT_BASELINE}.', default=DEFAULT_BASELINE)
+    run_par.add_argument('--repeat', type=int, help=f'Runs per scenario, the fastest is kept.  Default is {DEFAULT_REPEAT}.', default=DEFAULT_REPEAT)
+    run_par.add_argument('--only', type=str, nargs='+', help='Only run scenarios starting with these names ("import" for the import time, "build" to build every faction asset, "startup" for the app start up times).', default=None)
+    cmp_par = sub.add_parser('compare', help='Compare results against a baseline, exits 1 on a regression.')
+    cmp_par.add_argument('BASELINE', type=str, help='Baseline results.')
+    cmp_par.add_argument('CURRENT', type=str, nargs='?', help='Results to compare.  Default is to run the benchmarks now.', default=None)
+    cmp_par.add_argument('--threshold', type=float, help=f'Fraction worse than the baseline that counts as a regression.  Default is {DEFAULT_THRESHOLD}.', default=DEFAULT_THRESHOLD)
+    cmp_par.add_argument('--repeat', type=int, help=f'Runs per scenario, when running now.  Default is {DEFAULT_REPEAT}.', default=DEFAULT_REPEAT)
+    cmp_par.add_argument('--only', type=str, nargs='+', help='Only run scenarios starting with these names, when running now.', default=None)
+    args = par.parse_args()
+
+    if args.command == 'run':
+        save(run_benchmarks(repeat=args.repeat, only=args.only), args.output)
+    else:
+        current = load(args.CURRENT) if args.CURRENT is not None else run_benchmarks(repeat=args.repeat, only=args.only)
+        regressions = compare(load(args.BASELINE), current, threshold=args.threshold)
+        print(f"{len(regressions)} regression(s) beyond {args.threshold*100:0.0f}%")
+        sys.exit(1 if len(regressions) > 0 else 0)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 
 import copy
-import matplotlib.pyplot as plt
+import numpy as np
 
 from math_hammer import AStat, DStat, Model, Unit, Dice
 from math_hammer import StandardModifiers
@@ -31,19 +31,141 @@ I think long-long-loooooong term we have all of this via the Web.  Thoughts put
 # ==============================================================================================================
 # ==============================================================================================================
 
+class ItemRef():
+    ''' the item called 'name' in 'registry', whatever it is at the time '''
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def node(self):
+        return (self.registry, self.name)
+
+    def resolve(self):
+        return self.registry.get_item(self.name)
+
+class DependencyGraph():
+    '''
+        Which items are built from which, across registries: weapons and armours into models, models into units, units
+        into analyses.  A node is a (registry, name).  When a node changes only the nodes built from it are rebuilt.
+    '''
+    def __init__(self):
+        self.owner = {}      # id(item): the node it's the current item of
+        self.items = {}      # node: id of its current item
+        self.depends = {}    # node: the nodes it's built from
+        self.dependents = {} # node: the nodes built from it
+
+    def own(self, registry, name, item):
+        node = (registry, name)
+        if self.owner.get(self.items.get(node)) == node:
+            del self.owner[self.items[node]]
+        self.items[node] = id(item)
+        self.owner[id(item)] = node
+
+    def refer(self, value):
+        ''' 'value' with every item that's the current item of some node swapped for an ItemRef to it '''
+        if isinstance(value, (list, tuple)):
+            return type(value)(self.refer(x) for x in value)
+        node = self.owner.get(id(value))
+        if node is not None and node[0].data.get(node[1]) is value:
+            return ItemRef(*node)
+        return value
+
+    def resolve(self, value):
+        ''' 'value' with its ItemRefs swapped back for the items they refer to now '''
+        if isinstance(value, ItemRef):
+            return value.resolve()
+        if isinstance(value, (list, tuple)):
+            return type(value)(self.resolve(x) for x in value)
+        return value
+
+    def references(self, value):
+        if isinstance(value, ItemRef):
+            return {value.node()}
+        if isinstance(value, (list, tuple)):
+            return set().union(*[self.references(x) for x in value])
+        return set()
+
+    def check_depends(self, node, depends):
+        ''' raises ValueError if building 'node' from 'depends' would build it from itself '''
+        if node in depends or depends & set(self.dependents_of(node)):
+            raise ValueError(f"'{node[1]}' can't be built from itself")
+
+    def set_depends(self, node, depends):
+        self.check_depends(node, depends)
+        for old in self.depends.get(node, set()):
+            self.dependents[old].discard(node)
+        self.depends[node] = depends
+        for new in depends:
+            self.dependents.setdefault(new, set()).add(node)
+
+    def dependents_of(self, node):
+        ''' every node built from 'node', directly or not, in an order they can be rebuilt in '''
+        order, seen = [], set()
+        def visit(n):
+            for dependent in self.dependents.get(n, ()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    visit(dependent)
+                    order.append(dependent)
+        visit(node)
+        return order[::-1]
+
+    def rebuild_dependents(self, registry, name):
+        ''' rebuild everything built from 'name', returns the (registry description, name) of each, in the order rebuilt '''
+        rebuilt = []
+        for dependent, dependent_name in self.dependents_of((registry, name)):
+            dependent.rebuild(dependent_name)
+            rebuilt.append((dependent.descrip, dependent_name))
+        return rebuilt
+
+# registries share this graph, unless they're given one of their own
+DEPENDENCIES = DependencyGraph()
+
 class CustomFactionBase():
-    def __init__(self, descrip):
+    '''
+        Items are kept with the arguments they were built from, any of which can be items of this or another registry.
+        Those are remembered by name (see ItemRef), so re-creating or editing an item rebuilds whatever was built from it
+        (see DependencyGraph), and only that.  Items are built once per change, get_item them again after an edit.
+    '''
+    def __init__(self, descrip, graph=None):
         self.data = {}
+        self.arguments = {}
         self.descrip = descrip
+        self.graph = DEPENDENCIES if graph is None else graph
 
     def modify(self, item, modifier): 
         if modifier is not None:
             item *= modifier
         return item
 
+    def build(self, item, modifier):
+        return self.modify(item, modifier)
+
     def update(self, item, name):
+        ''' set 'name' to 'item', and rebuild everything built from it.  Returns what was rebuilt, see rebuild_dependents '''
         self.data[name] = item
-    
+        self.graph.own(self, name, item)
+        return self.graph.rebuild_dependents(self, name)
+
+    def define(self, key, **arguments):
+        ''' build 'key' from 'arguments' with build(), and keep them to build it again when what it's built from changes '''
+        arguments = {k: self.graph.refer(v) for k, v in arguments.items()}
+        depends = self.graph.references(list(arguments.values()))
+        self.graph.check_depends((self, key), depends)
+        item = self.build(**{k: self.graph.resolve(v) for k, v in arguments.items()})
+        self.graph.set_depends((self, key), depends)
+        self.arguments[key] = arguments
+        return self.update(item, key)
+
+    def rebuild(self, key):
+        ''' build 'key' again, from what its arguments refer to now '''
+        self.data[key] = self.build(**{k: self.graph.resolve(v) for k, v in self.arguments[key].items()})
+        self.graph.own(self, key, self.data[key])
+
+    def edit(self, key, **changes):
+        ''' re-create 'key' with some of its arguments changed, returns what was rebuilt because of it '''
+        return self.define(key, **dict(self.arguments[key], **changes))
+
     def get_list(self):
         return self.data.keys()
 
@@ -51,41 +173,71 @@ class CustomFactionBase():
         return self.data[key]
     
     def create_new(self, item, name, modifier):
-        self.update(self.modify(item, modifier), name)
+        return self.define(name, item=item, modifier=modifier)
 
 class CustomFactionModifiers(CustomFactionBase):
-    def __init__(self, descrip):
-        super().__init__(descrip)
+    def __init__(self, descrip, graph=None):
+        super().__init__(descrip, graph)
         self.data = copy.deepcopy(StandardModifiers)
+        for name, item in self.data.items():
+            self.graph.own(self, name, item)
 
     def create_new(self, nameargs, name):
         '''
             Here we assume nameargs only contains valid keys in the data dict.  This may be a big assumption. 
         '''
+        return self.define(name, modifiers=[ItemRef(self, k) for k in nameargs])
+
+    def build(self, modifiers):
         result = None
-        for k in nameargs:
-            mod = copy.deepcopy(self.get_item(k))
+        for mod in modifiers:
+            mod = copy.deepcopy(mod)
             if result is None:
                 result = mod
             else:
                 result *= mod
-        self.update(result, name)
+        return result
 
 class CustomFactionWeapons(CustomFactionBase):
     def create_new(self, range, attacks, skill, strength, ap, damage, descrip, modifier=None):
-        super().create_new(AStat(Range=range, A=attacks, BS_WS=skill, S=strength, AP=ap, D=damage, description=descrip), descrip, modifier)
+        return self.define(descrip, range=range, attacks=attacks, skill=skill, strength=strength, ap=ap, damage=damage, descrip=descrip, modifier=modifier)
+
+    def build(self, range, attacks, skill, strength, ap, damage, descrip, modifier=None):
+        return self.modify(AStat(Range=range, A=attacks, BS_WS=skill, S=strength, AP=ap, D=damage, description=descrip), modifier)
 
 class CustomFactionArmours(CustomFactionBase):
     def create_new(self, toughness, save, wounds, descrip, invuln=None, ignorewounds=None, modifier=None):
-        super().create_new(DStat(T=toughness, Sv=save, W=wounds, Inv=invuln, FNP=ignorewounds, description=descrip), descrip, modifier)
+        return self.define(descrip, toughness=toughness, save=save, wounds=wounds, descrip=descrip, invuln=invuln, ignorewounds=ignorewounds, modifier=modifier)
+
+    def build(self, toughness, save, wounds, descrip, invuln=None, ignorewounds=None, modifier=None):
+        return self.modify(DStat(T=toughness, Sv=save, W=wounds, Inv=invuln, FNP=ignorewounds, description=descrip), modifier)
 
 class CustomFactionModels(CustomFactionBase):
     def create_new(self, weapons, armour, name, pts=None, position=0, modifier=None):
-        super().create_new(Model(weapons=weapons, defence=armour, pts=pts, name=name, position=position), name, modifier)
+        return self.define(name, weapons=weapons, armour=armour, name=name, pts=pts, position=position, modifier=modifier)
+
+    def build(self, weapons, armour, name, pts=None, position=0, modifier=None):
+        return self.modify(Model(weapons=weapons, defence=armour, pts=pts, name=name, position=position), modifier)
 
 class CustomFactionUnits(CustomFactionBase):
     def create_new(self, model_list, name, modifier=None):
-        super().create_new(Unit(model_list=model_list, name=name), name=name, modifier=modifier)
+        return self.define(name, model_list=model_list, name=name, modifier=modifier)
+
+    def build(self, model_list, name, modifier=None):
+        return self.modify(Unit(model_list=model_list, name=name), modifier)
+
+class CustomFactionAnalyses(CustomFactionBase):
+    '''
+        perform_full_analysis results, kept until the attacker or defender they're for changes.
+        'cache' is a ResultCache (see result_cache.py) to read them from, or store them in, as well.
+    '''
+    def create_new(self, attacker, defender, name, count, pvalue, attacker_position=0, defender_position=0, engine='loop', rng=None, cache=None):
+        return self.define(name, attacker=attacker, defender=defender, name=name, count=count, pvalue=pvalue, attacker_position=attacker_position, defender_position=defender_position, engine=engine, rng=rng, cache=cache)
+
+    def build(self, attacker, defender, name, count, pvalue, attacker_position=0, defender_position=0, engine='loop', rng=None, cache=None):
+        attacker = update_position(attacker, attacker_position)
+        defender = update_position(defender, defender_position)
+        return perform_full_analysis(attacker=attacker, defender=defender, count=count, pvalue=pvalue, description=name, engine=engine, rng=rng, cache=cache)
 
 def run_tests():
     # let's make an Emperor's Champion 
@@ -180,6 +332,31 @@ def run_tests():
     result = perform_full_analysis(attacker=attacker, defender=defender, count=1000, pvalue=VERY_LIKELY_P_VALUE, description=f"\n{attacker}\n\nATTACKING\n\n{defender}\n")
     print(f"{result}")
 
+    # edits only rebuild, and re-analyse, what depends on them
+    Analyses = CustomFactionAnalyses("Analyses")
+    champ, squad = "The Emperor's Champion (sweep)", "Infantry Squad Lukas Special"
+    Analyses.create_new(attacker=Black_Templars_Units.get_item(champ), defender=IG_Units.get_item(squad), name="champ vs squad", count=1000, pvalue=VERY_LIKELY_P_VALUE, engine='batch', rng=7)
+    Analyses.create_new(attacker=IG_Units.get_item(squad), defender=Black_Templars_Units.get_item(champ), name="squad vs champ", count=1000, pvalue=VERY_LIKELY_P_VALUE, defender_position=12, engine='batch', rng=7)
+    squad_before = IG_Units.get_item(squad)
+    analysis_before = Analyses.get_item("champ vs squad")
+
+    rebuilt = Black_Templars_Weapons.edit("Black Sword (sweep)", attacks=12)
+    expected = [("Black Templar Models", "mdl The Emperor's Champion (sweep)"), ("Black Templar Units", champ), ("Analyses", "champ vs squad"), ("Analyses", "squad vs champ")]
+    print(f"editing a weapon rebuilds its model, unit and analyses: {sorted(rebuilt) == sorted(expected) and rebuilt[:2] == expected[:2]}")
+    print(f"the edit reaches the unit: {Black_Templars_Units.get_item(champ).models[0].weapons[0].attacks == 12}")
+    print(f"the other faction isn't rebuilt: {IG_Units.get_item(squad) is squad_before}")
+    direct = perform_full_analysis(attacker=update_position(Black_Templars_Units.get_item(champ), 0), defender=update_position(IG_Units.get_item(squad), 0), count=1000, pvalue=VERY_LIKELY_P_VALUE, description="direct", engine='batch', rng=7)
+    print(f"analysis re-run against the edited unit: {Analyses.get_item('champ vs squad') is not analysis_before and np.array_equal(Analyses.get_item('champ vs squad').damage_cdf, direct.damage_cdf)}")
+
+    rebuilt = IG_Armours.edit("Flak Armour", save=4)
+    print(f"editing an armour rebuilds the models wearing it: {sorted(name for _, name in rebuilt if _ == 'IG Models') == ['Guardsman Sgt w/Plasma Pistol (Super) Power Weapon', 'Guardsman w/Lasgun', 'Guardsman w/Plasma Gun (Super)']}")
+    print(f"...and the unit, once, however many of its models changed: {[name for _, name in rebuilt].count(squad) == 1}")
+    try:
+        Black_Templars_Units.edit(champ, model_list=[Black_Templars_Units.get_item(champ)])
+        print("an item can't be built from itself: False")
+    except ValueError as e:
+        print("an item can't be built from itself: True")
+
 # ==============================================================================================================
 # ==============================================================================================================
 if __name__ == "__main__":
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+from collections import Counter
+
+from math_hammer import Dice, determine_wound_roll, determine_save, apply_characteristic_op, enumerate_matchups, dice_rng
+from batch_engine import UnsupportedModifier, compile_plan, loop_attack_sequence
+
+'''
+Exact attack sequence, no Monte Carlo.
+
+Every die in the attack sequence is resolved independently of the others, once the characteristics are known.
+So instead of rolling, we enumerate every face of every die, run it through the compiled modifier ops
+(see compile_modifiers), and note which dice it pushes into the next pool.  The damage a die is worth is then the
+probability-weighted mix of the (convolved) damage of the dice it pushed, all the way down to the feel no pain roll.
+
+The only thing shared between dice in a trial is the characteristics, which the attacks sequence may modify
+once per attack dice (e.g. StrengthPlusOne).  We enumerate those outcomes too, and resolve the rest of the
+sequence once per distinct set of characteristics.
+
+A distribution is a pair of PMFs (damage used, damage wasted), index is the amount of damage.  We only ever
+need the marginals, as AnalysisResult looks at each on its own.
+'''
+
+# which sequence rolls the dice sitting in each pool
+POOL_CONSUMER = {'preamble': 'attacks', 'attacks': 'hit', 'hit': 'wound', 'wound': 'save', 'save': 'damage', 'damage': 'fnp'}
+# a die is (sides, bias, fixed, roll_count), a plain Dice() is
+FRESH_D6 = (6, 0, None, 0)
+NOTHING = (np.ones((1,)), np.ones((1,)))
+
+def convolve(a, b):
+    return (np.convolve(a[0], b[0]), np.convolve(a[1], b[1]))
+
+def mix(weighted):
+    ''' weighted is a list of (probability, distribution) '''
+    used = np.zeros((max(len(dist[0]) for _, dist in weighted),))
+    wasted = np.zeros((max(len(dist[1]) for _, dist in weighted),))
+    for prob, dist in weighted:
+        used[:len(dist[0])] += prob * dist[0]
+        wasted[:len(dist[1])] += prob * dist[1]
+    return used, wasted
+
+def power(dist, n):
+    ''' distribution of the sum of n independent copies of dist '''
+    result = NOTHING
+    while n > 0:
+        if n & 1:
+            result = convolve(result, dist)
+        dist = convolve(dist, dist)
+        n >>= 1
+    return result
+
+def dice_spec(item):
+    try:
+        if item.sides > 0:
+            pass
+    except Exception as e:
+        raise UnsupportedModifier(f"cannot enumerate dice with sides {item.sides}")
+    return (item.sides, item.bias, item.fixed_value, item.roll_count)
+
+def characteristic_specs(value):
+    ''' the dice the framework builds from an attacks or damage characteristic '''
+    if isinstance(value, Dice):
+        return [dice_spec(value)]
+    try:
+        return [dice_spec(item) for item in value]
+    except TypeError as e:
+        return [(6, 0, value, 0)]
+
+def faces(spec):
+    sides, bias, fixed, _ = spec
+    if fixed is not None:
+        return [(fixed, 1.0)]
+    return [(face + bias, 1.0 / sides) for face in range(1, sides + 1)]
+
+def apply_characteristic_ops(char, ops):
+    result = dict(char)
+    for op in ops:
+        result[op.characteristic] = apply_characteristic_op(op, result[op.characteristic], 1)
+    return result
+
+# =========================================================================== #
+class Resolution():
+    ''' what happened to a single die: dice pushed to other pools, characteristic modifiers run, attacks made '''
+    def __init__(self, pushes=(), applications=(), attacks=0):
+        self.pushes = pushes
+        self.applications = applications
+        self.attacks = attacks
+
+    def __add__(self, other):
+        return Resolution(self.pushes + other.pushes, self.applications + other.applications, self.attacks + other.attacks)
+
+class ExactResolver():
+    '''
+        Resolves dice for one set of characteristics.
+        char holds a snapshot of the characteristics as each sequence sees them.
+    '''
+    def __init__(self, ops, char):
+        self.ops = ops
+        self.char = char
+        self.threshold = {
+            'hit': char['hit']['skill'],
+            'wound': determine_wound_roll(char['wound']['strength'], char['wound']['toughness']),
+            'save': determine_save(char['save']['sv'], char['save']['invuln'], char['save']['armourpen']),
+        }
+        self.memo = {}
+
+    def run_chain(self, sequence, spec, unmodified, count):
+        '''
+            The modifier ops, then the standard postamble, for one roll of one die.
+            Returns the Resolution and whether the die is to be rolled again.
+        '''
+        char = self.char.get(sequence, self.char['save'])
+        threshold = self.threshold.get(sequence)
+        value = unmodified
+        pushes = []
+        applications = []
+        for op in self.ops[sequence]:
+            if op.kind == 'characteristic':
+                applications.append(op)
+            elif op.kind == 'roll':
+                value = apply_characteristic_op(op, value, 1)
+            elif op.kind == 'reroll':
+                if op.predicate == 'ones':
+                    hit = value == 1
+                elif op.predicate == 'less_than':
+                    hit = value < op.threshold
+                elif op.predicate == 'fails':
+                    hit = value < threshold
+                else:
+                    hit = value >= threshold
+                if hit and count < 2:
+                    return Resolution(tuple(pushes), tuple(applications)), True
+            elif op.kind == 'add_dice':
+                if op.critical is None or value >= char[op.critical]:
+                    if op.dice == 'd6':
+                        pushes += [(op.pool, FRESH_D6)] * op.amount
+                    elif op.dice == 'damage':
+                        pushes += [(op.pool, item) for item in characteristic_specs(char['damage'])]
+                    else: # the die that was just rolled
+                        pushes.append((op.pool, (spec[0], spec[1], spec[2], count)))
+                    if op.breaks:
+                        return Resolution(tuple(pushes), tuple(applications)), False
+            else:
+                raise UnsupportedModifier(f"unknown op {op}")
+
+        # postamble, see create_standard_attack_modifier_sequence
+        attacks = 0
+        if sequence == 'attacks':
+            attacks = value
+        elif sequence in ['hit', 'wound']:
+            clamped_roll = unmodified + min(max(value - unmodified, -1), 1)
+            if unmodified != 1 and (unmodified >= char['critical' + sequence] or clamped_roll >= threshold):
+                pushes.append((sequence, FRESH_D6))
+        elif sequence == 'save':
+            if unmodified == 1 or value < threshold:
+                pushes += [('save', item) for item in characteristic_specs(char['damage'])]
+        elif sequence == 'damage':
+            pushes.append(('damage', max(value, 0)))
+        return Resolution(tuple(pushes), tuple(applications), attacks), False
+
+    def outcomes(self, sequence, spec):
+        ''' every way a die can resolve, as a list of (probability, Resolution) '''
+        count = spec[3] + 1
+        if count > 2:
+            raise ValueError(f"Roll count reached {count}, which is illegal")
+        result = []
+        for face, prob in faces(spec):
+            resolution, rerolled = self.run_chain(sequence, spec, face, count)
+            if rerolled:
+                again = (spec[0], spec[1], spec[2], count)
+                result += [(prob * p, resolution + r) for p, r in self.outcomes(sequence, again)]
+            else:
+                result.append((prob, resolution))
+        return result
+
+    def value(self, pool, spec):
+        ''' distribution of the damage a die sitting in 'pool' will end up doing '''
+        key = (pool, spec)
+        if key not in self.memo:
+            if pool == 'damage':
+                self.memo[key] = self.feel_no_pain(spec)
+            else:
+                weighted = []
+                for prob, resolution in self.outcomes(POOL_CONSUMER[pool], spec):
+                    dist = NOTHING
+                    for push in resolution.pushes:
+                        dist = convolve(dist, self.value(*push))
+                    weighted.append((prob, dist))
+                self.memo[key] = mix(weighted)
+        return self.memo[key]
+
+    def feel_no_pain(self, damage):
+        ''' resolve_fnp_pool, for a damage roll of 'damage' '''
+        char = self.char['save']
+        thresh = char['fnp']
+        W = char['wounds']
+        tally = np.zeros((damage + 1,))
+        if thresh is None:
+            tally[damage] = 1.0
+        else:
+            p = len([face for face in range(1, 7) if face < thresh or face == 1]) / 6.0
+            for k in range(0, damage + 1):
+                tally[k] = math.comb(damage, k) * p**k * (1 - p)**(damage - k)
+        used = np.zeros((min(W, damage) + 1,))
+        wasted = np.zeros((max(0, damage - W) + 1,))
+        for k in range(0, damage + 1):
+            used[min(W, k)] += tally[k]
+            wasted[max(0, k - W)] += tally[k]
+        return used, wasted
+
+def exact_attack_sequence(defender: 'DStat', attacker: 'AStat'):
+    '''
+        Exact DStat.__sub__: returns the (used, wasted) damage PMFs of a single trial.
+        Raises UnsupportedModifier if either stat carries a modifier the state machine can't reproduce.
+    '''
+    plan = compile_plan(defender, attacker)
+    ops = plan.ops
+    char = plan.char
+
+    # the attacks sequence: how many attacks, and how often each characteristic modifier ran
+    # nothing else depends on the characteristics it modifies, so a resolver without them is fine here
+    attack_dist = {(0, ()): 1.0}
+    for spec in characteristic_specs(char['attacks']):
+        die_dist = {}
+        for prob, resolution in ExactResolver(ops, {'hit': char, 'wound': char, 'save': char}).outcomes('attacks', spec):
+            key = (resolution.attacks, tuple(sorted(resolution.applications, key=id)))
+            die_dist[key] = die_dist.get(key, 0.0) + prob
+        combined = {}
+        for (attacks_a, apps_a), prob_a in attack_dist.items():
+            for (attacks_b, apps_b), prob_b in die_dist.items():
+                key = (attacks_a + attacks_b, tuple(sorted(apps_a + apps_b, key=id)))
+                combined[key] = combined.get(key, 0.0) + prob_a * prob_b
+        attack_dist = combined
+
+    # group the outcomes by the characteristics they leave behind
+    weighted = []
+    per_attack = {}
+    for (attacks, applications), prob in attack_dist.items():
+        times = tuple(Counter(applications).items())
+        if times not in per_attack:
+            hit_char = dict(char)
+            for op, n in times:
+                hit_char[op.characteristic] = apply_characteristic_op(op, hit_char[op.characteristic], n)
+            wound_char = apply_characteristic_ops(hit_char, ops['strength'] + ops['toughness'])
+            save_char = apply_characteristic_ops(wound_char, ops['armourpen'] + ops['sv'] + ops['invuln'])
+            resolver = ExactResolver(ops, {'hit': hit_char, 'wound': wound_char, 'save': save_char})
+            per_attack[times] = resolver.value('attacks', FRESH_D6)
+        weighted.append((prob, power(per_attack[times], attacks)))
+    return mix(weighted)
+
+def sampled_distribution(used, wasted):
+    ''' empirical PMFs, for pairings we have to fall back to sampling for '''
+    return (np.bincount(used.astype(np.int64)) / len(used), np.bincount(wasted.astype(np.int64)) / len(wasted))
+
+def exact_loop(attacker, defender, count, rng=None):
+    '''
+        PMFs of damage used and damage wasted by a single 'defender - attacker'.
+        Pairings the exact engine can't reason about are sampled 'count' times instead, rolling from 'rng'.
+    '''
+    result = NOTHING
+    rng = dice_rng(rng)
+    attackers = attacker if type(attacker) is list else [attacker]
+    for att in attackers:
+        for dstat, astat in enumerate_matchups(att, defender):
+            try:
+                dist = exact_attack_sequence(dstat, astat)
+            except UnsupportedModifier as e:
+                dist = sampled_distribution(*loop_attack_sequence(dstat, astat, count, rng))
+            result = convolve(result, dist)
+    return result
@@ -2,6 +2,10 @@
 
 from math_hammer import AStat, DStat, Model, Unit, Dice
 from math_hammer import StandardModifiers
+from asset_registry import AssetRegistry
+
+assets = AssetRegistry(__file__)
+__getattr__ = assets.module_getattr
 
 Torrent = StandardModifiers["Torrent"]
 SustainedHits_1 = StandardModifiers["SustainedHits_1"]
@@ -10,7 +14,7 @@ PlusOneToHit = StandardModifiers["PlusOneToHit"]
 # ==================================================================================== #
 #       Imperial Guard assests
 # ==================================================================================== #
-leman_russ_tank = Model(
+assets.add('leman_russ_tank', lambda: Model(
     weapons=[
         AStat(Range=12,A=Dice(bias=3), BS_WS=4, S=10, AP=-1, D=3, description="Battle Cannon"),
         AStat(Range=12,A=Dice(sides=3), BS_WS=4, S=8, AP=-3, D=2, description="Plasma Cannon (supercharged)"),
@@ -20,8 +24,8 @@ leman_russ_tank = Model(
     ], 
     defence=DStat(T=11, Sv=2, W=13), 
     pts=170, name="Leman Russ Battle Tank"
-)
-chimera = Model(
+))
+assets.add('chimera', lambda: Model(
     weapons=[
         AStat(Range=12,A=Dice(), BS_WS=4, S=5, AP=-1, D=1, description="Chimera Heavy Flamer") * Torrent,
         AStat(Range=12,A=3, BS_WS=4, S=5, AP=-1, D=2, description="Heavy Bolter") * SustainedHits_1,
@@ -31,30 +35,29 @@ chimera = Model(
     ],
     defence=DStat(T=9, Sv=3, W=11),
     pts=70, name="Chimera"
-)
+))
 
 lasgun = AStat(Range=12,A=2, BS_WS=4, S=3, AP=0, D=1, description="lasgun, King of Weapons (rapid firing)" )
 laspistol = AStat(Range=12,A=1, BS_WS=4, S=3, AP=0, D=1, description="laspistol" )
 autocannon = AStat(Range=12,A=2, BS_WS=4, S=3, AP=0, D=1, description="Autocannon" )
 plasmagun = AStat(Range=12,A=2, BS_WS=4, S=8, AP=-3, D=2, description="Plasma Gun (rapid firing, supercharged)" )
-guardsmen_model = Model(weapons=lasgun, defence=DStat(T=3, Sv=5, W=1), pts=60/10, name="Guardsman")
-guardsmen_plasma_model = Model(weapons=plasmagun, defence=DStat(T=3, Sv=5, W=1), pts=60/10, name="Guardsman")
-guardsmen_sgt_model = Model(weapons=laspistol, defence=DStat(T=3, Sv=5, W=1), pts=60/10, name="Guardsman")
-guardsmen_hvy_autcannon_model = Model(weapons=autocannon, defence=DStat(T=3, Sv=5, W=2), pts=2*60/10, name="Heavy Weapons Team")
-guardsmen = Unit([
-    guardsmen_sgt_model,
-    guardsmen_hvy_autcannon_model, 
-    guardsmen_plasma_model,
-    guardsmen_plasma_model,
-    guardsmen_model,
-    guardsmen_model,
-    guardsmen_model,
-    guardsmen_model,
-    guardsmen_model,
-]) * PlusOneToHit
+assets.add('guardsmen_model', lambda: Model(weapons=lasgun, defence=DStat(T=3, Sv=5, W=1), pts=60/10, name="Guardsman"))
+assets.add('guardsmen_plasma_model', lambda: Model(weapons=plasmagun, defence=DStat(T=3, Sv=5, W=1), pts=60/10, name="Guardsman"))
+assets.add('guardsmen_sgt_model', lambda: Model(weapons=laspistol, defence=DStat(T=3, Sv=5, W=1), pts=60/10, name="Guardsman"))
+assets.add('guardsmen_hvy_autcannon_model', lambda: Model(weapons=autocannon, defence=DStat(T=3, Sv=5, W=2), pts=2*60/10, name="Heavy Weapons Team"))
+assets.add('guardsmen', lambda: Unit([
+    assets['guardsmen_sgt_model'],
+    assets['guardsmen_hvy_autcannon_model'], 
+    assets['guardsmen_plasma_model'],
+    assets['guardsmen_plasma_model'],
+    assets['guardsmen_model'],
+    assets['guardsmen_model'],
+    assets['guardsmen_model'],
+    assets['guardsmen_model'],
+    assets['guardsmen_model'],
+]) * PlusOneToHit)
 
 
-assets = {'leman_russ': leman_russ_tank,
-          'chimera': chimera,
-          'infantry_squad': guardsmen
-          }
\ No newline at end of file
+# short names
+assets.add('leman_russ', lambda: assets['leman_russ_tank'])
+assets.add('infantry_squad', lambda: assets['guardsmen'])
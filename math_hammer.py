@@ -1,11 +1,10 @@
 #!/usr/bin/env python
 
-import random
 import numpy as np
 import copy
+import time
+from collections import deque, namedtuple
 from enum import Enum
-import scipy
-import scipy.stats
 
 
 MELEE_WEAPON_RANGE = 0
@@ -35,12 +34,63 @@ def test_for_diceness(state, characteristic):
     return CharState.Int
 
 # =========================================================================== #
+# the pool each sequence takes its dice from, see AttackSequenceState.determine_pool_source
+POOL_SOURCE = {'attacks': 'preamble', 'hit': 'attacks', 'wound': 'hit', 'save': 'wound', 'damage': 'save', 'fnp': 'damage'}
+
+class ModifierOp():
+    '''
+        Declarative description of what a modifier functor does to the AttackSequenceState.
+        Functors only ever run one die at a time, engines that resolve many dice at once read this instead.
+            kind           - 'identity', 'assign', 'characteristic', 'roll', 'reroll' or 'add_dice'
+            sequence       - the roll the modifier looks at
+            characteristic - the state.char entry it assigns or modifies
+            amount         - value assigned, added to the characteristic or roll, or number of dice added
+            minimum        - floor applied after the change
+            maximum        - ceiling applied after the change
+            predicate      - which rolls get rerolled: 'ones', 'fails', 'successes' or 'less_than' (threshold)
+            critical       - if set, the modifier only applies when the roll is at least state.char[critical]
+            pool           - the pool dice are added to
+            dice           - the dice added: 'd6', 'damage' (per the damage characteristic) or 'roll' (the die just rolled)
+            breaks         - sets break_mod_loop, i.e. no further modifiers run for this die
+    '''
+    def __init__(self, kind, sequence=None, characteristic=None, amount=None, minimum=None, maximum=None, predicate=None, threshold=None, critical=None, pool=None, dice=None, breaks=False):
+        self.kind = kind
+        self.sequence = sequence
+        self.characteristic = characteristic
+        self.amount = amount
+        self.minimum = minimum
+        self.maximum = maximum
+        self.predicate = predicate
+        self.threshold = threshold
+        self.critical = critical
+        self.pool = pool
+        self.dice = dice
+        self.breaks = breaks
+
+    def gated(self, sequence):
+        ''' the same op, applied only on a critical roll of 'sequence' '''
+        result = copy.copy(self)
+        result.sequence = sequence
+        result.critical = 'critical' + sequence
+        return result
+
+    def __str__(self):
+        fields = {k: v for k, v in vars(self).items() if v is not None and v is not False and k != 'kind'}
+        return f"{self.kind}({', '.join(f'{k}={v}' for k, v in fields.items())})"
+
+def declare(functor, op):
+    ''' attach the declarative description to a modifier functor '''
+    functor.op = op
+    return functor
+
 ## more complicated stuff, or faction specific, or USR specific
 def modifier_critical_case(sequence, thing_to_do):
     def functor(state):
         if state.roll[sequence].value >= state.char['critical'+sequence]:
             state = thing_to_do(state)
         return state
+    if hasattr(thing_to_do, 'op'):
+        functor = declare(functor, thing_to_do.op.gated(sequence))
     return functor
 
 def modifier_sustained_hits(X):
@@ -49,6 +99,7 @@ def modifier_sustained_hits(X):
         for _ in range(0,X):
             state.pool['hit'].append(Dice())
         return state
+    functor = declare(functor, ModifierOp('add_dice', amount=X, pool='hit', dice='d6'))
     return modifier_critical_case('hit', functor)
 def modifier_lethal_hits():
     def functor(state):
@@ -58,6 +109,7 @@ def modifier_lethal_hits():
         state.scratch['break_mod_loop'] = True
         state.pool['wound'].append(Dice())
         return state
+    functor = declare(functor, ModifierOp('add_dice', amount=1, pool='wound', dice='d6', breaks=True))
     return modifier_critical_case('hit', functor)
 def modifier_devastating_wounds():
     def functor(state):
@@ -73,6 +125,7 @@ def modifier_devastating_wounds():
             raise ValueError("Impossible save pool state")
         state.scratch['break_mod_loop'] = True
         return state
+    functor = declare(functor, ModifierOp('add_dice', pool='save', dice='damage', breaks=True))
     return modifier_critical_case('wound', functor)
 
 ## basic stuff
@@ -85,24 +138,24 @@ def modifier_characteristic_subtract_one(sequence):
             state.char[sequence] -= 1
             state.char[sequence] = max(state.char[sequence], 1)
         return state
-    return functor
+    return declare(functor, ModifierOp('characteristic', characteristic=sequence, amount=-1, minimum=None if sequence == 'armourpen' else 1))
 def modifier_characteristic_add_one(sequence):
     def functor(state):
         state.char[sequence] += 1
         return state
-    return functor
+    return declare(functor, ModifierOp('characteristic', characteristic=sequence, amount=+1))
 def modifier_roll_subtract_one(sequence):
     def functor(state):
         state.roll[sequence].value -= 1
         state.roll[sequence].value = max(state.roll[sequence].value, 1)
         return state
-    return functor
+    return declare(functor, ModifierOp('roll', sequence=sequence, amount=-1, minimum=1))
 def modifier_roll_add_one(sequence):
     def functor(state):
         state.roll[sequence].value += 1
         state.roll[sequence].value = min(state.roll[sequence].value, 6)
         return state
-    return functor
+    return declare(functor, ModifierOp('roll', sequence=sequence, amount=+1, maximum=6))
 def modifier_reroll_ones(sequence):
     def functor(state):
         if state.roll[sequence].value == 1 and state.roll[sequence].roll_count < 2:
@@ -110,7 +163,7 @@ def modifier_reroll_ones(sequence):
             state.pool[source].append(state.roll[sequence])
             state.scratch['break_mod_loop'] = True
         return state
-    return functor
+    return declare(functor, ModifierOp('reroll', sequence=sequence, predicate='ones', pool=POOL_SOURCE[sequence], breaks=True))
 def modifier_reroll_fails(sequence):
     def functor(state):
         if state.roll[sequence].value < state.determine_threshold(sequence) and state.roll[sequence].roll_count < 2:
@@ -118,7 +171,7 @@ def modifier_reroll_fails(sequence):
             state.pool[source].append(state.roll[sequence])
             state.scratch['break_mod_loop'] = True
         return state
-    return functor
+    return declare(functor, ModifierOp('reroll', sequence=sequence, predicate='fails', pool=POOL_SOURCE[sequence], breaks=True))
 def modifier_reroll_successes(sequence):
     def functor(state):
         if state.roll[sequence].value >= state.determine_threshold(sequence) and state.roll[sequence].roll_count < 2:
@@ -126,7 +179,7 @@ def modifier_reroll_successes(sequence):
             state.pool[source].append(state.roll[sequence])
             state.scratch['break_mod_loop'] = True
         return state
-    return functor
+    return declare(functor, ModifierOp('reroll', sequence=sequence, predicate='successes', pool=POOL_SOURCE[sequence], breaks=True))
 def modifier_reroll_if_less_than(sequence, threshold):
     def functor(state):
         if state.roll[sequence].value < threshold and state.roll[sequence].roll_count < 2:
@@ -134,48 +187,114 @@ def modifier_reroll_if_less_than(sequence, threshold):
             state.pool[source].append(state.roll[sequence])
             state.scratch['break_mod_loop'] = True
         return state
-    return functor
+    return declare(functor, ModifierOp('reroll', sequence=sequence, predicate='less_than', threshold=threshold, pool=POOL_SOURCE[sequence], breaks=True))
 def modifier_always_succeed(sequence):
     def functor(state):
-        state.pool[sequence].append(copy.deepcopy(state.roll[sequence]))
+        state.pool[sequence].append(state.roll[sequence].clone())
         state.scratch['break_mod_loop'] = True
         return state
-    return functor
+    return declare(functor, ModifierOp('add_dice', sequence=sequence, pool=sequence, dice='roll', breaks=True))
 
 
 
 # =========================================================================== #
+class DiceRNG():
+    '''
+        random.randint, backed by a numpy.random.Generator.  A Generator call per die is slow, so the
+        uniforms are drawn a block at a time.  'seed' is anything np.random.default_rng accepts.
+    '''
+    BLOCK = 4096
+
+    def __init__(self, seed=None):
+        self.generator = np.random.default_rng(seed)
+        self.block = []
+        self.pos = 0
+
+    def randint(self, low, high):
+        if self.pos >= len(self.block):
+            self.block = self.generator.random(self.BLOCK).tolist()
+            self.pos = 0
+        uniform = self.block[self.pos]
+        self.pos += 1
+        return low + int(uniform * (high - low + 1))
+
+def dice_rng(rng=None):
+    ''' a DiceRNG for 'rng', which is a DiceRNG, a seed, or None for the shared default stream '''
+    if rng is None:
+        return DEFAULT_DICE_RNG
+    if isinstance(rng, DiceRNG):
+        return rng
+    return DiceRNG(rng)
+
+def seed_sequence(rng=None):
+    '''
+        A SeedSequence to spawn child streams from.  'rng' is an int seed, a SeedSequence, a Generator or
+        DiceRNG (which we draw the entropy from), or None for fresh entropy.
+    '''
+    if isinstance(rng, np.random.SeedSequence):
+        return rng
+    if isinstance(rng, DiceRNG):
+        rng = rng.generator
+    if isinstance(rng, np.random.Generator):
+        return np.random.SeedSequence(rng.integers(2**63, size=4))
+    return np.random.SeedSequence(rng)
+
+# used by anything rolled without an explicit RNG, e.g. a bare 'defender - attacker'
+DEFAULT_DICE_RNG = DiceRNG()
+
+# an immutable copy of what a Dice showed, see Dice.snapshot
+Roll = namedtuple('Roll', ['value', 'roll_count'])
+
 class Dice():
     '''
         'sides' can also be a list of integers, in which case we are 
         rolling multiple "dice" but to the framework, it's only a single 
         rerollable "thing".
+        'value' is an int for a single die, a list of ints (one per die) otherwise.
     '''
+    __slots__ = ('roll_count', 'sides', 'fixed_value', 'value', 'bias', 'multiple')
+
     def __init__(self, sides=6, fixed=None, bias=0):
         self.roll_count = 0
         self.sides = sides
         self.fixed_value = fixed
-        try: # self.sides is a list
-            if self.fixed_value is not None:
-                self.value = [self.fixed_value for _ in self.sides]
-            else:
-                self.value = [None for _ in self.sides]
-        except Exception as e: # self.sides is an int
-            self.value = None if self.fixed_value is None else self.fixed_value
+        self.multiple = hasattr(sides, '__len__')
+        if self.multiple:
+            self.value = [self.fixed_value for _ in self.sides]
+        else:
+            self.value = self.fixed_value
         self.bias = bias
     
-    def roll(self):
+    def roll(self, rng=None):
+        rng = DEFAULT_DICE_RNG if rng is None else rng
         self.roll_count += 1
-        try: # self.sides is a list
-            for idx, sides in enumerate(self.sides):
-                if self.fixed_value is None:
-                    self.value[idx] = random.randint(1,sides) + self.bias
-        except Exception as e: # self.sides is an int
-            if self.fixed_value is None:
-                self.value = random.randint(1,self.sides) + self.bias
+        if self.fixed_value is None:
+            if self.multiple:
+                self.value = [rng.randint(1,sides) + self.bias for sides in self.sides]
+            else:
+                self.value = rng.randint(1,self.sides) + self.bias
         if self.roll_count > 2:
             raise ValueError(f"Roll count reached {self.roll_count}, which is illegal")
         return self
+
+    def clone(self):
+        '''
+            A copy to roll, leaving this one untouched.  Pools hold the characteristic dice themselves
+            (e.g. the damage Dice), so whatever comes out of a pool gets cloned before it's rolled.
+        '''
+        result = Dice.__new__(Dice)
+        result.roll_count = self.roll_count
+        result.sides = self.sides # never modified, so safe to share
+        result.fixed_value = self.fixed_value
+        result.multiple = self.multiple
+        result.value = list(self.value) if self.multiple else self.value
+        result.bias = self.bias
+        return result
+
+    def snapshot(self):
+        ''' what the dice is showing right now, as a Roll '''
+        value = tuple(self.value) if self.multiple else self.value
+        return Roll(value, self.roll_count)
     
     def __str__(self):
         result = f"D{self.sides}"
@@ -204,8 +323,8 @@ def determine_save(save, invuln, armourpen):
 class AttackSequenceState():
     def __init__(self):
         self.scratch = {} # for, you know, whatever
-        # Pools are lists of Dice.  These dice move to the next pool when success is marked
-        self.pool = {'preamble': [], 'attacks': [], 'hit': [], 'wound': [], 'save': [], 'damage': []}
+        # Pools are queues of Dice.  These dice move to the next pool when success is marked
+        self.pool = {'preamble': deque(), 'attacks': deque(), 'hit': deque(), 'wound': deque(), 'save': deque(), 'damage': deque()}
         # Roll is the current dice being rolled.
         self.roll = {'attacks': None, 'hit': None, 'wound': None, 'save': None, 'damage': None, 'fnp': None}
         # attacker and defender fill in these when asked
@@ -236,6 +355,30 @@ class AttackSequenceState():
             'fnp': None}
         self.scratch['actual_damage_used'] = []
         self.scratch['damage_wasted'] = []
+        self.initial_char = dict(self.char)
+        # where the dice rolls come from, see DiceRNG
+        self.rng = DEFAULT_DICE_RNG
+
+    def reset(self):
+        '''
+            Back to how __init__ left it, reusing the containers.  Lets one state serve every trial of a loop.
+        '''
+        used = self.scratch['actual_damage_used']
+        wasted = self.scratch['damage_wasted']
+        used.clear()
+        wasted.clear()
+        self.scratch.clear()
+        self.scratch['actual_damage_used'] = used
+        self.scratch['damage_wasted'] = wasted
+        for pool in self.pool.values():
+            pool.clear()
+        for key in self.roll:
+            self.roll[key] = None
+        self.char.clear()
+        self.char.update(self.initial_char)
+        for key in self.threshold:
+            self.threshold[key] = None
+        return self
 
     def __str__(self):
         result = f"pool: {self.pool}\n" + f"roll: {self.roll}\n" + f"char: {self.char}\n" + f"threshold: {self.threshold}"
@@ -272,21 +415,10 @@ class AttackSequenceState():
         return determine_save(self.threshold['sv'], self.threshold['invuln'], self.threshold['armourpen'])
 
     def determine_pool_source(self, sequence):
-        if sequence == 'attacks':
-            return 'preamble'
-        if sequence == 'hit':
-            return 'attacks'
-        if sequence == 'wound':
-            return 'hit'
-        if sequence == 'save':
-            return 'wound'
-        if sequence == 'damage':
-            return 'save'
-        if sequence == 'fnp':
-            return 'damage'
+        return POOL_SOURCE.get(sequence)
 
 def identity():
-    return lambda x: x
+    return declare(lambda x: x, ModifierOp('identity'))
 
 def create_standard_attack_modifier_sequence():
     def clamp_the_roll_modifier(unmodified, modified):
@@ -413,20 +545,74 @@ def create_standard_attack_modifier_sequence():
 
     # the keys are, basically, the steps in the state machine.
     # the values are the last action to take
-    post = {'preamble': [intialize_handler],
-            'attacks': [resolve_attack_pool], 
-            'hit': [resolve_hit_pool],
-            'strength': [assign_strength],
-            'toughness': [assign_toughness],
-            'wound': [resolve_wound_pool], 
-            'armourpen': [assign_armourpen],
-            'sv': [assign_sv],
-            'invuln': [assign_invuln],
-            'save': [resolve_save_pool],
-            'damage': [resolve_damage_pool],
-            'fnp': [resolve_fnp_pool] }
+    # tuples, as the AStat and DStat stacks they get appended to are
+    post = {'preamble': (intialize_handler,),
+            'attacks': (resolve_attack_pool,), 
+            'hit': (resolve_hit_pool,),
+            'strength': (assign_strength,),
+            'toughness': (assign_toughness,),
+            'wound': (resolve_wound_pool,), 
+            'armourpen': (assign_armourpen,),
+            'sv': (assign_sv,),
+            'invuln': (assign_invuln,),
+            'save': (resolve_save_pool,),
+            'damage': (resolve_damage_pool,),
+            'fnp': (resolve_fnp_pool,) }
     return post 
 
+# the standard sequence holds no state of its own, so every trial can share the one copy
+STANDARD_ATTACK_SEQUENCE = create_standard_attack_modifier_sequence()
+
+class StageProfile():
+    '''
+        Where the time goes, per stage of the attack sequence (see DStat.attack, and the batch engine), and per phase
+        of an analysis (sampling, statistics, ...).  Per stage we count:
+            seconds   wall time spent in the stage
+            dice      dice rolled, rerolls included
+            rerolls   dice rolled a second time
+            max_pool  the most dice waiting in the stage's pool, at the start of the stage
+            modifiers modifier invocations, the standard postamble included (the batch engine counts an op once per
+                      pass over the pool, not once per die)
+        Only pass one in when you want it, the attack sequence takes a separate, instrumented path when you do.
+        'sequences' counts attack sequences, one per trial per weapon.
+    '''
+    def __init__(self):
+        self.sequences = 0
+        self.stages = {}
+        self.phases = {}
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = {'seconds': 0.0, 'dice': 0, 'rerolls': 0, 'max_pool': 0, 'modifiers': 0}
+        return self.stages[name]
+
+    def phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def merge(self, other):
+        ''' fold in the counters of another StageProfile, e.g. from a worker process '''
+        self.sequences += other.sequences
+        for name, counters in other.stages.items():
+            stage = self.stage(name)
+            for key, value in counters.items():
+                stage[key] = max(stage[key], value) if key == 'max_pool' else stage[key] + value
+        for name, seconds in other.phases.items():
+            self.phase(name, seconds)
+        return self
+
+    def report(self):
+        ''' a plain dict of the counters, see format_stage_report '''
+        return {'sequences': self.sequences, 'stages': copy.deepcopy(self.stages), 'phases': dict(self.phases)}
+
+def format_stage_report(report):
+    result = f"{report['sequences']} attack sequences"
+    result += f"\n    {'stage':10s} {'seconds':>9s} {'dice':>10s} {'rerolls':>9s} {'max pool':>9s} {'modifiers':>10s}"
+    for name, stage in report['stages'].items():
+        result += f"\n    {name:10s} {stage['seconds']:9.4f} {stage['dice']:10d} {stage['rerolls']:9d} {stage['max_pool']:9d} {stage['modifiers']:10d}"
+    for name, seconds in report['phases'].items():
+        result += f"\n    {name:10s} {seconds:9.4f}"
+    return result
+
 def assign_char(phase_str, value):
     def fun(state):
         if state.char[phase_str] is None:
@@ -434,22 +620,180 @@ def assign_char(phase_str, value):
         else:
             state.char[phase_str] += value
         return state
-    return fun
+    return declare(fun, ModifierOp('assign', characteristic=phase_str, amount=value))
+
+class ValueObject():
+    '''
+        Base for the immutable value types: AStat, DStat, Model and Modifier.  Their attributes are set in __init__,
+        after freeze() any assignment raises.  Applying a modifier builds a new object that shares every part that
+        didn't change with the old one (the functors, the Dice, untouched modifier stacks), rather than copying it.
+
+        'derived' remembers what it built, so the same stat times the same modifier is the same object.  The ten
+        models of a unit that share a weapon profile still share one after the unit is modified.
+    '''
+    def freeze(self):
+        object.__setattr__(self, '_derived', {})
+        object.__setattr__(self, '_frozen', True)
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen', False):
+            raise AttributeError(f"{type(self).__name__} is immutable, '{name}' can't be set")
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable, '{name}' can't be deleted")
+
+    def replace(self, **changes):
+        ''' a copy with 'changes' made to it, sharing everything else '''
+        result = object.__new__(type(self))
+        result.__dict__.update(self.__dict__)
+        result.__dict__.update(changes)
+        result.__dict__['_derived'] = {}
+        return result
+
+    def derived(self, key, build):
+        '''
+            build(), or what it returned the last time it was called with 'key'.  'key' is an object, or a tuple of
+            them, that's held on to so its id can't be reused.
+        '''
+        ident = tuple(id(k) for k in key) if type(key) is tuple else id(key)
+        if ident not in self._derived:
+            self._derived[ident] = (key, build())
+        return self._derived[ident][1]
+
+    def __getstate__(self):
+        # what was derived is rebuilt on demand, no need to pickle (or deepcopy) it
+        return {k: v for k, v in self.__dict__.items() if k != '_derived'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__['_derived'] = {}
 
-class Modifier():
+class Modifier(ValueObject):
     def __init__(self, sequence, functor, id=None):
-        self.seq = [sequence]
-        self.func = [functor]
-        self.id = [id]
+        self.seq = (sequence,)
+        self.func = (functor,)
+        self.id = (id,)
+        # declarative description of each functor, None if it only exists as a closure
+        self.op = (getattr(functor, 'op', None),)
+        self.freeze()
 
     def __mul__(self, other):
-        result = copy.deepcopy(self)
-        result.seq += other.seq
-        result.func += other.func
-        result.id += other.id
-        return result
+        return self.derived(other, lambda: self.replace(seq=self.seq + other.seq, func=self.func + other.func, id=self.id + other.id, op=self.op + other.op))
+
+class ModifierPlan():
+    '''
+        The AStat.modifiers and DStat.modifiers stacks for one attack sequence, compiled from the ModifierOp
+        descriptions, for engines that can't call the functors one die at a time.
+            char        - the characteristics as they stand after the preamble
+            ops         - per sequence, the ModifierOps in the order DStat.__sub__ would call them.  The
+                          standard postamble isn't included, engines are expected to implement it themselves.
+            unsupported - reasons the stacks can't be run by a batched or exact engine.  If not empty, the
+                          sequence has to be resolved with the functors (DStat.__sub__) instead.
+    '''
+    def __init__(self, char, sequences):
+        self.char = char
+        self.ops = {seq: [] for seq in sequences}
+        self.unsupported = []
+
+    def is_supported(self):
+        return len(self.unsupported) == 0
+
+# sequences that roll dice, in the order they fill their pools
+DICE_SEQUENCES = ['attacks', 'hit', 'wound', 'save', 'damage', 'fnp']
+# sequences a characteristic modifier may run in, i.e. where nothing reads the characteristic while it runs
+CHARACTERISTIC_SEQUENCES = ['preamble', 'attacks', 'strength', 'toughness', 'armourpen', 'sv', 'invuln']
+
+def compile_modifiers(defender, attacker):
+    '''
+        Compile the modifiers of a DStat - AStat attack sequence into a ModifierPlan.
+    '''
+    postamble = create_standard_attack_modifier_sequence()
+    plan = ModifierPlan(AttackSequenceState().char, list(postamble.keys()))
+
+    def check(op, sequence):
+        if op is None:
+            return "modifier without a declarative form"
+        if op.kind == 'identity':
+            return None
+        if op.kind == 'assign':
+            return None if sequence == 'preamble' else "assign outside of the preamble"
+        if op.kind == 'characteristic':
+            if sequence not in CHARACTERISTIC_SEQUENCES:
+                return f"characteristic modifier in the '{sequence}' sequence"
+            if type(plan.char.get(op.characteristic)) is not int:
+                return f"characteristic modifier on non-int '{op.characteristic}'"
+            return None
+        if sequence not in DICE_SEQUENCES or sequence == 'fnp' or op.sequence != sequence:
+            return f"'{op.kind}' modifier on the '{op.sequence}' roll in the '{sequence}' sequence"
+        if op.kind == 'reroll':
+            if op.predicate in ['fails', 'successes'] and sequence not in ['hit', 'wound', 'save']:
+                return f"no threshold to reroll against in the '{sequence}' sequence"
+        if op.kind == 'add_dice':
+            if sequence not in ['hit', 'wound']:
+                return f"dice added in the '{sequence}' sequence"
+            # dice may only go to a pool this sequence (or a later one) fills, else they'd be rolled mid-sequence
+            if op.dice not in ['d6', 'damage', 'roll'] or DICE_SEQUENCES.index(op.pool) < DICE_SEQUENCES.index(sequence):
+                return f"'{op.dice}' dice added to the '{op.pool}' pool in the '{sequence}' sequence"
+            if (op.dice == 'damage') != (op.pool == 'save'):
+                return f"'{op.dice}' dice added to the '{op.pool}' pool"
+        return None
+
+    for sequence in postamble.keys():
+        for modifier in defender.modifiers[sequence] + attacker.modifiers[sequence]:
+            op = getattr(modifier, 'op', None)
+            reason = check(op, sequence)
+            if reason is not None:
+                plan.unsupported.append(reason)
+                continue
+            if op.kind == 'identity':
+                continue
+            if op.kind == 'assign':
+                current = plan.char[op.characteristic]
+                plan.char[op.characteristic] = op.amount if current is None else current + op.amount
+            elif sequence == 'preamble':
+                plan.char[op.characteristic] = apply_characteristic_op(op, plan.char[op.characteristic], 1)
+            else:
+                plan.ops[sequence].append(op)
+    return plan
+
+def apply_characteristic_op(op, value, times):
+    '''
+        A 'characteristic' or 'roll' ModifierOp, run 'times' times (times may be an array, as may value).
+        Runs of a clamped op collapse into a single clamp.
+    '''
+    result = value + op.amount * times
+    if op.minimum is not None:
+        result = np.maximum(result, op.minimum)
+    if op.maximum is not None:
+        result = np.minimum(result, op.maximum)
+    if np.ndim(times) == 0:
+        if times <= 0:
+            return value
+        return int(result) if np.ndim(result) == 0 else result
+    return np.where(times > 0, result, value)
+
+# the stateless do-nothing stack every AStat and DStat starts out with, so they can all share it
+IDENTITY_STACK = (identity(),)
+
+def stack_modifier(stat, other):
+    '''
+        stat * other, for an AStat or DStat.  The new stat shares everything with 'stat' but the stacks 'other' adds to.
+    '''
+    def build():
+        modifiers = dict(stat.modifiers)
+        modifiers_ids = dict(stat.modifiers_ids)
+        try:
+            for mod, seq, id in zip(other.func, other.seq, other.id):
+                modifiers[seq] += (mod,)
+                modifiers_ids[seq] += (id,)
+        except Exception as e:
+            modifiers[other.seq] += (other.func,)
+            modifiers_ids[other.seq] += (other.id,)
+        return stat.replace(modifiers=modifiers, modifiers_ids=modifiers_ids)
+    return stat.derived(other, build)
 
-class AStat():
+class AStat(ValueObject):
     def __init__(self, A, BS_WS, S, AP, D, Range, description="AStat"):
         self.attacks = A
         self.skill = BS_WS
@@ -460,49 +804,42 @@ class AStat():
         self.description = description
 
         # we only interact with the .char field
-        self.modifiers = {'preamble': [assign_char('attacks', self.attacks), assign_char('damage', self.damage), assign_char('strength', self.strength), assign_char('armourpen', self.armourpen), assign_char('skill', self.skill)],
-                          'attacks': [identity()],
-                          'hit': [identity()], 
-                          'strength': [identity()],
-                          'toughness': [identity()],
-                          'wound': [identity()], 
-                          'armourpen': [identity()],
-                          'invuln': [identity()], 
-                          'sv': [identity()], 
-                          'save': [identity()], 
-                          'damage': [identity()],
-                          'fnp': [identity()]}
+        self.modifiers = {'preamble': (assign_char('attacks', self.attacks), assign_char('damage', self.damage), assign_char('strength', self.strength), assign_char('armourpen', self.armourpen), assign_char('skill', self.skill)),
+                          'attacks': IDENTITY_STACK,
+                          'hit': IDENTITY_STACK, 
+                          'strength': IDENTITY_STACK,
+                          'toughness': IDENTITY_STACK,
+                          'wound': IDENTITY_STACK, 
+                          'armourpen': IDENTITY_STACK,
+                          'invuln': IDENTITY_STACK, 
+                          'sv': IDENTITY_STACK, 
+                          'save': IDENTITY_STACK, 
+                          'damage': IDENTITY_STACK,
+                          'fnp': IDENTITY_STACK}
         # solely for stringifying (json serialization)
         self.modifiers_ids = {
-                'preamble': [],
-                'attacks': [],
-                'hit': [], 
-                'strength': [],
-                'toughness': [],
-                'wound': [], 
-                'armourpen': [],
-                'invuln': [], 
-                'sv': [], 
-                'save': [], 
-                'damage': [],
-                'fnp': []}
+                'preamble': (),
+                'attacks': (),
+                'hit': (), 
+                'strength': (),
+                'toughness': (),
+                'wound': (), 
+                'armourpen': (),
+                'invuln': (), 
+                'sv': (), 
+                'save': (), 
+                'damage': (),
+                'fnp': ()}
+        self.freeze()
 
 
     def __mul__(self, other: Modifier):
-        result = copy.deepcopy(self)
-        try:
-            for mod, seq, id in zip(other.func, other.seq, other.id):
-                result.modifiers[seq].append(mod)
-                result.modifiers_ids[seq].append(id)
-        except Exception as e:
-            result.modifiers[other.seq].append(other.func)
-            result.modifiers_ids[other.seq].append(other.id)
-        return result
+        return stack_modifier(self, other)
 
     def __str__(self):
         return f"{self.description}(R:{self.range} A:{self.attacks} BS_WS:{self.skill} S:{self.strength} AP:{self.armourpen} D:{self.damage})"
     
-class DStat():
+class DStat(ValueObject):
     def __init__(self, T, Sv, W, Inv=None, FNP=None, description="DStat"):
         self.toughness = T
         self.save = Sv
@@ -512,32 +849,33 @@ class DStat():
         self.description = description
 
         # we only interact with the .char field
-        self.modifiers = {'preamble': [assign_char('toughness', self.toughness), assign_char('invuln', self.invuln), assign_char('sv', self.save), assign_char('fnp', self.feelnopain), assign_char('wounds', self.wounds)],
-                          'attacks': [identity()], 
-                          'hit': [identity()], 
-                          'strength': [identity()],
-                          'toughness': [identity()],
-                          'wound': [identity()], 
-                          'armourpen': [identity()],
-                          'invuln': [identity()], 
-                          'sv': [identity()], 
-                          'save': [identity()],
-                          'damage': [identity()],
-                          'fnp': [identity()]}
+        self.modifiers = {'preamble': (assign_char('toughness', self.toughness), assign_char('invuln', self.invuln), assign_char('sv', self.save), assign_char('fnp', self.feelnopain), assign_char('wounds', self.wounds)),
+                          'attacks': IDENTITY_STACK, 
+                          'hit': IDENTITY_STACK, 
+                          'strength': IDENTITY_STACK,
+                          'toughness': IDENTITY_STACK,
+                          'wound': IDENTITY_STACK, 
+                          'armourpen': IDENTITY_STACK,
+                          'invuln': IDENTITY_STACK, 
+                          'sv': IDENTITY_STACK, 
+                          'save': IDENTITY_STACK,
+                          'damage': IDENTITY_STACK,
+                          'fnp': IDENTITY_STACK}
         # solely for stringifying (json serialization)
         self.modifiers_ids = {
-                'preamble': [],
-                'attacks': [],
-                'hit': [], 
-                'strength': [],
-                'toughness': [],
-                'wound': [], 
-                'armourpen': [],
-                'invuln': [], 
-                'sv': [], 
-                'save': [], 
-                'damage': [],
-                'fnp': []}
+                'preamble': (),
+                'attacks': (),
+                'hit': (), 
+                'strength': (),
+                'toughness': (),
+                'wound': (), 
+                'armourpen': (),
+                'invuln': (), 
+                'sv': (), 
+                'save': (), 
+                'damage': (),
+                'fnp': ()}
+        self.freeze()
 
     def __str__(self):
         result = f"{self.description}(T:{self.toughness} Sv:{self.save}+"
@@ -550,81 +888,141 @@ class DStat():
 
 
     def __mul__(self, other: Modifier):
-        result = copy.deepcopy(self)
-        try:
-            for mod, seq, id in zip(other.func, other.seq, other.id):
-                result.modifiers[seq].append(mod)
-                result.modifiers_ids[seq].append(id)
-        except Exception as e:
-            result.modifiers[other.seq].append(other.func)
-            result.modifiers_ids[other.seq].append(other.id)
-        return result
+        return stack_modifier(self, other)
 
     def __sub__(self, attacker: AStat):
+        return self.attack(attacker)
+
+    def attack(self, attacker: AStat, state=None, rng=None, profile=None):
+        '''
+            A single trial of self - attacker.  Pass in 'state' to have it reset and reused, rather than allocating a new one.
+            'rng' is a DiceRNG or a seed, see dice_rng.  Pass the same DiceRNG to every trial of a loop.
+            'profile' is a StageProfile to count into, see attack_profiled.
+        '''
         if type(attacker) is not AStat:
             raise ValueError("RHS must be an attacking statistic")
 
         # resolve standard modifiers
-        state = AttackSequenceState()
+        state = AttackSequenceState() if state is None else state.reset()
+        state.rng = dice_rng(rng)
         state.scratch['break_mod_loop'] = False
-        postamble = create_standard_attack_modifier_sequence()
+        if profile is not None:
+            return self.attack_profiled(attacker, state, profile)
+        postamble = STANDARD_ATTACK_SEQUENCE
         for sequence in postamble.keys():
+            modifiers = self.modifiers[sequence] + attacker.modifiers[sequence] + postamble[sequence]
             if sequence in state.roll:
-                pool_source = state.determine_pool_source(sequence)
-                while len(state.pool[pool_source]) > 0:
+                pool = state.pool[state.determine_pool_source(sequence)]
+                while len(pool) > 0:
                     # remove the dice from the pool, roll it, then apply any applicable modifiers
-                    the_dice = copy.deepcopy(state.pool[pool_source][0])
-                    state.pool[pool_source] = state.pool[pool_source][1:]
-                    state.scratch['unmodified_roll'] = copy.deepcopy(the_dice.roll())
-                    state.roll[sequence] = copy.deepcopy(state.scratch['unmodified_roll'])
-                    for modifier in self.modifiers[sequence] + attacker.modifiers[sequence] + postamble[sequence]:
+                    state.roll[sequence] = pool.popleft().clone().roll(state.rng)
+                    state.scratch['unmodified_roll'] = state.roll[sequence].snapshot()
+                    for modifier in modifiers:
                         state = modifier(state)
                         if state.scratch['break_mod_loop'] is True:
                             state.scratch['break_mod_loop'] = False
                             break
             else:
-                for modifier in self.modifiers[sequence] + attacker.modifiers[sequence] + postamble[sequence]:
+                for modifier in modifiers:
                     state = modifier(state)
         return state.resolve()
-        
-class Model():
+
+    def attack_profiled(self, attacker: AStat, state, profile):
+        ''' attack, counting into 'profile' as it goes.  Kept apart so the uninstrumented loop pays nothing for it. '''
+        profile.sequences += 1
+        postamble = STANDARD_ATTACK_SEQUENCE
+        for sequence in postamble.keys():
+            stage = profile.stage(sequence)
+            start = time.perf_counter()
+            modifiers = self.modifiers[sequence] + attacker.modifiers[sequence] + postamble[sequence]
+            if sequence in state.roll:
+                pool = state.pool[state.determine_pool_source(sequence)]
+                stage['max_pool'] = max(stage['max_pool'], len(pool))
+                while len(pool) > 0:
+                    state.roll[sequence] = pool.popleft().clone().roll(state.rng)
+                    state.scratch['unmodified_roll'] = state.roll[sequence].snapshot()
+                    stage['dice'] += len(state.roll[sequence].value) if state.roll[sequence].multiple else 1
+                    stage['rerolls'] += state.roll[sequence].roll_count > 1
+                    for modifier in modifiers:
+                        stage['modifiers'] += 1
+                        state = modifier(state)
+                        if state.scratch['break_mod_loop'] is True:
+                            state.scratch['break_mod_loop'] = False
+                            break
+            else:
+                for modifier in modifiers:
+                    stage['modifiers'] += 1
+                    state = modifier(state)
+            stage['seconds'] += time.perf_counter() - start
+        return state.resolve()
+
+def check_if_in_range(attack_pos, defend_pos, attack_wpn):
+    # for melee, return true only if they are equal
+    # for ranged, return true if distance is less than range AND positions are not equal
+    result = False
+    sep_dis = abs(attack_pos - defend_pos)
+    if( attack_wpn.range == MELEE_WEAPON_RANGE ): # TODO make more explicit that melee weapons are designated by a range of "0 inches"
+        result = sep_dis < MELEE_RANGE_INCHES
+    else:
+        result = sep_dis <= attack_wpn.range and sep_dis >= MELEE_RANGE_INCHES
+    return result
+
+def enumerate_matchups(attacker, defender):
+    '''
+        Every (DStat, AStat) pairing the per-trial '-' operators would resolve for 'defender - attacker'.
+        Out of range weapons are dropped here, once, rather than every trial.
+    '''
+    if hasattr(defender, 'defence'): # Model
+        defending_model = defender
+    elif hasattr(defender, 'models'): # Unit
+        defending_model = defender._get_best_defender()
+    else: # DStat
+        if not hasattr(attacker, 'attacks'):
+            raise ValueError("RHS must be an attacking statistic")
+        return [(defender, attacker)]
+
+    result = []
+    for model in getattr(attacker, 'models', [attacker]):
+        try:
+            weapons = [wpn for wpn in model.weapons]
+        except Exception as e:
+            weapons = [model.weapons]
+        for wpn in weapons:
+            if check_if_in_range(model.pos, defending_model.pos, wpn):
+                result.append((defending_model.defence, wpn))
+    return result
+
+class Model(ValueObject):
     def __init__(self, weapons, defence, pts="N/A", name="N/A", position=0):
-        self.weapons = copy.deepcopy(weapons)
+        # the stats are immutable, so they're shared rather than copied
+        self.weapons = tuple(weapons) if isinstance(weapons, list) else weapons
         self.defence = defence
         self.name = name
         self.points = pts
         self.wounds = self.defence.wounds
         self.pos = position
+        self.freeze()
+
+    def at(self, position):
+        ''' this model, standing at 'position' '''
+        return self if position == self.pos else self.replace(pos=position)
 
     # TODO is this a bad idea?  Maybe!
     def __div__(self, other):
-        result = copy.deepcopy(self)
-        result.defence = result.defence * other
-        return result
+        return self.derived((self.defence, other), lambda: self.replace(defence=self.defence * other))
     def __mul__(self, other):
-        result = copy.deepcopy(self)
-        try:
-            result.weapons = [wpn * other for wpn in result.weapons]
-        except Exception as e:
-            result.weapons = result.weapons * other
-        return result
+        def build():
+            try:
+                return self.replace(weapons=tuple(wpn * other for wpn in self.weapons))
+            except Exception as e:
+                return self.replace(weapons=self.weapons * other)
+        return self.derived(other, build)
     def __sub__(self, attacker):
         '''
             model - model
             model - unit
         '''
 
-        def check_if_in_range(attack_pos, defend_pos, attack_wpn):
-            # for melee, return true only if they are equal
-            # for ranged, return true if distance is less than range AND positions are not equal
-            result = False
-            sep_dis = abs(attack_pos - defend_pos)
-            if( attack_wpn.range == MELEE_WEAPON_RANGE ): # TODO make more explicit that melee weapons are designated by a range of "0 inches"
-                result = sep_dis < MELEE_RANGE_INCHES
-            else:
-                result = sep_dis <= attack_wpn.range and sep_dis >= MELEE_RANGE_INCHES
-            return result
-
         def handle_model(att_model):
             try:
                 acc = np.zeros((2,))
@@ -665,21 +1063,27 @@ class Unit():
             wounds is the **majority** wounds characteristic among models in the unit
         '''
         # the list of unmodified models
-        self.models_untouched = model_list
-        # the list of modified models, plus a book-keeping list of the modifiers active for the unit
-        self.models = copy.deepcopy(self.models_untouched)
+        self.models_untouched = list(model_list)
+        # the list of modified models, plus a book-keeping list of the modifiers active for the unit.  Models are
+        # immutable, the lists are the unit's own but the models in them are shared
+        self.models = list(self.models_untouched)
         self.unit_modifiers = []
-        # the aggregate stats
-        self.unit_wounds, self.wounds, self.points = self.__aggregate_model_stats()
+        # the aggregate stats, plus how many models there are of each wounds characteristic, so that adding a model
+        # updates them rather than going over every model again
+        self.unit_wounds, self.points, self.wound_counts = 0, 0, {}
+        for mdl in self.models_untouched:
+            self.__count_model(mdl)
+        self.wounds = self.__majority_wounds()
         self.name = name
 
+    def __count_model(self, mdl):
+        self.unit_wounds += mdl.defence.wounds
+        self.points += mdl.points
+        self.wound_counts[mdl.defence.wounds] = self.wound_counts.get(mdl.defence.wounds, 0) + 1
 
-    def __aggregate_model_stats(self):
-        unit_wounds = np.sum([mdl.defence.wounds for mdl in self.models_untouched])
-        mode, _ = scipy.stats.mode([mdl.defence.wounds for mdl in self.models_untouched])
-        wounds = np.max(mode)
-        points = np.sum([mdl.points for mdl in self.models_untouched])
-        return unit_wounds, wounds, points
+    def __majority_wounds(self):
+        ''' the most common wounds characteristic, the smallest of them on a tie (as scipy.stats.mode would) '''
+        return max(self.wound_counts, key=lambda wounds: (self.wound_counts[wounds], -wounds))
 
     def __str__(self):
         return f"{self.models[0]}"
@@ -688,28 +1092,30 @@ class Unit():
         '''
             unit * modifier
         '''
-        result = copy.deepcopy(self)
-        result.unit_modifiers.append(other)
-        result.models = copy.deepcopy(result.models_untouched)
-        for mod in result.unit_modifiers:
-            result.models = [x * mod for x in result.models]
+        result = copy.copy(self)
+        result.unit_modifiers = self.unit_modifiers + [other]
+        # the models already have the earlier modifiers, in order, so only the new one needs applying
+        result.models = [x * other for x in self.models]
         return result
 
     def __add__(self, other: Model):
         ''' other had better be a Model'''
-        result = copy.deepcopy(self)
+        result = copy.copy(self)
 
         # when we add a unit, we need to:
         #   update the list of unmodifier models
         #   update the aggregate stats
         #   update the list of modified models
 
-        result.models_untouched.append(copy.deepcopy(other))
-        result.unit_wounds, result.wounds, result.points = result.__aggregate_model_stats()
+        result.models_untouched = self.models_untouched + [other]
+        result.wound_counts = dict(self.wound_counts)
+        result.__count_model(other)
+        result.wounds = result.__majority_wounds()
 
         for mod in result.unit_modifiers:
             other = other * mod
-        result.models.append(other)
+        result.models = self.models + [other]
+        result.unit_modifiers = list(self.unit_modifiers)
         return result
 
     def __sub__(self, other):
@@ -740,26 +1146,26 @@ class Unit():
 # =================================================================================== #
 #       Standard Modifiers
 # =================================================================================== #
-Torrent = Modifier(sequence='hit', functor=modifier_always_succeed('hit'))
-RerollWounds = Modifier(sequence='wound', functor=modifier_reroll_fails('wound'))
-RerollWoundsOne = Modifier(sequence='wound', functor=modifier_reroll_ones('wound'))
+Torrent = Modifier(sequence='hit', functor=modifier_always_succeed('hit'), id="Torrent")
+RerollWounds = Modifier(sequence='wound', functor=modifier_reroll_fails('wound'), id="RerollWounds")
+RerollWoundsOne = Modifier(sequence='wound', functor=modifier_reroll_ones('wound'), id="RerollWoundsOne")
 TwinLinked = RerollWounds
-RerollHits = Modifier(sequence='hit', functor=modifier_reroll_fails('hit'))
-RerollHitsOne = Modifier(sequence='hit', functor=modifier_reroll_ones('hit'))
-Reroll_D6_Damage = Modifier(sequence='damage', functor=modifier_reroll_if_less_than(sequence='damage', threshold=4))
-Reroll_D3_Damage = Modifier(sequence='damage', functor=modifier_reroll_if_less_than(sequence='damage', threshold=2))
-Reroll_D3_Attacks = Modifier(sequence='attacks', functor=modifier_reroll_if_less_than(sequence='attacks', threshold=2))
-Reroll_D6_Attacks = Modifier(sequence='attacks', functor=modifier_reroll_if_less_than(sequence='attacks', threshold=4))
-PlusOneToWound = Modifier(sequence='wound', functor=modifier_roll_add_one('wound'))
-PlusOneToHit = Modifier(sequence='hit', functor=modifier_roll_add_one('hit'))
-LethalHits = Modifier(sequence='hit', functor=modifier_lethal_hits())
-SustainedHits_1 = Modifier(sequence='hit', functor=modifier_sustained_hits(X=1))
-DevestatingWounds = Modifier(sequence='wound', functor=modifier_devastating_wounds())
-StrengthPlusOne = Modifier(sequence='attacks', functor=modifier_characteristic_add_one('strength'))
-AP_PlusOne = Modifier(sequence='attacks', functor=modifier_characteristic_subtract_one('armourpen'))
-AttacksPlusOne = Modifier(sequence='attacks', functor=modifier_characteristic_add_one('attacks'))
-DamagePlusOne = Modifier(sequence='attacks', functor=modifier_characteristic_add_one('damage'))
-CriticalHit_5up = Modifier(sequence='attacks', functor=modifier_characteristic_subtract_one('criticalhit'))
+RerollHits = Modifier(sequence='hit', functor=modifier_reroll_fails('hit'), id="RerollHits")
+RerollHitsOne = Modifier(sequence='hit', functor=modifier_reroll_ones('hit'), id="RerollHitsOne")
+Reroll_D6_Damage = Modifier(sequence='damage', functor=modifier_reroll_if_less_than(sequence='damage', threshold=4), id="Reroll_D6_Damage")
+Reroll_D3_Damage = Modifier(sequence='damage', functor=modifier_reroll_if_less_than(sequence='damage', threshold=2), id="Reroll_D3_Damage")
+Reroll_D3_Attacks = Modifier(sequence='attacks', functor=modifier_reroll_if_less_than(sequence='attacks', threshold=2), id="Reroll_D3_Attacks")
+Reroll_D6_Attacks = Modifier(sequence='attacks', functor=modifier_reroll_if_less_than(sequence='attacks', threshold=4), id="Reroll_D6_Attacks")
+PlusOneToWound = Modifier(sequence='wound', functor=modifier_roll_add_one('wound'), id="PlusOneToWound")
+PlusOneToHit = Modifier(sequence='hit', functor=modifier_roll_add_one('hit'), id="PlusOneToHit")
+LethalHits = Modifier(sequence='hit', functor=modifier_lethal_hits(), id="LethalHits")
+SustainedHits_1 = Modifier(sequence='hit', functor=modifier_sustained_hits(X=1), id="SustainedHits_1")
+DevestatingWounds = Modifier(sequence='wound', functor=modifier_devastating_wounds(), id="DevestatingWounds")
+StrengthPlusOne = Modifier(sequence='attacks', functor=modifier_characteristic_add_one('strength'), id="StrengthPlusOne")
+AP_PlusOne = Modifier(sequence='attacks', functor=modifier_characteristic_subtract_one('armourpen'), id="AP_PlusOne")
+AttacksPlusOne = Modifier(sequence='attacks', functor=modifier_characteristic_add_one('attacks'), id="AttacksPlusOne")
+DamagePlusOne = Modifier(sequence='attacks', functor=modifier_characteristic_add_one('damage'), id="DamagePlusOne")
+CriticalHit_5up = Modifier(sequence='attacks', functor=modifier_characteristic_subtract_one('criticalhit'), id="CriticalHit_5up")
 
 StandardModifiers = {
     "Torrent"           : Torrent,
@@ -787,84 +1193,417 @@ StandardModifiers = {
 # =================================================================================== #
 # =================================================================================== #
 def update_position(unit, position):
-    result = copy.deepcopy(unit)
-    try:
-        for mdl in result.models:
-            mdl.pos = position
-        for mdl in result.models_untouched:
-            mdl.pos = position
-    except Exception as e:
-        result.pos = position
-    return result
+    ''' a copy of 'unit' (a Unit or a Model) standing at 'position', sharing all but the models that moved '''
+    if hasattr(unit, 'models'):
+        result = copy.copy(unit)
+        result.models = [mdl.at(position) for mdl in unit.models]
+        result.models_untouched = [mdl.at(position) for mdl in unit.models_untouched]
+        result.unit_modifiers = list(unit.unit_modifiers)
+        return result
+    return unit.at(position)
 
 # =================================================================================== #
-def mean_loop(attacker, defender, count):
+# 'loop' resolves each trial with DStat.__sub__, 'batch' resolves all trials at once with numpy (see batch_engine.py)
+# 'exact' enumerates the dice instead of rolling them (see exact_engine.py), so it has no samples, only distributions
+# 'allocate' is 'batch', with damage spilling from model to model across the defending unit (see allocation_engine.py)
+ENGINES = ['loop', 'batch', 'exact', 'allocate']
+# bump this whenever a change to the engines changes the numbers they produce, it invalidates cached results
+ENGINE_VERSION = 1
+# probabilities below this are dropped from the tail of an exact distribution, no sample would ever see them
+PMF_TAIL_EPSILON = 1e-6
+
+# trials are run in chunks of this many, each with its own RNG stream spawned from the seed (see trial_chunks),
+# so the samples for a seed don't depend on how, or where, the chunks get run
+TRIALS_PER_STREAM = 1000
+
+def trial_chunks(count, rng=None):
+    ''' split 'count' trials into a list of (trials, SeedSequence) '''
+    sizes = [min(TRIALS_PER_STREAM, count - start) for start in range(0, count, TRIALS_PER_STREAM)]
+    return list(zip(sizes, seed_sequence(rng).spawn(len(sizes))))
+
+def sample_chunk(attacker, defender, count, engine, seed, profile=None):
+    '''
+        The trials of a single chunk, rolled from 'seed'.  Returns a (count,2) array of damage used, damage wasted.
+        The 'allocate' engine adds a third column, the models removed.
+        'profile' is a StageProfile to count the attack sequence stages into.
+    '''
+    if engine == 'allocate':
+        from allocation_engine import allocation_loop
+        return allocation_loop(attacker=attacker, defender=defender, count=count, rng=np.random.default_rng(seed), profile=profile)
+    if engine == 'batch':
+        from batch_engine import batch_loop
+        return batch_loop(attacker=attacker, defender=defender, count=count, rng=np.random.default_rng(seed), profile=profile)
+
     N = count
     acc = np.zeros((N,2)) # used, wasted
-    if type(attacker) is list:
-        for att in attacker:
-            tmp = np.zeros((N,2)) 
-            for ii in range(0, N):
-                # used, wasted = defender - att
-                tmp[ii,:] = defender - att
-            acc += tmp
-    else:
+    # one state, reset for every trial, see AttackSequenceState.reset
+    state = AttackSequenceState()
+    rng = DiceRNG(seed)
+    attackers = attacker if type(attacker) is list else [attacker]
+    for att in attackers:
+        matchups = enumerate_matchups(att, defender)
         for ii in range(0, N):
-            acc[ii,:] = defender - attacker
-    return np.mean(acc[:,0]), np.mean(acc[:,1])
+            # used, wasted = defender - att
+            for dstat, astat in matchups:
+                acc[ii,:] += dstat.attack(astat, state, rng, profile)
+    return acc
+
+# the matchup a worker process is running, set once per worker by init_worker
+WORKER_MATCHUP = None
+
+def init_worker(matchup):
+    '''
+        ProcessPoolExecutor initializer.  'matchup' is the dill pickled (attacker, defender, engine): the modifiers
+        are closures, which plain pickle can't handle, and this way they're shipped once per worker, not per chunk.
+    '''
+    import dill
+    global WORKER_MATCHUP
+    WORKER_MATCHUP = dill.loads(matchup)
+
+def sample_worker_chunk(chunk):
+    ''' returns the samples, and the worker's own StageProfile if asked to profile '''
+    attacker, defender, engine = WORKER_MATCHUP
+    trials, seed, profiling = chunk
+    profile = StageProfile() if profiling else None
+    return sample_chunk(attacker=attacker, defender=defender, count=trials, engine=engine, seed=seed, profile=profile), profile
+
+def sample_chunks(attacker, defender, count, engine='loop', rng=None, workers=1, profile=None):
+    '''
+        sample_loop, a chunk at a time: yields (trials,2) arrays of damage used, damage wasted, in order.
+        'profile' is a StageProfile, the workers' counters are merged into it.
+    '''
+    if engine == 'exact':
+        raise ValueError("The exact engine does not produce samples, use stats_exact instead")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+
+    chunks = trial_chunks(count, rng)
+    if workers > 1 and len(chunks) > 1:
+        import dill
+        from concurrent.futures import ProcessPoolExecutor
+        matchup = dill.dumps((attacker, defender, engine))
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=init_worker, initargs=(matchup,)) as pool:
+            for acc, worker_profile in pool.map(sample_worker_chunk, [(trials, seed, profile is not None) for trials, seed in chunks]):
+                if profile is not None:
+                    profile.merge(worker_profile)
+                yield acc
+    else:
+        for trials, seed in chunks:
+            yield sample_chunk(attacker=attacker, defender=defender, count=trials, engine=engine, seed=seed, profile=profile)
+
+def sample_loop(attacker, defender, count, engine='loop', rng=None, workers=1):
+    '''
+        Run 'count' trials of defender - attacker.  Returns a (count,2) array of damage used, damage wasted.
+        'rng' is a seed (or anything seed_sequence accepts), the same seed gives the same samples.
+        'workers' > 1 runs the chunks in that many processes, the samples are the same as a serial run.
+        Holds on to every trial, use accumulate_loop when only the statistics are needed.
+    '''
+    acc = list(sample_chunks(attacker=attacker, defender=defender, count=count, engine=engine, rng=rng, workers=workers))
+    return np.concatenate(acc) if len(acc) > 0 else np.zeros((0,2))
+
+class DamageAccumulator():
+    '''
+        Streaming statistics of damage used and damage wasted (and models removed, for the 'allocate' engine): integer
+        histograms and running moments, updated a chunk of trials at a time.  Memory depends on the most damage done, not on the number of trials, unless
+        keep_samples is set, in which case the per-trial samples are held on to as well.  'store' is a SampleStore (see
+        sample_store.py) to append the per-trial samples to instead, on disk.
+    '''
+    def __init__(self, keep_samples=False, store=None):
+        self.trials = 0
+        self.counts = [np.zeros((1,), dtype=np.int64), np.zeros((1,), dtype=np.int64)] # used, wasted[, removed]
+        self.total = np.zeros((2,))
+        self.total_squares = np.zeros((2,))
+        self.keep_samples = keep_samples
+        self.store = store
+        self.chunks = []
+
+    def add(self, acc):
+        ''' acc is a (N,2) array of damage used, damage wasted, as from sample_loop '''
+        if acc.shape[1] > len(self.counts):
+            extra = acc.shape[1] - len(self.counts)
+            self.counts += [np.zeros((1,), dtype=np.int64) for _ in range(0, extra)]
+            self.total = np.concatenate([self.total, np.zeros((extra,))])
+            self.total_squares = np.concatenate([self.total_squares, np.zeros((extra,))])
+        for col in range(0, acc.shape[1]):
+            counts = np.bincount(acc[:,col].astype(np.int64))
+            if len(counts) > len(self.counts[col]):
+                self.counts[col] = np.concatenate([self.counts[col], np.zeros((len(counts) - len(self.counts[col]),), dtype=np.int64)])
+            self.counts[col][:len(counts)] += counts
+        self.trials += len(acc)
+        self.total += np.sum(acc, axis=0)
+        self.total_squares += np.sum(acc**2, axis=0)
+        if self.store is not None:
+            self.store.append(acc)
+        elif self.keep_samples:
+            self.chunks.append(acc)
+        return self
+
+    def mean(self):
+        ''' (damage used, damage wasted[, models removed]) '''
+        return self.total / self.trials
+
+    def var(self):
+        mean = self.mean()
+        return self.total_squares / self.trials - mean**2
+
+    def histogram(self, col=0):
+        ''' the same histogram stats_comp makes, col 0 is damage used, col 1 is damage wasted, col 2 is models removed '''
+        return self.counts[col] / self.trials
+
+    def cdf(self, col=0):
+        ''' the same cdf stats_comp makes '''
+        return np.cumsum(self.histogram(col)[::-1])[::-1]
+
+    def has_samples(self):
+        return self.keep_samples or self.store is not None
+
+    def samples(self):
+        ''' the (trials,2) array sample_loop would have returned, needs keep_samples or a store (then it's a memmap) '''
+        if self.store is not None:
+            return self.store.samples()
+        if not self.keep_samples:
+            raise ValueError("samples were not kept, construct with keep_samples=True")
+        return np.concatenate(self.chunks) if len(self.chunks) > 0 else np.zeros((0,2))
+
+def store_accumulator(store):
+    ''' the DamageAccumulator for the samples already in a SampleStore, read back a chunk at a time '''
+    accumulator = DamageAccumulator()
+    for acc in store.chunks():
+        accumulator.add(acc)
+    accumulator.store = store
+    return accumulator
+
+def accumulate_loop(attacker, defender, count, engine='loop', rng=None, workers=1, accumulator=None, keep_samples=False, store=None, profile=None, progress=None):
+    '''
+        sample_loop, streamed into a DamageAccumulator ('accumulator', or a new one) rather than kept.
+        'store' is a SampleStore for a new accumulator to write the samples to.
+        'profile' is a StageProfile, the time spent sampling and accumulating is added to its phases.
+        'progress' is called with the accumulator after each chunk of trials, anything it raises stops the loop.
+    '''
+    accumulator = DamageAccumulator(keep_samples=keep_samples, store=store) if accumulator is None else accumulator
+    if profile is None:
+        for acc in sample_chunks(attacker=attacker, defender=defender, count=count, engine=engine, rng=rng, workers=workers):
+            accumulator.add(acc)
+            if progress is not None:
+                progress(accumulator)
+        return accumulator
+    chunks = sample_chunks(attacker=attacker, defender=defender, count=count, engine=engine, rng=rng, workers=workers, profile=profile)
+    while True:
+        start = time.perf_counter()
+        acc = next(chunks, None)
+        profile.phase('sample', time.perf_counter() - start)
+        if acc is None:
+            return accumulator
+        start = time.perf_counter()
+        accumulator.add(acc)
+        profile.phase('accumulate', time.perf_counter() - start)
+        if progress is not None:
+            progress(accumulator)
+
+def mean_loop(attacker, defender, count, engine='loop', rng=None):
+    if engine == 'exact':
+        from exact_engine import exact_loop
+        damage_pmf, waste_pmf = exact_loop(attacker=attacker, defender=defender, count=count, rng=rng)
+        return np.dot(damage_pmf, np.arange(len(damage_pmf))), np.dot(waste_pmf, np.arange(len(waste_pmf)))
+    used, wasted = accumulate_loop(attacker=attacker, defender=defender, count=count, engine=engine, rng=rng).mean()[:2]
+    return used, wasted
+
+# the confidence intervals the adaptive loop works to are this many standard errors either side, i.e. 95%
+CONFIDENCE_Z = 1.96
+# the adaptive loop gives up here, however wide the intervals still are
+ADAPTIVE_MAX_TRIALS = 10000000
+
+def adaptive_loop(attacker, defender, count, thresholds, engine='loop', rng=None, workers=1, width=None, budget=None, keep_samples=False, store=None, profile=None, progress=None):
+    '''
+        accumulate_loop, 'count' trials at a time, until the confidence interval on the damage at each of 'thresholds'
+        (see compute_likelihood_value) is at most 'width' wide, or until another batch would overrun 'budget' seconds.
+        At least one batch is always run.  Returns the DamageAccumulator.
+    '''
+    seeds = seed_sequence(rng) # spawns fresh streams for each batch
+    start = time.perf_counter()
+    accumulator = accumulate_loop(attacker=attacker, defender=defender, count=count, engine=engine, rng=seeds, workers=workers, keep_samples=keep_samples, store=store, profile=profile, progress=progress)
+    while accumulator.trials < ADAPTIVE_MAX_TRIALS:
+        if width is not None:
+            cdf = accumulator.cdf()
+            if all(np.diff(likelihood_confidence(cdf, thresh, accumulator.trials))[0] <= width for thresh in thresholds):
+                break
+        elif budget is None:
+            break
+        elapsed = time.perf_counter() - start
+        if budget is not None and elapsed + elapsed * count / accumulator.trials > budget:
+            break
+        accumulate_loop(attacker=attacker, defender=defender, count=count, engine=engine, rng=seeds, workers=workers, accumulator=accumulator, profile=profile, progress=progress)
+    return accumulator
 
 def stats_comp(sample):
     # create histogram
-    phist = np.zeros((int(np.max(sample))+1,))
-    for ii in range(0,len(phist)):
-        phist[ii] = len(sample[sample == ii]) / len(sample)
-    histogram = copy.deepcopy(phist)
-    phist = phist[::-1]
-    phist = np.cumsum(phist)
-    cdf = phist[::-1]
+    sample = np.asarray(sample)
+    histogram = np.bincount(sample.astype(np.int64), minlength=int(np.max(sample))+1) / len(sample)
+    cdf = np.cumsum(histogram[::-1])[::-1]
     return cdf, histogram
 
-def stats_loop(attacker, defender, count):
-    N = count
-    acc = np.zeros((N,2)) # used, wasted
-    if type(attacker) is list:
-        for att in attacker:
-            tmp = np.zeros((N,2)) 
-            for ii in range(0, N):
-                tmp[ii,:] = defender - att
-            acc += tmp
-    else:
-        for ii in range(0, N):
-            acc[ii,:] = defender - attacker
-    cdf, histogram = stats_comp(acc[:,0])
-    cdf_waste, histogram_waste = stats_comp(acc[:,1])
-    return cdf, histogram, acc[:,0], cdf_waste, histogram_waste, acc[:,1]
+def counts_comp(counts):
+    ''' stats_comp, for the histogram counts of the sample rather than the sample '''
+    histogram = counts / np.sum(counts)
+    cdf = np.cumsum(histogram[::-1])[::-1]
+    return cdf, histogram
+
+def pmf_comp(pmf):
+    ''' stats_comp, for a distribution we already know '''
+    histogram = np.asarray(pmf, dtype=float)
+    cdf = np.cumsum(histogram[::-1])[::-1]
+    keep = max(1, np.count_nonzero(cdf >= PMF_TAIL_EPSILON))
+    return cdf[:keep], histogram[:keep]
+
+def stats_exact(attacker, defender, count, rng=None):
+    '''
+        stats_loop, without the loop.  'count' is only used for pairings the exact engine has to sample.
+        Returns the damage and waste distributions in place of the samples.
+    '''
+    from exact_engine import exact_loop
+    damage_pmf, waste_pmf = exact_loop(attacker=attacker, defender=defender, count=count, rng=rng)
+    cdf, histogram = pmf_comp(damage_pmf)
+    cdf_waste, histogram_waste = pmf_comp(waste_pmf)
+    return cdf, histogram, damage_pmf, cdf_waste, histogram_waste, waste_pmf
+
+def stats_loop(attacker, defender, count, engine='loop', rng=None, workers=1, keep_samples=False, store=None, profile=None):
+    '''
+        The damage used and damage wasted sequences are None, unless keep_samples is set, or they're written to 'store'
+        (a SampleStore), in which case they're memmaps of it.
+        'profile' is a StageProfile to count the attack sequence stages, and the phases of the loop, into.
+    '''
+    accumulator = accumulate_loop(attacker=attacker, defender=defender, count=count, engine=engine, rng=rng, workers=workers, keep_samples=keep_samples, store=store, profile=profile)
+    start = time.perf_counter()
+    result = stats_accumulator(accumulator)
+    if profile is not None:
+        profile.phase('statistics', time.perf_counter() - start)
+    return result
+
+def stats_accumulator(accumulator):
+    ''' stats_loop, for a DamageAccumulator we already have '''
+    sequence, sequence_waste = None, None
+    if accumulator.has_samples():
+        acc = accumulator.samples()
+        sequence, sequence_waste = acc[:,0], acc[:,1]
+    return accumulator.cdf(0), accumulator.histogram(0), sequence, accumulator.cdf(1), accumulator.histogram(1), sequence_waste
+
+# fold_to_models_removed_stats reads the damage sequence this many trials at a time
+FOLD_CHUNK = 1 << 20
 
-def fold_to_models_removed_stats(damage_seq, target):
+def fold_rounds(damage_seq, W):
+    '''
+        The rounds taken to do W damage, moving through 'damage_seq' from its first trial.  Returns the rounds taken,
+        and where the last, unfinished, round started (len(damage_seq) if every round finished).
+    '''
+    N = len(damage_seq)
+    # a round that starts at trial s ends at the first trial that brings the running total to W, so the next round
+    # starts at next_start[s].  N+1 means the round never finished.  Any damage beyond W is lost at the end of the round.
+    total = np.concatenate([[0.0], np.cumsum(damage_seq)])
+    next_start = np.concatenate([np.searchsorted(total, total[:-1] + W, side='left'), [N, N+1]])
+    # follow next_start from the first trial, doubling the number of rounds walked each pass
+    started = np.zeros((N+2,), dtype=bool)
+    started[0] = True
+    jump = next_start
+    while True:
+        reached = started.copy()
+        reached[jump[started]] = True
+        if np.array_equal(reached, started):
+            break
+        started = reached
+        jump = jump[jump]
+    starts = np.flatnonzero(started[:N])
+    ends = next_start[starts]
+    unfinished = starts[ends > N]
+    return (ends - starts)[ends <= N], (unfinished[0] if len(unfinished) > 0 else N)
+
+def add_counts(counts, values):
+    ''' 'counts' (a histogram) with the non-negative integer 'values' added in, grown if need be '''
+    extra = np.bincount(values)
+    if len(extra) > len(counts):
+        counts = np.concatenate([counts, np.zeros((len(extra) - len(counts),), dtype=np.int64)])
+    counts[:len(extra)] += extra
+    return counts
+
+def fold_to_models_removed_stats(damage_seq, target, chunk=FOLD_CHUNK):
+    '''
+        move through the sequence, sequentially, and note how many "swings" it took to equal-or-exceed the wounds of the
+        target, and about how many models are removed per swing.  'damage_seq' is read 'chunk' trials at a time, it can be
+        a memmap of a SampleStore too big to hold in memory.
+    '''
     W = target.wounds
-    # move through the sequence, sequentially, and note how many "swings" it took to equal-or-exceed the wounds of the target
-    # we also want to compute about how many models are removed per swing
-    rounds_taken = []
-    models_removed = []
-    acc = 0
-    count = 0
-    for damage_dealt in damage_seq:
-        count += 1
-        acc += damage_dealt
-        if acc >= W:
-            rounds_taken.append(count)
-            count = 0
-            acc = 0
-        models_removed.append(int(damage_dealt / W))
+    rounds_counts = np.zeros((1,), dtype=np.int64)
+    removed_counts = np.zeros((1,), dtype=np.int64)
+    # the round still going at the end of the last chunk, how much damage it's done and over how many trials
+    carried, carried_trials = 0.0, 0
+    for start in range(0, len(damage_seq), chunk):
+        damage = np.asarray(damage_seq[start:start+chunk], dtype=float)
+        removed_counts = add_counts(removed_counts, (damage / W).astype(np.int64))
+        if carried_trials > 0:
+            running = carried + np.cumsum(damage)
+            end = np.searchsorted(running, W, side='left')
+            if end == len(damage):
+                carried, carried_trials = running[-1], carried_trials + len(damage)
+                continue
+            rounds_counts = add_counts(rounds_counts, [carried_trials + end + 1])
+            damage = damage[end+1:]
+        rounds_taken, unfinished = fold_rounds(damage, W)
+        rounds_counts = add_counts(rounds_counts, rounds_taken)
+        carried, carried_trials = np.sum(damage[unfinished:]), len(damage) - unfinished
     # rounds_taken is our sample
-    if len(rounds_taken) == 0:
+    if np.sum(rounds_counts) == 0:
         raise ValueError("could not remove a model")
-    cdf_rounds, _ = stats_comp(np.asarray(rounds_taken))
-    cdf_removed, _ = stats_comp(np.asarray(models_removed))
+    cdf_rounds, _ = counts_comp(rounds_counts)
+    cdf_removed, _ = counts_comp(removed_counts)
     return cdf_rounds, cdf_removed
 
+def fold_pmf_to_models_removed_stats(damage_pmf, target, max_rounds=10000):
+    '''
+        fold_to_models_removed_stats, for a damage distribution rather than a damage sequence.
+        Rounds taken is the first round the running total reaches the target's wounds.
+    '''
+    W = target.wounds
+    damage_pmf = np.asarray(damage_pmf, dtype=float)
+    if np.sum(damage_pmf[1:]) <= 0:
+        raise ValueError("could not remove a model")
+    removed_pmf = np.bincount(np.arange(len(damage_pmf)) // W, weights=damage_pmf)
+
+    # P(damage >= x), for x = 0 .. W
+    at_least = np.concatenate([np.cumsum(damage_pmf[::-1])[::-1], [0.0]])
+    at_least = np.asarray([at_least[min(x, len(damage_pmf))] for x in range(0, W + 1)])
+    short = np.zeros((W,)) # damage carried over from previous rounds, while still short of W
+    short[0] = 1.0
+    rounds_pmf = [0.0]
+    while np.sum(short) > PMF_TAIL_EPSILON**2 and len(rounds_pmf) <= max_rounds:
+        rounds_pmf.append(np.dot(short, at_least[W - np.arange(W)]))
+        short = np.convolve(short, damage_pmf[:W])[:W]
+    rounds_pmf = np.asarray(rounds_pmf) / np.sum(rounds_pmf)
+    cdf_rounds, _ = pmf_comp(rounds_pmf)
+    cdf_removed, _ = pmf_comp(removed_pmf)
+    return cdf_rounds, cdf_removed
+
+def compute_likelihood_value(data, thresh):
+    ''' the value 'data' (a cdf from stats_comp) crosses 'thresh' at, 'thresh' can be an array of thresholds '''
+    xdata = np.arange(len(data), dtype=float)
+    return np.interp(thresh, data[::-1], xdata[::-1])
+
+def likelihood_confidence(data, thresh, trials, z=CONFIDENCE_Z):
+    '''
+        (low, high) confidence interval on compute_likelihood_value(data, thresh), where 'data' was sampled from 'trials'
+        trials.  Each point of the cdf is a binomial proportion, so we move 'thresh' by z of its standard errors.
+    '''
+    error = z * np.sqrt(thresh * (1 - thresh) / trials)
+    low, high = compute_likelihood_value(data, [min(thresh + error, 1), max(thresh - error, 0)])
+    return low, high
+
 class AnalysisResult():
-    def __init__(self, attacker, defender, damage_cdf, damage_sequence, waste_data, pvalue, desc=None):
+    def __init__(self, attacker, defender, damage_cdf, damage_sequence, waste_data, pvalue, desc=None, damage_pmf=None, trials=None, models_removed_pmf=None, sample_store=None):
+        '''
+            damage_sequence is the per-trial damage, when sampled and kept.  Otherwise it's None and damage_pmf is given instead.
+            sample_store is the SampleStore the samples were written to, damage_sequence is then a memmap of it.
+            trials is the number of trials sampled, defaults to the length of damage_sequence, None for exact results.
+            models_removed_pmf is the distribution of models removed, when the engine allocated damage to the unit.
+            Otherwise it's folded out of the damage, as if every model had the unit's majority wounds.
+        '''
         self.attacker = attacker
         self.defender = defender
         self.damage_cdf = damage_cdf
@@ -872,15 +1611,23 @@ class AnalysisResult():
         self.waste_data = waste_data
         self.pvalue = pvalue
         self.desc = desc
-        
-        def compute_likelihood_value(data, thresh):
-            xdata = np.asarray([ float(x) for x in range(0,len(data)) ])
-            return np.interp(thresh, data[::-1], xdata[::-1])
+        self.sample_store = sample_store
+        # filled in by perform_full_analysis when asked to profile, see StageProfile.report
+        self.stage_report = None
 
-        self.very_likely_damage_output = compute_likelihood_value(damage_cdf, self.pvalue)
-        self.expected_damage_output = compute_likelihood_value(damage_cdf, 0.5)
+        self.very_likely_damage_output, self.expected_damage_output = compute_likelihood_value(damage_cdf, [self.pvalue, 0.5])
         self.expected_damage_waste = compute_likelihood_value(waste_data, 0.5)
 
+        # how many trials, and how far off the damage outputs might be because of it.  Exact results have no error.
+        self.trials = trials if damage_sequence is None else len(damage_sequence)
+        def standard_error(thresh):
+            if self.trials is None:
+                return 0.0
+            low, high = likelihood_confidence(damage_cdf, thresh, self.trials)
+            return (high - low) / (2 * CONFIDENCE_Z)
+        self.very_likely_damage_error = standard_error(self.pvalue)
+        self.expected_damage_error = standard_error(0.5)
+
         # potential relative to point cost
         self.att_points = attacker.points
         self.def_points = defender.points
@@ -888,16 +1635,21 @@ class AnalysisResult():
         
         # models-removed-per-round and rounds-taken-to-remove-model
         try:
-            self.cdf_rounds_taken, self.cdf_models_removed = fold_to_models_removed_stats(damage_sequence, defender)
+            if damage_sequence is not None:
+                self.cdf_rounds_taken, self.cdf_models_removed = fold_to_models_removed_stats(damage_sequence, defender)
+            else:
+                self.cdf_rounds_taken, self.cdf_models_removed = fold_pmf_to_models_removed_stats(damage_pmf, defender)
             self.very_likely_number_of_rounds_taken = compute_likelihood_value(self.cdf_rounds_taken, self.pvalue)
-            self.very_likely_models_removed = compute_likelihood_value(self.cdf_models_removed, self.pvalue)
-            self.expected_models_removed = compute_likelihood_value(self.cdf_models_removed, 0.5)
+            self.very_likely_models_removed, self.expected_models_removed = compute_likelihood_value(self.cdf_models_removed, [self.pvalue, 0.5])
         except Exception as e:
             self.cdf_rounds_taken = "Nan"
             self.cdf_models_removed = "Nan"
             self.very_likely_number_of_rounds_taken = "Nan"
             self.very_likely_models_removed = 0
             self.expected_models_removed = "Nan"
+        if models_removed_pmf is not None:
+            self.cdf_models_removed, _ = pmf_comp(models_removed_pmf)
+            self.very_likely_models_removed, self.expected_models_removed = compute_likelihood_value(self.cdf_models_removed, [self.pvalue, 0.5])
 
 
     def __str__(self):
@@ -918,17 +1670,353 @@ class AnalysisResult():
         result += f"\n  {int(self.pvalue*100)}% chance {self.very_likely_number_of_rounds_taken:0.1f} rounds taken to remove a model."
         result += f"\n  {int(self.pvalue*100)}% chance {int(self.very_likely_models_removed)} models or more are removed in a single round."
         result += f"\n  {self.points_per_damage:0.2f} PPD"
+        if self.trials is not None:
+            result += f"\n  {self.trials} trials, standard error {self.very_likely_damage_error:0.2f} (very likely) and {self.expected_damage_error:0.2f} (expected) damage."
 
         return result
 
-def perform_full_analysis(attacker, defender, count, pvalue, description):
-    damage_cdf, _, damage_sequence, waste_data, _, _ = stats_loop(attacker=attacker, defender=defender, count=count)
-    return AnalysisResult(attacker=attacker, defender=defender, damage_cdf=damage_cdf, damage_sequence=damage_sequence, waste_data=waste_data, pvalue=pvalue, desc=description)
+    def summary(self):
+        ''' the headline numbers, as plain json-able values.  "Nan" where no model could be removed, as in __str__ '''
+        def plain(value):
+            if isinstance(value, str) or value is None:
+                return value
+            return np.asarray(value).tolist()
+        return {
+            'desc': self.desc,
+            'pvalue': plain(self.pvalue),
+            'trials': plain(self.trials),
+            'attacker_points': plain(self.att_points),
+            'defender_points': plain(self.def_points),
+            'very_likely_damage_output': plain(self.very_likely_damage_output),
+            'very_likely_damage_error': plain(self.very_likely_damage_error),
+            'expected_damage_output': plain(self.expected_damage_output),
+            'expected_damage_error': plain(self.expected_damage_error),
+            'expected_damage_waste': plain(self.expected_damage_waste),
+            'very_likely_number_of_rounds_taken': plain(self.very_likely_number_of_rounds_taken),
+            'very_likely_models_removed': plain(self.very_likely_models_removed),
+            'expected_models_removed': plain(self.expected_models_removed),
+            'points_per_damage': plain(self.points_per_damage),
+            'damage_cdf': plain(self.damage_cdf),
+        }
+
+def perform_full_analysis(attacker, defender, count, pvalue, description, engine='loop', rng=None, workers=1, width=None, budget=None, keep_samples=False, sample_store=None, cache=None, profile_stages=False, progress=None):
+    '''
+        'rng' is a seed for the dice, see sample_loop.  None rolls fresh ones every time.
+        'workers' is the number of processes to spread the trials over, the exact engine doesn't use it.
+        Give a 'width' and/or a 'budget' (seconds) to run 'count' trials at a time until the very likely and expected
+        damage output are known that precisely, or until the time is up, see adaptive_loop.
+        Trials are streamed into a DamageAccumulator, set 'keep_samples' to keep the damage sequence in the result.
+        Or give 'sample_store', a path, to write the samples there instead (see sample_store.py): the damage sequence is
+        then read from disk as it's needed, and the analysis can be reopened later with open_analysis.
+        'cache' is a ResultCache (see result_cache.py) to read the result from, or store it in.
+        Set 'profile_stages' to time and count each stage of the attack sequence, the result's stage_report has the
+        counters (see StageProfile).  A profiled analysis is always run, never read back from the cache.
+        'progress' is called with the DamageAccumulator as each chunk of trials is done, raise from it to stop the
+        analysis.  The exact engine, and results read from the cache, don't call it.
+    '''
+    key = None
+    if cache is not None and not profile_stages:
+        key = cache.analysis_key(attacker, defender, count=count, pvalue=pvalue, engine=engine, rng=rng, width=width, budget=budget, keep_samples=keep_samples or sample_store is not None)
+        result = cache.load_analysis(key, attacker, defender, description)
+        if result is not None:
+            return result
+    profile = StageProfile() if profile_stages else None
+    store = None
+    if sample_store is not None:
+        if engine == 'exact':
+            raise ValueError("The exact engine does not produce samples to store")
+        from sample_store import create_store
+        store = create_store(sample_store)
+    try:
+        result = compute_full_analysis(attacker=attacker, defender=defender, count=count, pvalue=pvalue, description=description, engine=engine, rng=rng, workers=workers, width=width, budget=budget, keep_samples=keep_samples, store=store, profile=profile, progress=progress)
+    finally:
+        if store is not None:
+            store.close()
+    if profile is not None:
+        result.stage_report = profile.report()
+    if cache is not None and not profile_stages:
+        cache.store_analysis(key, result)
+    return result
+
+def compute_full_analysis(attacker, defender, count, pvalue, description, engine='loop', rng=None, workers=1, width=None, budget=None, keep_samples=False, store=None, profile=None, progress=None):
+    '''
+        perform_full_analysis, without the cache.  'store' is a SampleStore to write the samples to.
+        'profile' is a StageProfile, the exact engine has no stages to count.
+    '''
+    if engine == 'exact':
+        from exact_engine import exact_loop
+        damage_pmf, waste_pmf = exact_loop(attacker=attacker, defender=defender, count=count, rng=rng)
+        return exact_analysis(attacker, defender, damage_pmf, waste_pmf, pvalue, description)
+    if width is None and budget is None:
+        accumulator = accumulate_loop(attacker=attacker, defender=defender, count=count, engine=engine, rng=rng, workers=workers, keep_samples=keep_samples, store=store, profile=profile, progress=progress)
+    else:
+        accumulator = adaptive_loop(attacker=attacker, defender=defender, count=count, thresholds=[pvalue, 0.5], engine=engine, rng=rng, workers=workers, width=width, budget=budget, keep_samples=keep_samples, store=store, profile=profile, progress=progress)
+    start = time.perf_counter()
+    result = accumulator_analysis(attacker, defender, accumulator, pvalue, description)
+    if profile is not None:
+        profile.phase('statistics', time.perf_counter() - start)
+    return result
+
+def exact_analysis(attacker, defender, damage_pmf, waste_pmf, pvalue, description):
+    ''' the AnalysisResult for the damage and waste distributions from exact_loop '''
+    damage_cdf, _ = pmf_comp(damage_pmf)
+    waste_data, _ = pmf_comp(waste_pmf)
+    return AnalysisResult(attacker=attacker, defender=defender, damage_cdf=damage_cdf, damage_sequence=None, waste_data=waste_data, pvalue=pvalue, desc=description, damage_pmf=damage_pmf)
+
+def accumulator_analysis(attacker, defender, accumulator, pvalue, description):
+    ''' the AnalysisResult for the trials in a DamageAccumulator '''
+    damage_cdf, damage_pmf, damage_sequence, waste_data, _, _ = stats_accumulator(accumulator)
+    models_removed_pmf = accumulator.histogram(2) if len(accumulator.counts) > 2 else None
+    return AnalysisResult(attacker=attacker, defender=defender, damage_cdf=damage_cdf, damage_sequence=damage_sequence, waste_data=waste_data, pvalue=pvalue, desc=description, damage_pmf=damage_pmf, trials=accumulator.trials, models_removed_pmf=models_removed_pmf, sample_store=accumulator.store)
+
+def sweep_pairings(attacker, defender):
+    '''
+        enumerate_matchups, at every distance: each (DStat, AStat) pairing 'defender - attacker' could resolve.
+    '''
+    if hasattr(defender, 'defence'): # Model
+        defending_model = defender
+    else: # Unit
+        defending_model = defender._get_best_defender()
+    result = []
+    for att in (attacker if type(attacker) is list else [attacker]):
+        for model in getattr(att, 'models', [att]):
+            try:
+                weapons = [wpn for wpn in model.weapons]
+            except Exception as e:
+                weapons = [model.weapons]
+            result += [(defending_model.defence, wpn) for wpn in weapons]
+    return result
+
+def pairing_contribution(dstat, astat, count, engine, seed, workers=1):
+    '''
+        'count' trials of a single dstat - astat, in the form assemble_analysis adds up: the (count,2) samples, the
+        exact (used, wasted) distributions, or for the 'allocate' engine the (trial, damage) dice.
+    '''
+    if engine == 'exact':
+        from exact_engine import exact_loop
+        return exact_loop(attacker=astat, defender=dstat, count=count, rng=seed)
+    if engine == 'allocate':
+        from allocation_engine import damage_dice
+        return damage_dice(dstat, astat, count, np.random.default_rng(seed))
+    return sample_loop(attacker=astat, defender=dstat, count=count, engine=engine, rng=seed, workers=workers)
+
+def pairing_worker(task):
+    ''' pairing_contribution, for a ProcessPoolExecutor.  'task' is its dill pickled arguments, see init_worker '''
+    import dill
+    return pairing_contribution(*dill.loads(task))
+
+def assemble_analysis(attacker, defender, contributions, count, pvalue, engine, description, keep_samples=False):
+    '''
+        The AnalysisResult of 'attacker' against 'defender', put together from the pairing_contribution of each of
+        the weapons involved.  Weapons don't interact, so samples add, and distributions convolve.
+    '''
+    if engine == 'exact':
+        from exact_engine import NOTHING, convolve
+        dist = NOTHING
+        for item in contributions:
+            dist = convolve(dist, item)
+        return exact_analysis(attacker, defender, dist[0], dist[1], pvalue, description)
+    if engine == 'allocate':
+        from allocation_engine import allocate_damage, unit_wounds
+        trial = np.concatenate([np.zeros((0,), dtype=np.int64)] + [item[0] for item in contributions])
+        damage = np.concatenate([np.zeros((0,), dtype=np.int64)] + [item[1] for item in contributions])
+        acc = np.stack(allocate_damage(trial, damage, unit_wounds(defender), count), axis=1).astype(float)
+    else:
+        acc = np.zeros((count,2))
+        for item in contributions:
+            acc += item
+    return accumulator_analysis(attacker, defender, DamageAccumulator(keep_samples=keep_samples).add(acc), pvalue, description)
+
+def range_sweep(attacker, defender, distances, count, pvalue, engine='loop', rng=None, workers=1):
+    '''
+        perform_full_analysis with 'defender' each of 'distances' (inches) away from every model of 'attacker'.
+        Returns a list of (distance, AnalysisResult), the description is the distance.
+
+        Each weapon is simulated once, whatever the distance, and the result at a distance is assembled from the
+        weapons in range there, see assemble_analysis.  Distances that bring the same weapons into range share the
+        one AnalysisResult.  Model positions are ignored.
+    '''
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    pairings = sweep_pairings(attacker, defender)
+    seeds = seed_sequence(rng).spawn(len(pairings))
+
+    contributions = {}
+    def contribution(ii):
+        ''' weapon ii, simulated against the defender, once '''
+        if ii not in contributions:
+            dstat, astat = pairings[ii]
+            contributions[ii] = pairing_contribution(dstat, astat, count, engine, seeds[ii], workers)
+        return contributions[ii]
+
+    bands = {}
+    result = []
+    for distance in distances:
+        in_range = tuple(ii for ii, (_, astat) in enumerate(pairings) if check_if_in_range(0, distance, astat))
+        if in_range not in bands:
+            bands[in_range] = assemble_analysis(attacker, defender, [contribution(ii) for ii in in_range], count, pvalue, engine, f"{distance}in")
+        result.append((distance, bands[in_range]))
+    return result
+
+def pairing_key(dstat, astat):
+    ''' pairings with the same key give the same numbers, see result_cache.fingerprint '''
+    import json
+    from result_cache import fingerprint, Uncacheable
+    try:
+        return json.dumps(fingerprint([dstat, astat]), sort_keys=True)
+    except Uncacheable as e:
+        return (id(dstat), id(astat))
+
+def analysis_matrix(attackers, defenders, count, pvalue, engine='loop', rng=None, workers=1, keep_samples=False):
+    '''
+        perform_full_analysis of every attacker against every defender, both dicts of name: Model or Unit, already
+        positioned.  Returns a dict of (attacker name, defender name): AnalysisResult.
+
+        A weapon turns up in many cells, against the same defender profile, so each distinct pairing is simulated
+        once (see pairing_contribution), spread over 'workers' processes, and shared by every cell it turns up in.
+        Identical weapons within a cell still get their own trials, the n-th copy is shared with the n-th copy
+        elsewhere.  Exact distributions don't depend on the dice, so every copy shares those.
+    '''
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    cells = {}
+    unique = {}
+    for attacker_name, attacker in attackers.items():
+        for defender_name, defender in defenders.items():
+            keys = []
+            for att in (attacker if type(attacker) is list else [attacker]):
+                for dstat, astat in enumerate_matchups(att, defender):
+                    key = pairing_key(dstat, astat)
+                    copies = sum(1 for seen, _ in keys if seen == key)
+                    key = (key, 0 if engine == 'exact' else copies)
+                    unique.setdefault(key, (dstat, astat))
+                    keys.append(key)
+            cells[(attacker_name, defender_name)] = keys
+
+    seeds = seed_sequence(rng).spawn(len(unique))
+    tasks = [(dstat, astat, count, engine, seed) for (dstat, astat), seed in zip(unique.values(), seeds)]
+    if workers > 1 and len(tasks) > 1:
+        import dill
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            done = list(pool.map(pairing_worker, [dill.dumps(task) for task in tasks]))
+    else:
+        done = [pairing_contribution(*task) for task in tasks]
+    contributions = dict(zip(unique.keys(), done))
+
+    result = {}
+    for (attacker_name, defender_name), keys in cells.items():
+        result[(attacker_name, defender_name)] = assemble_analysis(attackers[attacker_name], defenders[defender_name], [contributions[key] for key in keys], count, pvalue, engine, f"{attacker_name} vs {defender_name}", keep_samples)
+    return result
 
 # =================================================================================== #
 #       TESTS ONLY
 # =================================================================================== #
-def run_test():
+def reference_stats_comp(sample):
+    ''' stats_comp, as it was before it was vectorized '''
+    # create histogram
+    phist = np.zeros((int(np.max(sample))+1,))
+    for ii in range(0,len(phist)):
+        phist[ii] = len(sample[sample == ii]) / len(sample)
+    histogram = copy.deepcopy(phist)
+    phist = phist[::-1]
+    phist = np.cumsum(phist)
+    cdf = phist[::-1]
+    return cdf, histogram
+
+def reference_fold_to_models_removed_stats(damage_seq, target):
+    ''' fold_to_models_removed_stats, as it was before it was vectorized '''
+    W = target.wounds
+    # move through the sequence, sequentially, and note how many "swings" it took to equal-or-exceed the wounds of the target
+    # we also want to compute about how many models are removed per swing
+    rounds_taken = []
+    models_removed = []
+    acc = 0
+    count = 0
+    for damage_dealt in damage_seq:
+        count += 1
+        acc += damage_dealt
+        if acc >= W:
+            rounds_taken.append(count)
+            count = 0
+            acc = 0
+        models_removed.append(int(damage_dealt / W))
+    # rounds_taken is our sample
+    if len(rounds_taken) == 0:
+        raise ValueError("could not remove a model")
+    cdf_rounds, _ = reference_stats_comp(np.asarray(rounds_taken))
+    cdf_removed, _ = reference_stats_comp(np.asarray(models_removed))
+    return cdf_rounds, cdf_removed
+
+def run_postprocessing_test():
+    ''' the vectorized post-processing must give the same answers the loops did '''
+    rng = np.random.default_rng(1234)
+    class Target():
+        def __init__(self, wounds):
+            self.wounds = wounds
+    for wounds, high in [(1, 3), (2, 4), (3, 2), (12, 40), (16, 8)]:
+        sample = rng.integers(0, high, size=20000).astype(float)
+        same_stats = all(np.array_equal(new, old) for new, old in zip(stats_comp(sample), reference_stats_comp(sample)))
+        same_fold = all(np.array_equal(new, old) for new, old in zip(fold_to_models_removed_stats(sample, Target(wounds)), reference_fold_to_models_removed_stats(sample, Target(wounds))))
+        print(f"same as the reference: stats_comp {same_stats}, fold_to_models_removed_stats {same_fold}  (W={wounds}, damage 0-{high-1})")
+
+def run_sweep_test():
+    ''' a sweep must give the same answers as analysing each distance on its own '''
+    armour = DStat(T=5, Sv=4, W=6)
+    knife = AStat(A=2, BS_WS=3, S=4, AP=0, D=1, Range=MELEE_WEAPON_RANGE)
+    pistol = AStat(A=1, BS_WS=3, S=4, AP=0, D=1, Range=12)
+    rifle = AStat(A=2, BS_WS=4, S=4, AP=-1, D=Dice(sides=3), Range=24)
+    attacker = Model([knife, pistol, rifle], armour, pts=20, position=0)
+    defender = Model(knife, armour, pts=20)
+    exact = range_sweep(attacker=attacker, defender=defender, distances=range(0, 49), count=1000, pvalue=5/6.0, engine='exact')
+    print(f"distinct weapon sets, 0-48in: {len({id(result) for _, result in exact})}, expected 4")
+    for distance in [0, 6, 18, 30]:
+        alone = perform_full_analysis(attacker=attacker, defender=update_position(defender, distance), count=1000, pvalue=5/6.0, description="alone", engine='exact')
+        print(f"same as on its own: {np.allclose(exact[distance][1].damage_cdf, alone.damage_cdf)}  ({distance}in, exact)")
+    # the mean is the sum of P(damage >= x) for x >= 1
+    expected = np.sum(exact[18][1].damage_cdf[1:])
+    for engine in ['loop', 'batch', 'allocate']:
+        _, result = range_sweep(attacker=attacker, defender=defender, distances=[18], count=10000, pvalue=5/6.0, engine=engine, rng=1234)[0]
+        print(f"actual, expected: {np.sum(result.damage_cdf[1:]):0.4f}, {expected:0.4f}  (18in, {engine})")
+
+def run_matrix_test():
+    ''' a matrix must give the same answers as analysing each cell on its own '''
+    armour = DStat(T=5, Sv=4, W=6)
+    gun = AStat(A=2, BS_WS=3, S=4, AP=0, D=1, Range=24)
+    rifle = AStat(A=2, BS_WS=4, S=6, AP=-1, D=Dice(sides=3), Range=24)
+    attackers = {'one gun': Model(gun, armour, pts=10, position=0), 'three guns': Model([gun, gun, gun], armour, pts=30, position=0), 'mixed': Model([gun, rifle], armour, pts=20, position=0)}
+    defenders = {'armour': Model(gun, armour, pts=10, position=2), 'tough': Model(gun, DStat(T=8, Sv=2, W=12), pts=50, position=2)}
+    matrix = analysis_matrix(attackers=attackers, defenders=defenders, count=1000, pvalue=5/6.0, engine='exact')
+    for (a, d), result in matrix.items():
+        alone = perform_full_analysis(attacker=attackers[a], defender=defenders[d], count=1000, pvalue=5/6.0, description="alone", engine='exact')
+        print(f"same as on its own: {np.allclose(result.damage_cdf, alone.damage_cdf)}  ({a} vs {d}, exact)")
+    matrix = analysis_matrix(attackers=attackers, defenders=defenders, count=10000, pvalue=5/6.0, engine='batch', rng=1234, keep_samples=True)
+    three = matrix[('three guns', 'armour')].damage_sequence
+    print(f"copies of a weapon get their own trials: {np.any(three % 3 != 0)}")
+    print(f"actual, expected: {np.mean(three):0.4f}, {3 * np.sum(matrix[('one gun', 'armour')].damage_cdf[1:]):0.4f}  (three guns vs armour, batch)")
+
+def run_unit_test():
+    ''' a unit built up a modifier, and a model, at a time must match one built in one go '''
+    gun = AStat(A=2, BS_WS=3, S=4, AP=0, D=1, Range=24)
+    models = [Model(gun, DStat(T=4, Sv=3, W=wounds), pts=10 + wounds) for wounds in [2, 1, 2, 3, 1, 3]]
+    mods = [StandardModifiers[k] for k in ["LethalHits", "PlusOneToHit", "AP_PlusOne", "RerollWoundsOne"]]
+    unit = Unit(models[:1])
+    for mdl in models[1:]:
+        unit = unit + mdl
+    for mod in mods:
+        unit = unit * mod
+    unit = unit + models[0]
+    everything = models + models[:1]
+    expected = []
+    for mdl in everything:
+        for mod in mods:
+            mdl = mdl * mod
+        expected.append(mdl)
+    values, counts = np.unique([mdl.defence.wounds for mdl in everything], return_counts=True)
+    print(f"same models as applying every modifier in turn: {all(a is b for a, b in zip(unit.models, expected)) and len(unit.models) == len(expected)}")
+    print(f"aggregates: unit wounds {unit.unit_wounds == sum(mdl.defence.wounds for mdl in everything)}, majority wounds {unit.wounds == values[np.argmax(counts)]}, points {unit.points == sum(mdl.points for mdl in everything)}")
+
+def run_test(engine='loop'):
     # run system tests
     ATTACKS = 1
     SKILL = 4
@@ -975,18 +2063,42 @@ def run_test():
 
     shooting_dis = abs(ATT_POS_INCHES - test_def.pos)
     TEST_COUNT=10000
-    print(f"Context: Attacks=Damage=1 (unless noted otherwise), Hit=0.5, Wound=0.333, Save=0.5, WpnRange={WPN_RANGE_INCHES}, Range={shooting_dis}, MonteCarlo Count={TEST_COUNT}")
+    print(f"Context: Attacks=Damage=1 (unless noted otherwise), Hit=0.5, Wound=0.333, Save=0.5, WpnRange={WPN_RANGE_INCHES}, Range={shooting_dis}, MonteCarlo Count={TEST_COUNT}, Engine={engine}")
     for test_att, expected, details in attackers:
-        done, _ = mean_loop(attacker=test_att, defender=test_def, count=TEST_COUNT)
+        done, _ = mean_loop(attacker=test_att, defender=test_def, count=TEST_COUNT, engine=engine)
         print(f"actual, expected: {done:0.4f}, {expected:0.4f}  ({details})")
 
-    test_def.pos = 400
+    test_def = update_position(test_def, 400)
     shooting_dis = abs(ATT_POS_INCHES - test_def.pos)
     TEST_COUNT=10000
-    print(f"Context: Attacks=Damage=1 (unless noted otherwise), Hit=0.5, Wound=0.333, Save=0.5, WpnRange={WPN_RANGE_INCHES}, Range={shooting_dis}, MonteCarlo Count={TEST_COUNT}")
+    print(f"Context: Attacks=Damage=1 (unless noted otherwise), Hit=0.5, Wound=0.333, Save=0.5, WpnRange={WPN_RANGE_INCHES}, Range={shooting_dis}, MonteCarlo Count={TEST_COUNT}, Engine={engine}")
     for test_att, expected, details in attackers:
-        done, _ = mean_loop(attacker=test_att, defender=test_def, count=TEST_COUNT)
+        done, _ = mean_loop(attacker=test_att, defender=test_def, count=TEST_COUNT, engine=engine)
         print(f"actual, expected: {done:0.4f}, {expected:0.4f}  ({details})")
 
+    test_def = update_position(test_def, DEF_POS_INCHES)
+    if engine != 'exact':
+        test_att, _, details = attackers[-1]
+        first = sample_loop(attacker=test_att, defender=test_def, count=TEST_COUNT // 10, engine=engine, rng=1234)
+        again = sample_loop(attacker=test_att, defender=test_def, count=TEST_COUNT // 10, engine=engine, rng=1234)
+        print(f"same seed, same samples: {np.array_equal(first, again)}  ({details})")
+        streamed = accumulate_loop(attacker=test_att, defender=test_def, count=TEST_COUNT // 10, engine=engine, rng=1234)
+        print(f"streamed cdf matches stats_comp: {np.array_equal(streamed.cdf(), stats_comp(first[:,0])[0])}  ({details})")
+        result = perform_full_analysis(attacker=test_att, defender=test_def, count=TEST_COUNT // 10, pvalue=5/6.0, description=details, engine=engine, rng=1234, width=0.5)
+        print(f"adaptive trials, standard error: {result.trials}, {result.very_likely_damage_error:0.4f}  ({details}, width 0.5)")
+        profiled = perform_full_analysis(attacker=test_att, defender=test_def, count=TEST_COUNT // 10, pvalue=5/6.0, description=details, engine=engine, rng=1234, profile_stages=True)
+        report = profiled.stage_report
+        print(f"profiling changes nothing: {np.array_equal(profiled.damage_cdf, streamed.cdf())}, hit dice {report['stages']['hit']['dice']}, hit rerolls {report['stages']['hit']['rerolls']}  ({details})")
+
 if __name__ == "__main__":
-    run_test()
\ No newline at end of file
+    # the engines import math_hammer, so test through that module rather than __main__, or
+    # they end up with their own copies of Dice, DiceRNG, etc. and isinstance stops working
+    import math_hammer
+    math_hammer.run_postprocessing_test()
+    math_hammer.run_sweep_test()
+    math_hammer.run_matrix_test()
+    math_hammer.run_unit_test()
+    import allocation_engine
+    allocation_engine.run_test()
+    for engine in ENGINES:
+        math_hammer.run_test(engine=engine)
\ No newline at end of file
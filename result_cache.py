@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import os
+import json
+import pickle
+import tempfile
+import hashlib
+import numpy as np
+
+from math_hammer import Dice, AStat, DStat, Model, Unit, AnalysisResult, ENGINE_VERSION, update_position
+
+'''
+On-disk cache of AnalysisResults.
+
+An analysis is keyed by a fingerprint of everything that goes into it: the characteristics of the attacker and the
+defender, the modifiers on them, where the models are standing, the engine (and ENGINE_VERSION), count, pvalue and seed.
+Two analyses with the same key produce the same numbers, so the second can be read back instead of re-simulated.  An
+analysis without a seed gets fresh dice every time, so it's never cached, unless it's run by the exact engine.
+
+Only the computed fields of an AnalysisResult are stored, the attacker and defender are whatever the caller passed in.
+The cache is bounded in size, the least recently used entries are evicted first.
+'''
+
+# where the cache lives, unless MATH_HAMMER_CACHE says otherwise
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'math-hammer')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# AnalysisResult fields that aren't stored
+NOT_STORED = ['attacker', 'defender', 'desc', 'damage_sequence', 'sample_store', 'stage_report']
+
+class Uncacheable(Exception):
+    pass
+
+def fingerprint(item):
+    ''' a canonical, json-able description of 'item' '''
+    if isinstance(item, Dice):
+        return {'Dice': [fingerprint(item.sides), item.fixed_value, item.bias, item.roll_count]}
+    if isinstance(item, (AStat, DStat)):
+        fields = {k: fingerprint(v) for k, v in vars(item).items() if k not in ['modifiers', 'modifiers_ids', 'description'] and not k.startswith('_')}
+        return {type(item).__name__: fields, 'modifiers': fingerprint_modifiers(item), 'modifiers_ids': item.modifiers_ids}
+    if isinstance(item, Model):
+        return {'Model': {'weapons': fingerprint(item.weapons), 'defence': fingerprint(item.defence), 'points': fingerprint(item.points), 'pos': fingerprint(item.pos)}}
+    if isinstance(item, Unit):
+        return {'Unit': {'models': fingerprint(item.models), 'points': fingerprint(item.points)}}
+    if isinstance(item, (list, tuple)):
+        return [fingerprint(x) for x in item]
+    if isinstance(item, (np.integer, np.floating)):
+        return item.item()
+    if item is None or isinstance(item, (int, float, str)):
+        return item
+    raise Uncacheable(f"cannot fingerprint {type(item)}")
+
+def fingerprint_modifiers(stat):
+    ''' the modifiers, by their declarative description, see ModifierOp '''
+    result = {}
+    for seq, functors in stat.modifiers.items():
+        if any(getattr(func, 'op', None) is None for func in functors):
+            raise Uncacheable(f"a modifier in '{seq}' has no declarative description")
+        result[seq] = [str(func.op) for func in functors]
+    return result
+
+class ResultCache():
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or os.environ.get('MATH_HAMMER_CACHE', DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+
+    def analysis_key(self, attacker, defender, count, pvalue, engine, rng=None, width=None, budget=None, keep_samples=False):
+        '''
+            The key for perform_full_analysis with these arguments, None if it can't be cached: time budgets and samples
+            aren't repeatable, without a seed the dice are fresh every run, and a seed has to be an int for us to know
+            it's the same one.  The exact engine works the distributions out rather than rolling for them, so an exact
+            analysis is cached with or without a seed (the odd pairing it has to sample is read back like a seeded one).
+        '''
+        if budget is not None or keep_samples:
+            return None
+        if not (isinstance(rng, (int, np.integer)) or (rng is None and engine == 'exact')):
+            return None
+        try:
+            description = {
+                'version': ENGINE_VERSION,
+                'engine': engine,
+                'attacker': fingerprint(attacker),
+                'defender': fingerprint(defender),
+                'count': fingerprint(count),
+                'pvalue': fingerprint(pvalue),
+                'seed': fingerprint(rng),
+                'width': fingerprint(width),
+            }
+        except Uncacheable as e:
+            return None
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def load_analysis(self, key, attacker, defender, description):
+        ''' the cached AnalysisResult for 'key', None if there isn't one '''
+        if key is None:
+            return None
+        try:
+            with open(self.path(key), 'rb') as f:
+                payload = pickle.load(f)
+        except Exception as e:
+            return None
+        try:
+            os.utime(self.path(key)) # most recently used
+        except FileNotFoundError as e:
+            pass # evicted since we read it, the result is still good
+        result = AnalysisResult.__new__(AnalysisResult)
+        result.__dict__.update(payload)
+        result.attacker = attacker
+        result.defender = defender
+        result.desc = description
+        result.damage_sequence = None
+        result.sample_store = None
+        result.stage_report = None
+        return result
+
+    def store_analysis(self, key, result):
+        if key is None:
+            return
+        payload = {k: v for k, v in vars(result).items() if k not in NOT_STORED}
+        os.makedirs(self.directory, exist_ok=True)
+        # a scratch file of our own, other threads and processes may be storing the same key
+        handle, scratch = tempfile.mkstemp(dir=self.directory, prefix=key, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(scratch, self.path(key))
+        self.evict()
+
+    def evict(self):
+        ''' drop the least recently used entries until we're under max_bytes '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError as e:
+                    continue # evicted by someone else since the listdir
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError as e:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if name.endswith('.pkl'):
+                os.remove(os.path.join(self.directory, name))
+
+# ==============================================================================================================
+# ==============================================================================================================
+def run_tests():
+    import tempfile
+    from math_hammer import StandardModifiers, perform_full_analysis
+
+    armour = DStat(T=4, Sv=3, W=2)
+    gun = AStat(A=2, BS_WS=3, S=4, AP=-1, D=Dice(sides=3), Range=24)
+    defender = Model(weapons=gun, defence=armour, pts=100, position=2)
+    attacker = Model(weapons=gun, defence=armour, pts=100, position=0) * StandardModifiers["LethalHits"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory=directory)
+        key = cache.analysis_key(attacker, defender, count=2000, pvalue=5/6.0, engine='batch', rng=7)
+        cold = perform_full_analysis(attacker=attacker, defender=defender, count=2000, pvalue=5/6.0, description="cold", engine='batch', rng=7, cache=cache)
+        warm = perform_full_analysis(attacker=attacker, defender=defender, count=2000, pvalue=5/6.0, description="warm", engine='batch', rng=7, cache=cache)
+        same = all(np.array_equal(getattr(cold, k), getattr(warm, k)) for k in vars(cold) if k not in NOT_STORED)
+        print(f"warm result same as cold: {same}")
+        print(f"different seed, different key: {key != cache.analysis_key(attacker, defender, count=2000, pvalue=5/6.0, engine='batch', rng=8)}")
+        print(f"different modifiers, different key: {key != cache.analysis_key(attacker * StandardModifiers['PlusOneToHit'], defender, count=2000, pvalue=5/6.0, engine='batch', rng=7)}")
+        print(f"different position, different key: {key != cache.analysis_key(attacker, update_position(defender, 3), count=2000, pvalue=5/6.0, engine='batch', rng=7)}")
+        print(f"time budgets aren't cached: {cache.analysis_key(attacker, defender, count=2000, pvalue=5/6.0, engine='batch', rng=7, budget=1.0) is None}")
+        print(f"unseeded runs aren't cached: {cache.analysis_key(attacker, defender, count=2000, pvalue=5/6.0, engine='batch') is None}")
+        print(f"unless they're exact: {cache.analysis_key(attacker, defender, count=2000, pvalue=5/6.0, engine='exact') is not None}")
+        cache.max_bytes = 0
+        cache.evict()
+        print(f"evicted down to max_bytes: {cache.load_analysis(key, attacker, defender, 'gone') is None}")
+
+if __name__ == "__main__":
+    run_tests()
+else:
+    pass
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import os
+import struct
+import numpy as np
+
+'''
+Per-trial samples, on disk.
+
+A sample store is a flat file of int16 rows after a short header, one row per trial: damage used, damage wasted (and
+models removed, for the 'allocate' engine).  Trials are appended a chunk at a time as they're sampled, and read back
+through a numpy memmap, so only the pages being looked at are ever in memory.  100M trials of damage used and damage
+wasted is 400MB of disk, rather than the 1.6GB of float samples keep_samples would hold on to.
+
+    result = perform_full_analysis(..., sample_store='run.samples')
+    ...
+    result = open_analysis('run.samples', attacker, defender, pvalue, description)  # later, without re-simulating
+
+The store doesn't know what was simulated, only the samples, so open_analysis needs the attacker and defender again.
+'''
+
+MAGIC = b'MHSS'
+FORMAT_VERSION = 1
+# magic, version, columns, and a spare word, as little endian uint32s after the magic
+HEADER = struct.Struct('<4sIII')
+DTYPE = np.dtype('<i2')
+# the post-processing reads the samples this many trials at a time
+READ_CHUNK = 1 << 20
+
+class SampleStore():
+    def __init__(self, path, columns=None, writable=False):
+        '''
+            Use create_store or open_store rather than this.  'columns' is None until the first chunk is appended.
+        '''
+        self.path = path
+        self.columns = columns
+        self.writable = writable
+        self.handle = None
+        self.mapped = None
+
+    def __len__(self):
+        if self.columns is None:
+            return 0
+        return (os.path.getsize(self.path) - HEADER.size) // (self.columns * DTYPE.itemsize)
+
+    def append(self, acc):
+        ''' acc is a (N,2) (or (N,3)) array of trials, as from sample_chunks.  Damage has to fit an int16. '''
+        if not self.writable:
+            raise ValueError(f"sample store '{self.path}' was opened read only")
+        acc = np.asarray(acc)
+        if self.columns is None:
+            self.columns = acc.shape[1]
+            self.handle = open(self.path, 'wb')
+            self.handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.columns, 0))
+        if acc.shape[1] != self.columns:
+            raise ValueError(f"sample store '{self.path}' has {self.columns} columns, not {acc.shape[1]}")
+        if len(acc) > 0 and (np.min(acc) < 0 or np.max(acc) > np.iinfo(DTYPE).max):
+            raise ValueError(f"samples out of range for the int16 sample store, {np.min(acc)} to {np.max(acc)}")
+        self.handle.write(acc.astype(DTYPE).tobytes())
+        self.mapped = None
+
+    def close(self):
+        ''' stop appending, the samples can still be read '''
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+        self.writable = False
+
+    def samples(self):
+        ''' the (trials,columns) int16 memmap of every trial appended so far '''
+        if self.handle is not None:
+            self.handle.flush()
+        if self.mapped is None:
+            trials = len(self)
+            if trials == 0:
+                self.mapped = np.zeros((0, self.columns or 2), dtype=DTYPE)
+            else:
+                self.mapped = np.memmap(self.path, dtype=DTYPE, mode='r', offset=HEADER.size, shape=(trials, self.columns))
+        return self.mapped
+
+    def column(self, col):
+        ''' col 0 is damage used, col 1 is damage wasted, col 2 is models removed.  Still a memmap, nothing is read. '''
+        return self.samples()[:,col]
+
+    def chunks(self, size=READ_CHUNK):
+        ''' the samples, 'size' trials at a time, each read into memory as a float array like sample_chunks yields '''
+        samples = self.samples()
+        for start in range(0, len(samples), size):
+            yield np.asarray(samples[start:start+size], dtype=float)
+
+def create_store(path):
+    ''' a new, empty store at 'path', replacing any store already there '''
+    if os.path.exists(path):
+        os.remove(path)
+    return SampleStore(path, writable=True)
+
+def open_store(path):
+    ''' the store at 'path', read only '''
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"'{path}' is not a sample store")
+    magic, version, columns, _ = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a sample store")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"sample store version {version} is newer than this reader ({FORMAT_VERSION})")
+    return SampleStore(path, columns=columns)
+
+def open_analysis(path, attacker, defender, pvalue, description):
+    '''
+        The AnalysisResult for the samples stored at 'path', re-derived from the samples rather than re-simulated.
+        'attacker' and 'defender' should be what they were sampled from, the store only has the damage.
+    '''
+    from math_hammer import store_accumulator, accumulator_analysis
+    accumulator = store_accumulator(open_store(path))
+    return accumulator_analysis(attacker, defender, accumulator, pvalue, description)
+
+# ==============================================================================================================
+# ==============================================================================================================
+def run_tests():
+    import tempfile
+    from math_hammer import AStat, DStat, Model, Unit, Dice, perform_full_analysis, fold_to_models_removed_stats
+
+    armour = DStat(T=4, Sv=3, W=2)
+    gun = AStat(A=3, BS_WS=3, S=5, AP=-1, D=Dice(sides=3), Range=24)
+    attacker = Model(weapons=gun, defence=armour, pts=100, position=0)
+    defender = Unit([Model(weapons=gun, defence=armour, pts=20, position=2) for _ in range(0, 5)])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'run.samples')
+        kept = perform_full_analysis(attacker=attacker, defender=defender, count=30000, pvalue=5/6.0, description="kept", engine='batch', rng=7, keep_samples=True)
+        stored = perform_full_analysis(attacker=attacker, defender=defender, count=30000, pvalue=5/6.0, description="stored", engine='batch', rng=7, sample_store=path)
+        print(f"damage sequence is a memmap: {isinstance(stored.damage_sequence, np.memmap)}")
+        print(f"stored samples same as kept: {np.array_equal(stored.damage_sequence, kept.damage_sequence)}")
+        print(f"int16, 2 bytes a column: {os.path.getsize(path) == HEADER.size + 30000 * 2 * DTYPE.itemsize}")
+        fields = ['damage_cdf', 'waste_data', 'cdf_rounds_taken', 'cdf_models_removed', 'very_likely_damage_output', 'very_likely_number_of_rounds_taken', 'trials']
+        print(f"stored analysis same as kept: {all(np.array_equal(getattr(kept, k), getattr(stored, k)) for k in fields)}")
+        chunked = fold_to_models_removed_stats(stored.damage_sequence, defender, chunk=997)
+        print(f"folding a chunk at a time same as all at once: {all(np.array_equal(a, b) for a, b in zip(chunked, (kept.cdf_rounds_taken, kept.cdf_models_removed)))}")
+        reopened = open_analysis(path, attacker, defender, 5/6.0, "reopened")
+        print(f"reopened without re-simulating: {all(np.array_equal(getattr(kept, k), getattr(reopened, k)) for k in fields)}")
+        try:
+            open_store(path).append(np.zeros((1,2)))
+            print("reopened store is read only: False")
+        except ValueError as e:
+            print("reopened store is read only: True")
+        try:
+            create_store(os.path.join(directory, 'big.samples')).append(np.asarray([[40000.0, 0.0]]))
+            print("damage past int16 rejected: False")
+        except ValueError as e:
+            print("damage past int16 rejected: True")
+
+if __name__ == "__main__":
+    run_tests()
+else:
+    pass
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import hashlib
+
+from math_hammer import perform_full_analysis
+from analysis_service import parse_job, build_matchup
+import asset_registry
+
+'''
+Batch runs of many matchups, streamed to a JSON lines file as they finish.
+
+A scenario file is a list of jobs, as analysis_service.py takes them, or an object with 'defaults' for every scenario
+and the list of 'scenarios':
+
+    {
+        "defaults": {"engine": "batch", "count": 10000, "seed": 1},
+        "scenarios": [
+            {"attacker": "sword_brethern", "defender": "guardsmen"},
+            {"attacker": "sword_brethern", "defender": "guardsmen", "attacker_modifiers": ["LethalHits"], "distance": 6},
+            {"attacker": "chimera", "defender": "redemptor_dread", "pvalue": 0.5, "desc": "chimera at a dread"}
+        ]
+    }
+
+Each finished scenario is one line of the output: its key, status, the job it ran, the AnalysisResult summary (see
+AnalysisResult.summary), or the error, and when it started and how long it took.  The key is a hash of the job with
+its defaults filled in, a batch run again with the same output file skips every scenario already in it, so an
+interrupted batch picks up where it left off.  Scenarios that failed are skipped too, unless retry_failed is set.
+Run batch-math-hammer.py to run a scenario file.
+'''
+
+def scenario_key(job):
+    ''' the key a parsed job is known by in the output, the same job always has the same key '''
+    return hashlib.sha256(json.dumps(job, sort_keys=True).encode()).hexdigest()[:16]
+
+def load_scenarios(path):
+    ''' the parsed jobs in the scenario file 'path', as (key, job), raises ValueError on the first bad scenario '''
+    with open(path) as f:
+        doc = json.load(f)
+    if isinstance(doc, list):
+        doc = {'scenarios': doc}
+    defaults = doc.get('defaults', {})
+    scenarios = []
+    for ii, scenario in enumerate(doc['scenarios']):
+        try:
+            job = parse_job(dict(defaults, **scenario))
+        except ValueError as e:
+            raise ValueError(f"scenario {ii} in '{path}': {e}")
+        scenarios.append((scenario_key(job), job))
+    return scenarios
+
+def finished_scenarios(output, retry_failed=False):
+    '''
+        The keys of the scenarios already in 'output'.  A line cut short by an interrupted run isn't counted, that
+        scenario runs again.
+    '''
+    keys = set()
+    if not os.path.exists(output):
+        return keys
+    with open(output) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                continue
+            if record.get('status') == 'done' or (record.get('status') == 'failed' and not retry_failed):
+                keys.add(record['scenario'])
+    return keys
+
+def run_scenario(key, job, cache=None):
+    ''' one output line, for the parsed 'job'.  Errors are reported in the line rather than raised. '''
+    record = {'scenario': key, 'status': 'done', 'job': job, 'result': None, 'error': None, 'started': time.time()}
+    start = time.perf_counter()
+    try:
+        attacker, defender = build_matchup(job)
+        result = perform_full_analysis(attacker=attacker, defender=defender, count=job['count'], pvalue=job['pvalue'], description=job['desc'], engine=job['engine'], rng=job['seed'], workers=job['workers'], width=job['width'], budget=job['budget'], cache=cache)
+        record['result'] = result.summary()
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['elapsed'] = time.perf_counter() - start
+    return record
+
+# the cache a worker process runs its scenarios with, set once per worker by init_worker
+WORKER_CACHE = None
+
+def init_worker(cache_directory, snapshot_directory):
+    ''' ProcessPoolExecutor initializer, the caches are set up again in each worker '''
+    global WORKER_CACHE
+    if cache_directory is not None:
+        from result_cache import ResultCache
+        WORKER_CACHE = ResultCache(directory=cache_directory)
+    if snapshot_directory is not None:
+        asset_registry.enable_snapshots(snapshot_directory)
+
+def run_worker_scenario(scenario):
+    key, job = scenario
+    return run_scenario(key, job, cache=WORKER_CACHE)
+
+def run_batch(scenarios, output, jobs=1, cache=None, retry_failed=False):
+    '''
+        Run the (key, job) 'scenarios' not already in 'output' (see finished_scenarios), 'jobs' at a time in that many
+        processes, appending a line to 'output' for each as it finishes.  Yields the lines' records as they're written.
+        'cache' is a ResultCache, the workers each open the same directory.
+    '''
+    done = finished_scenarios(output, retry_failed=retry_failed)
+    todo, seen = [], set(done)
+    for key, job in scenarios:
+        if key not in seen:
+            seen.add(key)
+            todo.append((key, job))
+    # an interrupted run can leave half a line, start on a fresh one
+    if os.path.exists(output) and os.path.getsize(output) > 0:
+        with open(output, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            partial = f.read(1) != b'\n'
+    else:
+        partial = False
+    with open(output, 'a') as f:
+        if partial:
+            f.write('\n')
+        for record in run_scenarios(todo, jobs=jobs, cache=cache):
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            yield record
+
+def run_scenarios(scenarios, jobs=1, cache=None):
+    ''' the records for (key, job) 'scenarios', in the order they finish '''
+    if jobs <= 1 or len(scenarios) <= 1:
+        for key, job in scenarios:
+            yield run_scenario(key, job, cache=cache)
+        return
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    initargs = (None if cache is None else cache.directory, asset_registry.SNAPSHOT_DIR)
+    with ProcessPoolExecutor(max_workers=min(jobs, len(scenarios)), initializer=init_worker, initargs=initargs) as pool:
+        futures = [pool.submit(run_worker_scenario, scenario) for scenario in scenarios]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+# ==============================================================================================================
+# ==============================================================================================================
+def run_tests():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'scenarios.json')
+        output = os.path.join(directory, 'results.jsonl')
+        with open(path, 'w') as f:
+            json.dump({
+                'defaults': {'engine': 'batch', 'count': 2000, 'seed': 3},
+                'scenarios': [
+                    {'attacker': 'sword_brethern', 'defender': 'guardsmen'},
+                    {'attacker': 'sword_brethern', 'defender': 'guardsmen', 'attacker_modifiers': ['LethalHits']},
+                    {'attacker': 'chimera', 'defender': 'redemptor_dread', 'distance': 12, 'pvalue': 0.5},
+                    {'attacker': 'chimera', 'defender': 'black_templars.guardsmen'},
+                ],
+            }, f)
+        scenarios = load_scenarios(path)
+        print(f"defaults applied: {all(job['count'] == 2000 and job['engine'] == 'batch' for _, job in scenarios)}")
+        print(f"different scenarios, different keys: {len(set(key for key, _ in scenarios)) == 4}")
+
+        records = list(run_batch(scenarios, output, jobs=2))
+        with open(output) as f:
+            lines = [json.loads(line) for line in f]
+        print(f"one line per scenario: {len(lines) == 4 and [r['scenario'] for r in records] == [r['scenario'] for r in lines]}")
+        failed = [r for r in lines if r['status'] == 'failed']
+        print(f"bad asset reported, not raised: {len(failed) == 1 and 'guardsmen' in failed[0]['error']}")
+        key, job = scenarios[1]
+        attacker, defender = build_matchup(job)
+        direct = perform_full_analysis(attacker=attacker, defender=defender, count=2000, pvalue=job['pvalue'], description=job['desc'], engine='batch', rng=3).summary()
+        print(f"summary same as perform_full_analysis: {[r['result'] for r in lines if r['scenario'] == key] == [direct]}")
+        print(f"timed: {all(r['elapsed'] > 0 for r in lines)}")
+
+        # interrupted half way through writing the third line
+        with open(output) as f:
+            kept = f.readlines()[:2]
+        with open(output, 'w') as f:
+            f.writelines(kept)
+            f.write(kept[0][:20])
+        resumed = list(run_batch(scenarios, output, jobs=1))
+        print(f"resumed, only what's missing is run: {len(resumed) == 2 and len(finished_scenarios(output, retry_failed=True)) == 3}")
+        print(f"nothing left to run: {list(run_batch(scenarios, output)) == []}")
+        print(f"failed scenarios run again when asked: {[r['status'] for r in run_batch(scenarios, output, retry_failed=True)] == ['failed']}")
+
+if __name__ == "__main__":
+    run_tests()
+else:
+    pass
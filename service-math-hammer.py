@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import argparse
+
+from analysis_service import AnalysisService, make_server, DEFAULT_HOST, DEFAULT_PORT, DEFAULT_WORKERS, DEFAULT_MAX_PENDING, DEFAULT_JOB_TTL, DEFAULT_MAX_FINISHED
+from result_cache import ResultCache
+import asset_registry
+
+if __name__ == "__main__":
+    par = argparse.ArgumentParser(description='Warhammer 40k 10th Ed. Math Hammer, as a local HTTP service.  See analysis_service.py for the API.')
+    par.add_argument('--host', type=str, help=f'Address to listen on.  Default is {DEFAULT_HOST}, this machine only.', default=DEFAULT_HOST)
+    par.add_argument('--port', type=int, help=f'Port to listen on, 0 for any free port.  Default is {DEFAULT_PORT}.', default=DEFAULT_PORT)
+    par.add_argument('--workers', type=int, help=f'Number of jobs to run at once.  Default is {DEFAULT_WORKERS}.', default=DEFAULT_WORKERS)
+    par.add_argument('--max-pending', type=int, help=f'Refuse new jobs once this many are queued or running.  Default is {DEFAULT_MAX_PENDING}.', default=DEFAULT_MAX_PENDING)
+    par.add_argument('--job-ttl', type=float, help=f'Forget finished jobs, and their results, this many seconds after they finish.  Default is {DEFAULT_JOB_TTL}.', default=DEFAULT_JOB_TTL)
+    par.add_argument('--max-finished', type=int, help=f'Keep at most this many finished jobs, forgetting the oldest first.  Default is {DEFAULT_MAX_FINISHED}.', default=DEFAULT_MAX_FINISHED)
+    par.add_argument('--no-cache', action='store_true', help='Re-run every analysis, and rebuild the faction assets, rather than reading back results and assets cached by an earlier run.')
+    par.add_argument('--preload', action='store_true', help='Build every faction asset before serving, rather than on the first job that asks for it.')
+    par.add_argument('--verbose', action='store_true', help='Log every request.')
+
+    args = par.parse_args()
+
+    if not args.no_cache:
+        asset_registry.enable_snapshots()
+    service = AnalysisService(workers=args.workers, cache=None if args.no_cache else ResultCache(), max_pending=args.max_pending, job_ttl=args.job_ttl, max_finished=args.max_finished)
+    if args.preload:
+        service.preload()
+    server = make_server(service, host=args.host, port=args.port, verbose=args.verbose)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}/ ...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt as e:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
-from math_hammer import perform_full_analysis, update_position#, json_loads, json_dumps
+from math_hammer import perform_full_analysis, update_position
+from serialization import dumps, loads, dumps_binary
 import dill as pickle
 
 from black_templars import the_emperors_champion_sweep, sword_brethern
@@ -44,17 +45,26 @@ print("after")
 run_test(pickle.loads(champ_bytes), pickle.loads(dread_bytes))
 
 
-# print("===================================")
-# print("  JSON TEST ")
-# print("===================================")
-# # here we serialize to json and back
-# champ_json = json_dumps(the_emperors_champion_sweep)
-# dread_json = json_dumps(sword_brethern)
+print("===================================")
+print("  JSON TEST ")
+print("===================================")
+# here we serialize to json and back
+champ_json = dumps({'champion': attacker})
+dread_json = dumps({'sword_brethern': defender})
 
-# print("should be human-readable. ish.")
-# print(champ_json)
-# print(dread_json)
+print("should be human-readable. ish.")
+print(champ_json)
+print(dread_json)
 
-# print("after")
-# run_test(json_loads(champ_json), json_loads(dread_json))
+print("after")
+run_test(loads(champ_json)['champion'], loads(dread_json)['sword_brethern'])
 
+print("===================================")
+print("  BINARY TEST ")
+print("===================================")
+champ_bytes = dumps_binary({'champion': attacker})
+dread_bytes = dumps_binary({'sword_brethern': defender})
+print(f"{len(champ_bytes)} and {len(dread_bytes)} bytes")
+
+print("after")
+run_test(loads(champ_bytes)['champion'], loads(dread_bytes)['sword_brethern'])